@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+离线基准测试 - 使用模拟LLM（LLM_BACKEND=fake）运行完整工作流，无需 API Key 和网络
+
+测量调度与编排开销、并发吞吐和内存占用:
+    python benchmark_offline.py --workflows 20 --concurrency 4 --mode batch
+    python benchmark_offline.py --workflows 50 --concurrency 20 --mode async --latency 0.5
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+import resource
+from datetime import datetime
+from pathlib import Path
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='CrewAI-ContentStudio 离线基准测试')
+    parser.add_argument('--workflows', type=int, default=10, help='工作流数量')
+    parser.add_argument('--concurrency', type=int, default=4, help='并发工作流数量')
+    parser.add_argument('--mode', choices=['sync', 'batch', 'async'], default='batch',
+                        help='sync: 逐个执行; batch: create_content_batch; async: acreate_content')
+    parser.add_argument('--latency', type=float, default=None, help='模拟LLM首token延迟中位数（秒）')
+    parser.add_argument('--tokens-per-s', type=float, default=None, help='模拟LLM输出速率，0 表示不模拟生成耗时')
+    parser.add_argument('--use-cache', action='store_true', help='启用任务输出缓存（默认关闭以测量完整执行）')
+    return parser.parse_args()
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def main():
+    args = parse_args()
+
+    # 必须在导入项目模块前设置，settings 在导入时读取环境变量
+    os.environ['LLM_BACKEND'] = 'fake'
+    os.environ.setdefault('CREWAI_DISABLE_TELEMETRY', 'true')
+    os.environ.setdefault('OTEL_SDK_DISABLED', 'true')
+    if args.latency is not None:
+        os.environ['FAKE_LLM_LATENCY_S'] = str(args.latency)
+    if args.tokens_per_s is not None:
+        os.environ['FAKE_LLM_TOKENS_PER_S'] = str(args.tokens_per_s)
+    sys.path.insert(0, str(Path(__file__).parent))
+
+    from src.crew.ContentCrew import ContentCrew
+
+    crew = ContentCrew(max_concurrency=args.concurrency)
+    jobs = [{'topic': f"基准测试主题{i}", 'use_cache': args.use_cache} for i in range(args.workflows)]
+
+    print(f"\n⏱️  开始基准测试: {args.workflows} 个工作流, 模式 {args.mode}, 并发 {args.concurrency}")
+    started = time.perf_counter()
+
+    if args.mode == 'sync':
+        results = [crew.create_content(**job) for job in jobs]
+    elif args.mode == 'batch':
+        outcomes = list(crew.create_content_batch(jobs, max_workers=args.concurrency))
+        failed = [outcome for outcome in outcomes if outcome['status'] != 'completed']
+        if failed:
+            print(f"❌ {len(failed)} 个工作流失败: {failed[0]['error']}")
+        results = [outcome['result'] for outcome in outcomes if outcome['status'] == 'completed']
+    else:
+        async def run_all():
+            return await asyncio.gather(*(crew.acreate_content(**job) for job in jobs))
+        results = asyncio.run(run_all())
+
+    elapsed = time.perf_counter() - started
+    if not results:
+        print("❌ 没有成功的工作流")
+        return
+
+    latencies = [
+        (datetime.fromisoformat(r['execution_info']['end_time'])
+         - datetime.fromisoformat(r['execution_info']['start_time'])).total_seconds()
+        for r in results
+    ]
+    stages = [stage for r in results for stage in r['execution_info']['stages'].values()]
+    stage_time = sum(stage['wall_time'] for stage in stages)
+    llm_time = sum(stage['llm_time'] for stage in stages)
+    tool_time = sum(stage['tool_time'] for stage in stages)
+    tokens = sum(r['execution_info']['stage_summary']['total_tokens'] for r in results)
+    summaries = [r['execution_info']['stage_summary'] for r in results]
+    llm_counters = {field: sum(summary[f'llm_{field}'] for summary in summaries)
+                    for field in ('retries', 'timeouts', 'hedges', 'hedge_wins')}
+    # ru_maxrss 在 Linux 上以 KB 为单位
+    peak_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+    print("\n📊 基准测试结果")
+    print("=" * 60)
+    print(f"完成工作流: {len(results)}/{args.workflows}")
+    print(f"总耗时: {elapsed:.2f}s, 吞吐: {len(results) / elapsed:.2f} 工作流/秒")
+    print(f"工作流延迟 p50/p95/max: {percentile(latencies, 0.5):.2f}s / "
+          f"{percentile(latencies, 0.95):.2f}s / {max(latencies):.2f}s")
+    print(f"任务耗时合计 {stage_time:.2f}s，其中 LLM {llm_time:.2f}s、工具 {tool_time:.2f}s，"
+          f"编排开销 {(stage_time - llm_time - tool_time) / len(results):.3f}s/工作流")
+    print(f"token 合计: {tokens}")
+    print(f"LLM重试 {llm_counters['retries']} 次, 超时 {llm_counters['timeouts']} 次, "
+          f"对冲 {llm_counters['hedges']} 次（先返回 {llm_counters['hedge_wins']} 次）")
+    print(f"峰值内存: {peak_rss_mb:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -19,6 +19,8 @@ if env_path.exists():
     load_dotenv(env_path)
 
 from crewai import Agent
+from src.config import settings
+from src.llm.factory import create_llm
 
 class AnalystAgent:
     """分析师智能体 - 专门负责研究数据分析和内容策略制定"""
@@ -30,6 +32,10 @@ class AnalystAgent:
 
     def _check_environment(self):
         """检查环境变量配置"""
+        if settings.FAKE_LLM:
+            print("🧪 使用离线模拟LLM，跳过 API Key 检查")
+            return
+
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("❌ 未找到 OPENAI_API_KEY，请检查 .env 文件配置")
@@ -66,6 +72,7 @@ class AnalystAgent:
                 role=config['role'],
                 goal=config['goal'],
                 backstory=config['backstory'],
+                llm=create_llm(config.get('llm')),
                 tools=[],  # 暂时不使用外部工具
                 max_iter=config.get('max_iter', 2),
                 max_execution_time=config.get('max_execution_time', 200),
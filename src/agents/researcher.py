@@ -22,7 +22,14 @@ else:
 
 # 现在才导入需要API key的模块
 from crewai import Agent
-from crewai_tools import SerperDevTool, WebsiteSearchTool
+from crewai_tools import SerperDevTool
+from src.config import settings
+from src.llm.factory import create_llm
+from src.llm.fake import FakeSearchTool
+from src.tools.page_fetcher import get_research_prefetcher
+from src.tools.rag_store import SharedWebsiteSearchTool
+from src.tools.search_tools import cached_search_tool
+from src.tools.source_validator import get_source_validator
 
 class ResearcherAgent:
     """研究员智能体 - 专门负责信息收集和验证"""
@@ -34,6 +41,13 @@ class ResearcherAgent:
 
     def _initialize_tools(self):
         """初始化研究工具"""
+        # 离线模式使用模拟搜索工具，不需要 API Key 和网络
+        if settings.FAKE_LLM:
+            self.search_tool = cached_search_tool(FakeSearchTool())
+            self.website_tool = None
+            print("🧪 使用离线模拟搜索工具")
+            return
+
         # 首先检查 OpenAI API Key
         openai_key = os.getenv("OPENAI_API_KEY")
         print(f"🔑 OpenAI API Key 状态: {'已设置' if openai_key else '未设置'}")
@@ -42,20 +56,22 @@ class ResearcherAgent:
             raise ValueError("❌ 未找到 OPENAI_API_KEY，请检查 .env 文件配置")
 
         try:
+            # 网站搜索工具 - 需要 OpenAI API Key，所有研究员共用 RAG_STORE_DIR 下的向量库
+            print("🔧 正在初始化 WebsiteSearchTool...")
+            self.website_tool = SharedWebsiteSearchTool()
+            self.logger.info("✅ WebsiteSearchTool 初始化成功")
+
             # 检查是否有SERPER API KEY
             serper_key = os.getenv("SERPER_API_KEY")
             if serper_key:
-                self.search_tool = SerperDevTool()
+                # 搜索结果中的网页在后台预取到向量库
+                on_results = get_research_prefetcher().on_search_results if settings.RESEARCH_PREFETCH_ENABLED else None
+                self.search_tool = cached_search_tool(SerperDevTool(), on_results=on_results)
                 self.logger.info("✅ SerperDevTool 初始化成功")
             else:
                 self.search_tool = None
                 self.logger.warning("⚠️  未找到SERPER_API_KEY，将使用基础搜索功能")
 
-            # 网站搜索工具 - 需要 OpenAI API Key
-            print("🔧 正在初始化 WebsiteSearchTool...")
-            self.website_tool = WebsiteSearchTool()
-            self.logger.info("✅ WebsiteSearchTool 初始化成功")
-
         except Exception as e:
             self.logger.error(f"❌ 工具初始化失败: {str(e)}")
             print(f"💡 调试信息: {str(e)}")
@@ -76,13 +92,15 @@ class ResearcherAgent:
             tools = []
             if self.search_tool:
                 tools.append(self.search_tool)
-            tools.append(self.website_tool)
+            if self.website_tool:
+                tools.append(self.website_tool)
 
             # 创建Agent
             agent = Agent(
                 role=config['role'],
                 goal=config['goal'],
                 backstory=config['backstory'],
+                llm=create_llm(config.get('llm')),
                 tools=tools,
                 max_iter=config.get('max_iter', 3),
                 max_execution_time=config.get('max_execution_time', 300),
@@ -102,73 +120,16 @@ class ResearcherAgent:
         """
         验证信息源的可靠性
 
+        按主机名的域名后缀查找可信域名表（可用 SOURCE_REPUTATION_FILE 补充），
+        非 http(s) 网址被忽略。
+
         Args:
             sources: 信息源URL列表
 
         Returns:
-            List[Dict]: 验证后的源信息
-        """
-        validated_sources = []
-
-        # 可信域名列表
-        trusted_domains = [
-            'gov.cn', 'edu.cn', 'org.cn', 'gov', 'edu', 'org',
-            'ieee.org', 'nature.com', 'science.org',
-            'cnki.net', 'wanfangdata.com.cn',
-            'baidu.com', 'tencent.com', 'alibaba.com'
-        ]
-
-        for source in sources:
-            try:
-                # 基础URL验证
-                if not source.startswith(('http://', 'https://')):
-                    continue
-
-                # 检查是否为可信域名
-                is_trusted = any(domain in source.lower() for domain in trusted_domains)
-
-                source_info = {
-                    'url': source,
-                    'is_trusted': is_trusted,
-                    'domain': self._extract_domain(source),
-                    'validation_score': self._calculate_trust_score(source)
-                }
-
-                validated_sources.append(source_info)
-
-            except Exception as e:
-                self.logger.warning(f"⚠️  源验证失败: {source}, 错误: {str(e)}")
-                continue
-
-        return validated_sources
-
-    def _extract_domain(self, url: str) -> str:
-        """提取域名"""
-        try:
-            from urllib.parse import urlparse
-            return urlparse(url).netloc
-        except:
-            return "unknown"
-
-    def _calculate_trust_score(self, url: str) -> float:
-        """
-        计算信任度评分 (0-1)
+            List[Dict]: 验证后的源信息，包含 url、is_trusted、domain、validation_score
         """
-        score = 0.5  # 基础分数
-
-        # 政府和教育机构加分
-        if any(domain in url.lower() for domain in ['.gov', '.edu', '.org']):
-            score += 0.3
-
-        # 知名媒体和平台加分
-        if any(domain in url.lower() for domain in ['baidu', 'tencent', 'alibaba', 'xinhua', 'people']):
-            score += 0.2
-
-        # HTTPS加分
-        if url.startswith('https://'):
-            score += 0.1
-
-        return min(score, 1.0)
+        return get_source_validator().validate(sources)
 
     def extract_key_information(self, research_text: str) -> Dict[str, Any]:
         """
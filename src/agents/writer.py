@@ -16,6 +16,8 @@ if env_path.exists():
     load_dotenv(env_path)
 
 from crewai import Agent
+from src.config import settings
+from src.llm.factory import create_llm
 
 
 class WriterAgent:
@@ -29,6 +31,10 @@ class WriterAgent:
 
     def _check_environment(self):
         """检查环境变量配置"""
+        if settings.FAKE_LLM:
+            print("🧪 使用离线模拟LLM，跳过 API Key 检查")
+            return
+
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("❌ 未找到 OPENAI_API_KEY，请检查 .env 文件配置")
@@ -100,6 +106,7 @@ class WriterAgent:
                 role=config['role'],
                 goal=config['goal'],
                 backstory=config['backstory'],
+                llm=create_llm(config.get('llm')),
                 tools=[],  # 使用内置写作能力
                 max_iter=config.get('max_iter', 2),
                 max_execution_time=config.get('max_execution_time', 400),
@@ -0,0 +1,201 @@
+"""
+应用设置 - 从环境变量读取运行参数
+"""
+import os
+from pathlib import Path
+from dotenv import load_dotenv
+
+# 找到项目根目录并加载环境变量
+current_dir = Path(__file__).parent
+project_root = current_dir.parent.parent
+env_path = project_root / '.env'
+
+if env_path.exists():
+    load_dotenv(env_path)
+
+
+def _get_int(name: str, default: int) -> int:
+    """读取整数型环境变量，格式错误时回退到默认值"""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _get_float(name: str, default: float) -> float:
+    """读取浮点型环境变量，格式错误时回退到默认值"""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def _get_bool(name: str, default: bool) -> bool:
+    """读取布尔型环境变量"""
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+# 单个事件循环中允许同时运行的工作流数量（acreate_content）
+MAX_CONCURRENT_WORKFLOWS = _get_int("MAX_CONCURRENT_WORKFLOWS", 20)
+
+# create_content_batch 默认的工作线程数量
+BATCH_MAX_WORKERS = _get_int("BATCH_MAX_WORKERS", 4)
+
+# 请求合并：参数相同的并发 create_content 请求只执行一次，共享结果
+SINGLE_FLIGHT_ENABLED = _get_bool("SINGLE_FLIGHT_ENABLED", True)
+# 工作流完成后相同请求仍直接复用结果的时间（秒），0 表示只合并执行中的请求
+SINGLE_FLIGHT_FRESHNESS_S = _get_float("SINGLE_FLIGHT_FRESHNESS_S", 0)
+SINGLE_FLIGHT_MAX_RECENT = _get_int("SINGLE_FLIGHT_MAX_RECENT", 256)
+
+# DAG调度器中同时执行的任务数量
+DAG_MAX_WORKERS = _get_int("DAG_MAX_WORKERS", 8)
+
+# 是否将 research_task 按研究维度拆分为并发子任务
+RESEARCH_FANOUT = _get_bool("RESEARCH_FANOUT", False)
+
+# 本地缓存目录
+CACHE_DIR = Path(os.getenv("CACHE_DIR", project_root / 'data' / 'cache'))
+
+# 任务输出缓存：研究、分析、写作和编辑结果按输入复用
+STAGE_CACHE_ENABLED = _get_bool("STAGE_CACHE_ENABLED", True)
+STAGE_CACHE_TTL = _get_float("STAGE_CACHE_TTL", 24 * 3600)
+STAGE_CACHE_MAX_ENTRIES = _get_int("STAGE_CACHE_MAX_ENTRIES", 2000)
+# 缓存值的总字节数上限，超出时淘汰最久未使用的条目（0 表示不限制）
+STAGE_CACHE_MAX_BYTES = _get_int("STAGE_CACHE_MAX_BYTES", 100 * 1024 * 1024)
+
+# LLM响应缓存：模型、消息、温度和工具完全相同的请求直接复用回复
+LLM_CACHE_ENABLED = _get_bool("LLM_CACHE_ENABLED", True)
+LLM_CACHE_TTL = _get_float("LLM_CACHE_TTL", 7 * 24 * 3600)
+LLM_CACHE_MAX_ENTRIES = _get_int("LLM_CACHE_MAX_ENTRIES", 10000)
+LLM_CACHE_MAX_BYTES = _get_int("LLM_CACHE_MAX_BYTES", 200 * 1024 * 1024)
+# 温度大于0的创作型调用默认不缓存，开启后同样复用
+LLM_CACHE_ALLOW_TEMPERATURE = _get_bool("LLM_CACHE_ALLOW_TEMPERATURE", False)
+
+# 搜索结果缓存：规范化后相同的查询复用结果；过期后 SEARCH_CACHE_STALE_S 秒内仍立即返回旧结果并在后台刷新（0 表示不使用过期结果）
+SEARCH_CACHE_ENABLED = _get_bool("SEARCH_CACHE_ENABLED", True)
+SEARCH_CACHE_TTL = _get_float("SEARCH_CACHE_TTL", 24 * 3600)
+SEARCH_CACHE_STALE_S = _get_float("SEARCH_CACHE_STALE_S", 6 * 24 * 3600)
+SEARCH_CACHE_MAX_ENTRIES = _get_int("SEARCH_CACHE_MAX_ENTRIES", 5000)
+SEARCH_CACHE_MAX_BYTES = _get_int("SEARCH_CACHE_MAX_BYTES", 50 * 1024 * 1024)
+
+# 网页内容向量库（WebsiteSearchTool）：所有研究员共用，块按内容哈希去重；已收录的网址在有效期内不再抓取
+RAG_STORE_DIR = Path(os.getenv("RAG_STORE_DIR", project_root / 'data' / 'rag_store'))
+RAG_SOURCE_TTL = _get_float("RAG_SOURCE_TTL", 7 * 24 * 3600)
+
+# 研究预取：搜索结果返回后并发抓取候选网页（共享连接池，单个域名限制并发，单页限制大小和耗时）并收录到网页内容向量库
+RESEARCH_PREFETCH_ENABLED = _get_bool("RESEARCH_PREFETCH_ENABLED", True)
+PREFETCH_MAX_URLS = _get_int("PREFETCH_MAX_URLS", 20)
+PREFETCH_MAX_WORKERS = _get_int("PREFETCH_MAX_WORKERS", 16)
+PREFETCH_PER_HOST = _get_int("PREFETCH_PER_HOST", 4)
+PREFETCH_TIMEOUT_S = _get_float("PREFETCH_TIMEOUT_S", 10)
+PREFETCH_MAX_BYTES = _get_int("PREFETCH_MAX_BYTES", 2 * 1024 * 1024)
+
+# 信息源验证的域名信誉文件（JSON，域名后缀 -> 信任度），补充或覆盖内置的域名表
+SOURCE_REPUTATION_FILE = os.getenv("SOURCE_REPUTATION_FILE", "")
+
+# LLM调用容错：单次调用超时（0 表示不限制），超时和可重试错误按带抖动的指数退避重试
+LLM_RESILIENCE_ENABLED = _get_bool("LLM_RESILIENCE_ENABLED", True)
+LLM_CALL_TIMEOUT_S = _get_float("LLM_CALL_TIMEOUT_S", 180)
+LLM_MAX_RETRIES = _get_int("LLM_MAX_RETRIES", 2)
+LLM_BACKOFF_BASE_S = _get_float("LLM_BACKOFF_BASE_S", 1)
+LLM_BACKOFF_MAX_S = _get_float("LLM_BACKOFF_MAX_S", 30)
+# 对冲请求：调用耗时超过近期 LLM_HEDGE_WINDOW 次调用耗时的该分位数时，再发送一个相同的请求（会增加token用量）
+LLM_HEDGE_ENABLED = _get_bool("LLM_HEDGE_ENABLED", False)
+LLM_HEDGE_PERCENTILE = _get_float("LLM_HEDGE_PERCENTILE", 0.95)
+LLM_HEDGE_MIN_SAMPLES = _get_int("LLM_HEDGE_MIN_SAMPLES", 20)
+LLM_HEDGE_WINDOW = _get_int("LLM_HEDGE_WINDOW", 200)
+
+# 模型路由：agents.yaml 的 llm 设置中配置了 fallbacks 时，主模型延迟或错误率（指数加权平均）超过阈值后改用备用模型
+LLM_ROUTING_ENABLED = _get_bool("LLM_ROUTING_ENABLED", True)
+LLM_ROUTER_MAX_LATENCY_S = _get_float("LLM_ROUTER_MAX_LATENCY_S", 90)
+LLM_ROUTER_MAX_ERROR_RATE = _get_float("LLM_ROUTER_MAX_ERROR_RATE", 0.5)
+LLM_ROUTER_EWMA_ALPHA = _get_float("LLM_ROUTER_EWMA_ALPHA", 0.3)
+LLM_ROUTER_MIN_SAMPLES = _get_int("LLM_ROUTER_MIN_SAMPLES", 3)
+# 主模型被判定为不健康后，改用备用模型的时间（秒），之后重新尝试主模型
+LLM_ROUTER_COOLDOWN_S = _get_float("LLM_ROUTER_COOLDOWN_S", 120)
+
+# 智能体池：跨工作流复用相同结构的 Agent 和单任务 Crew
+AGENT_POOL_ENABLED = _get_bool("AGENT_POOL_ENABLED", True)
+AGENT_POOL_MAX_IDLE = _get_int("AGENT_POOL_MAX_IDLE", 8)
+
+# 流式输出：create_content_stream 中逐个token推送输出的智能体
+STREAM_AGENTS = tuple(
+    name.strip() for name in os.getenv("STREAM_AGENTS", "writer,editor").split(',') if name.strip()
+)
+
+# 工作流历史：内存中保留最近的记录，全部记录追加写入按大小轮转的 JSONL 日志
+HISTORY_ENABLED = _get_bool("HISTORY_ENABLED", True)
+HISTORY_DIR = Path(os.getenv("HISTORY_DIR", project_root / 'data' / 'history'))
+HISTORY_MAX_ENTRIES = _get_int("HISTORY_MAX_ENTRIES", 1000)
+HISTORY_LOG_MAX_BYTES = _get_int("HISTORY_LOG_MAX_BYTES", 10 * 1024 * 1024)
+HISTORY_LOG_BACKUPS = _get_int("HISTORY_LOG_BACKUPS", 5)
+
+# 工作流检查点：保存已完成任务的输出，resume_workflow 从第一个未完成的任务继续
+CHECKPOINT_ENABLED = _get_bool("CHECKPOINT_ENABLED", True)
+CHECKPOINT_DIR = Path(os.getenv("CHECKPOINT_DIR", project_root / 'data' / 'checkpoints'))
+CHECKPOINT_RETENTION = _get_float("CHECKPOINT_RETENTION", 7 * 24 * 3600)
+
+# 质量门：写作输出的本地质量评分达到阈值时跳过编辑任务（配置了 quality_gate_source 的任务）
+QUALITY_GATE_ENABLED = _get_bool("QUALITY_GATE_ENABLED", False)
+QUALITY_GATE_THRESHOLD = _get_float("QUALITY_GATE_THRESHOLD", 85)
+# 只对这些内容类型启用质量门，为空时对所有类型启用
+QUALITY_GATE_CONTENT_TYPES = tuple(
+    name.strip() for name in os.getenv("QUALITY_GATE_CONTENT_TYPES", "").split(',') if name.strip()
+)
+
+# 上下文预算：每个任务从上游获得的上下文上限（token），超出时本地抽取式压缩
+CONTEXT_BUDGET_ENABLED = _get_bool("CONTEXT_BUDGET_ENABLED", True)
+CONTEXT_BUDGET_TOKENS = _get_int("CONTEXT_BUDGET_TOKENS", 4000)
+
+# 工作流预算：整个工作流的截止时间（秒）和token上限，0 表示不限制，可被 create_content 参数覆盖
+WORKFLOW_DEADLINE_S = _get_float("WORKFLOW_DEADLINE_S", 0)
+WORKFLOW_MAX_TOKENS = _get_int("WORKFLOW_MAX_TOKENS", 0)
+# 分配到的时间或token低于该值时，配置了 budget_fallback 的任务直接跳过
+BUDGET_MIN_STAGE_SECONDS = _get_float("BUDGET_MIN_STAGE_SECONDS", 15)
+BUDGET_MIN_STAGE_TOKENS = _get_int("BUDGET_MIN_STAGE_TOKENS", 1000)
+# 分配到的时间低于智能体 max_execution_time 的该比例时，max_iter 降为1
+BUDGET_REDUCE_DEPTH_RATIO = _get_float("BUDGET_REDUCE_DEPTH_RATIO", 0.5)
+
+# 服务模式：本地HTTP接口 + SQLite任务队列 + 多个常驻 ContentCrew 的工作进程
+SERVICE_HOST = os.getenv("SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = _get_int("SERVICE_PORT", 8765)
+SERVICE_WORKERS = _get_int("SERVICE_WORKERS", 2)
+SERVICE_DIR = Path(os.getenv("SERVICE_DIR", project_root / 'data' / 'service'))
+# 排队中的任务达到该数量时，新提交返回 429
+SERVICE_MAX_QUEUE_DEPTH = _get_int("SERVICE_MAX_QUEUE_DEPTH", 100)
+SERVICE_POLL_INTERVAL = _get_float("SERVICE_POLL_INTERVAL", 0.5)
+# 工作进程异常退出时任务最多执行的次数
+SERVICE_MAX_ATTEMPTS = _get_int("SERVICE_MAX_ATTEMPTS", 2)
+# 工作进程异常退出后重启前的等待时间：从 BASE 开始按连续崩溃次数翻倍，最多 MAX 秒；
+# 进程运行超过 MAX 秒后再退出不算连续崩溃
+SERVICE_RESTART_BACKOFF_BASE_S = _get_float("SERVICE_RESTART_BACKOFF_BASE_S", 1.0)
+SERVICE_RESTART_BACKOFF_MAX_S = _get_float("SERVICE_RESTART_BACKOFF_MAX_S", 60.0)
+# 工作进程连续崩溃达到该次数时 /health 报告 unhealthy（返回 503）
+SERVICE_MAX_CONSECUTIVE_CRASHES = _get_int("SERVICE_MAX_CONSECUTIVE_CRASHES", 5)
+# 已结束任务的保留时间（秒）
+SERVICE_JOB_RETENTION = _get_float("SERVICE_JOB_RETENTION", 7 * 24 * 3600)
+
+# LLM后端：openai（默认）或 fake（离线确定性模拟，用于基准测试和CI，无需API Key和网络）
+LLM_BACKEND = os.getenv("LLM_BACKEND", "openai").strip().lower()
+FAKE_LLM = LLM_BACKEND == 'fake'
+# 模拟LLM：首token延迟服从对数正态分布（中位数和 sigma），输出按 token 速率生成，0 表示不模拟生成耗时
+FAKE_LLM_LATENCY_S = _get_float("FAKE_LLM_LATENCY_S", 0.2)
+FAKE_LLM_LATENCY_SIGMA = _get_float("FAKE_LLM_LATENCY_SIGMA", 0.3)
+FAKE_LLM_TOKENS_PER_S = _get_float("FAKE_LLM_TOKENS_PER_S", 0)
+FAKE_LLM_OUTPUT_TOKENS = _get_int("FAKE_LLM_OUTPUT_TOKENS", 400)
+# 研究员等带工具的智能体在给出最终答案前模拟的工具调用次数
+FAKE_LLM_TOOL_CALLS = _get_int("FAKE_LLM_TOOL_CALLS", 1)
+FAKE_LLM_SEED = _get_int("FAKE_LLM_SEED", 0)
+# 预设回复：JSON 文件，键为任务描述中的关键词，值为最终答案
+FAKE_LLM_RESPONSES_FILE = os.getenv("FAKE_LLM_RESPONSES_FILE", "")
+FAKE_TOOL_LATENCY_S = _get_float("FAKE_TOOL_LATENCY_S", 0.05)
+# 故障注入：调用卡住（FAKE_LLM_STALL_S 秒）和抛出连接错误的概率，用于测试超时、重试和对冲
+FAKE_LLM_STALL_RATE = _get_float("FAKE_LLM_STALL_RATE", 0)
+FAKE_LLM_STALL_S = _get_float("FAKE_LLM_STALL_S", 30)
+FAKE_LLM_ERROR_RATE = _get_float("FAKE_LLM_ERROR_RATE", 0)
+
+# Crew 记忆（需要 OpenAI embedding），离线模式下默认关闭
+CREW_MEMORY = _get_bool("CREW_MEMORY", not FAKE_LLM)
@@ -4,10 +4,18 @@ ContentCrew - 内容创作工作流编排器
 """
 import os
 import sys
+import asyncio
 import logging
+import math
+import time
+import uuid
+import queue
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from pathlib import Path
 from dotenv import load_dotenv
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Iterable, Iterator, Callable
 import yaml
 from datetime import datetime, timezone
 
@@ -24,10 +32,80 @@ agents_dir = current_dir.parent / 'agents'
 sys.path.append(str(agents_dir))
 
 from crewai import Agent, Task, Crew
+from crewai.tasks.task_output import TaskOutput
+from crewai.utilities.events import (
+    LLMStreamChunkEvent,
+    ToolUsageStartedEvent,
+    ToolUsageFinishedEvent,
+    ToolUsageErrorEvent,
+)
 from src.agents.researcher import ResearcherAgent
 from src.agents.analyst import AnalystAgent
 from src.agents.writer import WriterAgent
 from src.agents.editor import EditorAgent
+from src.config import settings
+from src.crew.scheduler import TaskGraph, DagExecutor
+from src.crew.prompt_templates import compile_configs
+from src.crew.agent_pool import AgentPool
+from src.crew.events import event_router
+from src.crew.metrics import StageMetrics, log_stage_metrics, summarize_stages
+from src.crew.history import WorkflowHistory
+from src.crew.checkpoints import CheckpointStore
+from src.crew.context_budget import budget_context
+from src.crew.budget import WorkflowBudget, BudgetExceededError, StageDeadlineError, StageTokenBudgetError
+from src.crew.singleflight import SingleFlight, Flight
+from src.llm.cache import CachingLLM
+from src.llm.wrapper import DelegatingLLM, find_wrappers
+from src.llm.token_limit import TokenLimitLLM
+from src.tools.page_fetcher import research_prefetch_stats
+from src.tools.rag_store import rag_store_stats
+from src.utils.cache_store import SQLiteCache, make_cache_key
+
+
+# create_content 接受的参数，批量任务和服务模式的任务均按此校验
+JOB_PARAMETERS = frozenset({'topic', 'content_type', 'target_audience', 'word_count', 'additional_requirements',
+                            'use_cache', 'refresh_cache', 'deadline_s', 'max_tokens'})
+
+
+# 文本参数（additional_requirements 可以为 null）
+_TEXT_PARAMETERS = ('topic', 'content_type', 'target_audience', 'additional_requirements')
+# 布尔参数
+_FLAG_PARAMETERS = ('use_cache', 'refresh_cache')
+# 数值参数：名称 -> (是否必须为整数, 最小值)，deadline_s 和 max_tokens 可以为 null（使用默认配置）
+_NUMBER_PARAMETERS = {'word_count': (True, 1), 'deadline_s': (False, 0), 'max_tokens': (True, 0)}
+
+
+def normalize_job_parameters(job: Dict[str, Any]) -> Dict[str, Any]:
+    """校验任务参数的名称、类型和取值范围并转换为 create_content 的参数，不合法时抛出 ValueError"""
+    if not isinstance(job, dict) or not job.get('topic'):
+        raise ValueError("任务缺少 topic 参数")
+
+    unknown_keys = set(job) - JOB_PARAMETERS
+    if unknown_keys:
+        raise ValueError(f"任务包含未知参数: {', '.join(sorted(unknown_keys))}")
+
+    for name in _TEXT_PARAMETERS:
+        value = job.get(name)
+        if value is not None and not isinstance(value, str):
+            raise ValueError(f"参数 {name} 必须是字符串")
+        if name != 'additional_requirements' and name in job and not (value or '').strip():
+            raise ValueError(f"参数 {name} 不能为空")
+
+    for name in _FLAG_PARAMETERS:
+        if name in job and not isinstance(job[name], bool):
+            raise ValueError(f"参数 {name} 必须是 true 或 false")
+
+    for name, (integer, minimum) in _NUMBER_PARAMETERS.items():
+        if name not in job or (job[name] is None and name != 'word_count'):
+            continue
+        value = job[name]
+        # bool 是 int 的子类，需要单独排除
+        if isinstance(value, bool) or not isinstance(value, int if integer else (int, float)):
+            raise ValueError(f"参数 {name} 必须是{'整数' if integer else '数字'}")
+        if not math.isfinite(value) or value < minimum:
+            raise ValueError(f"参数 {name} 不能小于 {minimum}")
+
+    return dict(job)
 
 
 class ContentCrew:
@@ -35,22 +113,67 @@ class ContentCrew:
     内容创作Crew - 协调多个智能体协作完成内容创作任务
     """
 
-    def __init__(self):
+    def __init__(self,
+                 max_concurrency: Optional[int] = None,
+                 research_fanout: Optional[bool] = None,
+                 quality_gate_threshold: Optional[float] = None):
+        """
+        Args:
+            max_concurrency: 单个事件循环中 acreate_content 的最大并发工作流数量，
+                默认读取 MAX_CONCURRENT_WORKFLOWS
+            research_fanout: 是否将配置了 fanout 的任务拆分为并发子任务，
+                默认读取 RESEARCH_FANOUT
+            quality_gate_threshold: 初稿本地质量评分达到该值时跳过编辑任务，
+                默认在 QUALITY_GATE_ENABLED 时读取 QUALITY_GATE_THRESHOLD，为 None 表示不启用
+        """
         self.logger = logging.getLogger(__name__)
+        self.research_fanout = settings.RESEARCH_FANOUT if research_fanout is None else research_fanout
+        if quality_gate_threshold is None and settings.QUALITY_GATE_ENABLED:
+            quality_gate_threshold = settings.QUALITY_GATE_THRESHOLD
+        self.quality_gate_threshold = quality_gate_threshold
         self._check_environment()
         self._load_configurations()
         self._initialize_agents()
-        self.workflow_history = []
+        self.workflow_history = WorkflowHistory(
+            settings.HISTORY_DIR / 'workflow_history.jsonl' if settings.HISTORY_ENABLED else None,
+            max_entries=settings.HISTORY_MAX_ENTRIES,
+            max_bytes=settings.HISTORY_LOG_MAX_BYTES,
+            backup_count=settings.HISTORY_LOG_BACKUPS
+        )
+        self.max_concurrency = max_concurrency or settings.MAX_CONCURRENT_WORKFLOWS
+        self.dag_max_workers = settings.DAG_MAX_WORKERS
+        self._initialize_stage_cache()
+        self.checkpoint_store = CheckpointStore(
+            settings.CHECKPOINT_DIR / 'checkpoints.sqlite3', retention=settings.CHECKPOINT_RETENTION
+        ) if settings.CHECKPOINT_ENABLED else None
+        self.agent_pool = AgentPool(
+            self._create_agent, self._new_stage_crew, max_idle_per_key=settings.AGENT_POOL_MAX_IDLE
+        ) if settings.AGENT_POOL_ENABLED else None
+        # 相同参数的并发请求合并为一次执行
+        self.single_flight = SingleFlight(
+            freshness_s=settings.SINGLE_FLIGHT_FRESHNESS_S, max_recent=settings.SINGLE_FLIGHT_MAX_RECENT
+        ) if settings.SINGLE_FLIGHT_ENABLED else None
+        # asyncio.Semaphore 绑定到具体事件循环，按循环分别维护
+        self._async_semaphores = weakref.WeakKeyDictionary()
 
     def _check_environment(self):
         """检查环境配置"""
+        if settings.FAKE_LLM:
+            print("🧪 使用离线模拟LLM（LLM_BACKEND=fake），不访问网络")
+            return
+
         api_key = os.getenv("OPENAI_API_KEY")
         if not api_key:
             raise ValueError("❌ 未找到 OPENAI_API_KEY，请检查 .env 文件配置")
         print("🔑 OpenAI API Key: 已设置")
 
     def _load_configurations(self):
-        """加载配置文件"""
+        """
+        加载配置文件
+
+        配置文件缺失或无法解析时使用默认配置；占位符或任务依赖有误时直接报错，
+        不会用默认配置替换用户编写的配置。
+        """
         try:
             # 加载智能体配置
             agents_config_path = project_root / 'src' / 'config' / 'agents.yaml'
@@ -72,12 +195,68 @@ class ContentCrew:
                 print("⚠️  tasks.yaml 未找到，使用默认配置")
                 self.tasks_config = self._get_default_tasks_config()
 
-        except Exception as e:
+        except (OSError, yaml.YAMLError) as e:
             self.logger.error(f"❌ 配置加载失败: {str(e)}")
             print(f"💡 使用默认配置继续运行")
             self.agents_config = self._get_default_agents_config()
             self.tasks_config = self._get_default_tasks_config()
 
+        # 未知占位符、未定义的依赖和循环依赖抛出 ValueError，构造时即失败
+        self._build_task_graph()
+        self._compile_templates()
+
+    def _compile_templates(self):
+        """预编译智能体和任务配置中的占位符，未知占位符在加载时即报错"""
+        self.agent_templates = compile_configs(self.agents_config, 'agents.yaml')
+        # fanout 块只在展开后的子任务中使用，此处不参与编译
+        self.stage_templates = compile_configs(
+            {name: {k: v for k, v in config.items() if k != 'fanout'}
+             for name, config in self.stage_configs.items()},
+            'tasks.yaml'
+        )
+
+    def _build_task_graph(self):
+        """根据 context 依赖构建任务DAG，启用拆分时展开 fanout 子任务"""
+        self.fanout_groups = {}
+        self.stage_configs = dict(self.tasks_config)
+
+        if self.research_fanout:
+            for task_name, task_config in self.tasks_config.items():
+                if task_config.get('fanout'):
+                    self._expand_fanout(task_name, task_config)
+
+        self.task_graph = TaskGraph.from_tasks_config(self.stage_configs)
+
+        if self.fanout_groups:
+            for task_name, subtasks in self.fanout_groups.items():
+                print(f"🔀 {task_name} 拆分为 {len(subtasks)} 个并发子任务")
+
+    def _expand_fanout(self, task_name: str, task_config: Dict[str, Any]):
+        """
+        将任务拆分为按维度并发执行的子任务
+
+        子任务继承原任务的依赖，原任务变为合并节点，依赖全部子任务，
+        下游任务仍然通过原任务名获取合并后的完整输出。
+        """
+        fanout = task_config['fanout']
+        subtasks = []
+
+        for dimension, focus in fanout['dimensions'].items():
+            subtask_name = f"{task_name}.{dimension}"
+            self.stage_configs[subtask_name] = {
+                'description': fanout['description'].replace('{dimension}', focus),
+                'expected_output': fanout['expected_output'].replace('{dimension}', focus),
+                'agent': task_config['agent'],
+                'context': list(task_config.get('context') or []),
+                'dimension': focus
+            }
+            subtasks.append(subtask_name)
+
+        merge_config = {k: v for k, v in task_config.items() if k != 'fanout'}
+        merge_config['context'] = subtasks
+        self.stage_configs[task_name] = merge_config
+        self.fanout_groups[task_name] = subtasks
+
     def _initialize_agents(self):
         """初始化所有智能体"""
         try:
@@ -89,12 +268,36 @@ class ContentCrew:
             self.writer_agent_instance = WriterAgent()
             self.editor_agent_instance = EditorAgent()
 
+            # agents.yaml 中的智能体名称到实例的映射
+            self.agent_factories = {
+                'researcher': self.researcher_agent_instance,
+                'analyst': self.analyst_agent_instance,
+                'writer': self.writer_agent_instance,
+                'editor': self.editor_agent_instance
+            }
+
             print("✅ 所有智能体实例创建成功")
 
         except Exception as e:
             self.logger.error(f"❌ 智能体初始化失败: {str(e)}")
             raise
 
+    def _initialize_stage_cache(self):
+        """初始化任务输出缓存"""
+        if not settings.STAGE_CACHE_ENABLED:
+            self.stage_cache = None
+            print("⚠️  任务输出缓存已禁用")
+            return
+
+        self.stage_cache = SQLiteCache(
+            settings.CACHE_DIR / 'stage_cache.sqlite3',
+            namespace='stage_outputs',
+            default_ttl=settings.STAGE_CACHE_TTL,
+            max_entries=settings.STAGE_CACHE_MAX_ENTRIES,
+            max_bytes=settings.STAGE_CACHE_MAX_BYTES or None
+        )
+        print(f"✅ 任务输出缓存已启用: {self.stage_cache.path}")
+
     def _get_default_agents_config(self) -> Dict[str, Any]:
         """获取默认智能体配置"""
         return {
@@ -103,6 +306,7 @@ class ContentCrew:
                 'goal': '收集关于{topic}的全面、准确信息',
                 'backstory': '你是一位经验丰富的研究专家',
                 'max_iter': 3,
+                'max_execution_time': 300,
                 'verbose': True
             },
             'analyst': {
@@ -110,6 +314,7 @@ class ContentCrew:
                 'goal': '分析研究数据并制定内容策略',
                 'backstory': '你是一位资深的内容策略专家',
                 'max_iter': 2,
+                'max_execution_time': 200,
                 'verbose': True
             },
             'writer': {
@@ -117,6 +322,7 @@ class ContentCrew:
                 'goal': '创建高质量、有吸引力的{content_type}',
                 'backstory': '你是一位才华横溢的内容创作专家',
                 'max_iter': 2,
+                'max_execution_time': 400,
                 'verbose': True
             },
             'editor': {
@@ -124,6 +330,7 @@ class ContentCrew:
                 'goal': '确保内容质量达到专业发布标准',
                 'backstory': '你是一位经验丰富的编辑专家',
                 'max_iter': 2,
+                'max_execution_time': 250,
                 'verbose': True
             }
         }
@@ -146,13 +353,18 @@ class ContentCrew:
                 'description': '基于策略分析创建{content_type}，目标受众为{target_audience}',
                 'expected_output': '完整的{content_type}内容，约{word_count}字',
                 'agent': 'writer',
-                'context': ['research_task', 'analysis_task']
+                'context': ['research_task', 'analysis_task'],
+                'context_budget': 3000
             },
             'editing_task': {
                 'description': '对内容进行全面编辑和质量优化',
                 'expected_output': '编辑完善的最终发布内容和质量报告',
                 'agent': 'editor',
-                'context': ['research_task', 'analysis_task', 'writing_task']
+                'context': ['research_task', 'analysis_task', 'writing_task'],
+                'context_budget': 5000,
+                'context_keep': ['writing_task'],
+                'quality_gate_source': 'writing_task',
+                'budget_fallback': 'writing_task'
             }
         }
 
@@ -161,7 +373,11 @@ class ContentCrew:
                        content_type: str = "blog_post",
                        target_audience: str = "技术专业人士",
                        word_count: int = 1200,
-                       additional_requirements: Optional[str] = None) -> Dict[str, Any]:
+                       additional_requirements: Optional[str] = None,
+                       use_cache: bool = True,
+                       refresh_cache: bool = False,
+                       deadline_s: Optional[float] = None,
+                       max_tokens: Optional[int] = None) -> Dict[str, Any]:
         """
         创建内容的主要方法
 
@@ -171,192 +387,1195 @@ class ContentCrew:
             target_audience: 目标受众
             word_count: 目标字数
             additional_requirements: 额外要求
+            use_cache: 是否读写任务输出缓存
+            refresh_cache: 是否忽略已有缓存重新执行，并用新结果覆盖缓存
+            deadline_s: 工作流时间预算（秒），默认读取 WORKFLOW_DEADLINE_S，0 表示不限制
+            max_tokens: 工作流token预算，默认读取 WORKFLOW_MAX_TOKENS，0 表示不限制
 
         Returns:
-            Dict: 包含最终内容和处理信息的结果
+            Dict: 包含最终内容和处理信息的结果；与正在执行的相同请求合并时，
+                execution_info['coalesced'] 为 in_flight 或 recent
         """
+        workflow_id = uuid.uuid4().hex
+        parameters = {
+            'topic': topic,
+            'content_type': content_type,
+            'target_audience': target_audience,
+            'word_count': word_count,
+            'use_cache': use_cache,
+            'refresh_cache': refresh_cache,
+            'deadline_s': deadline_s,
+            'max_tokens': max_tokens
+        }
+        key = self._flight_key(parameters, additional_requirements)
+        if key is None:
+            return self._run_workflow(workflow_id, parameters)
+
+        result, flight, role = self.single_flight.do(
+            key, lambda: self._run_workflow(workflow_id, parameters), owner=workflow_id
+        )
+        return self._mark_coalesced(result, flight, role, workflow_id)
+
+    def resume_workflow(self, workflow_id: str) -> Dict[str, Any]:
+        """
+        从检查点恢复失败或中断的工作流
+
+        已完成的任务直接使用检查点中的输出，从第一个未完成的任务开始执行，
+        下游任务仍以检查点中的上游输出作为上下文。
+
+        Args:
+            workflow_id: 工作流ID（见结果中的 execution_info['workflow_id'] 或 history 记录）
+
+        Returns:
+            Dict: 与 create_content 相同结构的结果
+        """
+        if self.checkpoint_store is None:
+            raise ValueError("❌ 工作流检查点未启用，无法恢复工作流")
+
+        record = self.checkpoint_store.get_workflow(workflow_id)
+        if record is None:
+            raise ValueError(f"❌ 未找到工作流检查点: {workflow_id}")
+
+        return self._run_workflow(workflow_id, record['parameters'], resume=True)
+
+    def _run_workflow(self, workflow_id: str, parameters: Dict[str, Any], resume: bool = False) -> Dict[str, Any]:
+        """按DAG执行工作流，parameters 为 _prepare_workflow 的参数"""
+        self.workflow_history.begin(workflow_id)
         try:
-            print(f"\n🎯 开始创建内容")
-            print(f"📋 主题: {topic}")
-            print(f"📝 类型: {content_type}")
-            print(f"👥 受众: {target_audience}")
-            print(f"📏 字数: {word_count}")
-            print("=" * 60)
-
-            # 记录工作流开始
-            workflow_start = datetime.now(timezone.utc)
-            self.workflow_history.append({
-                'timestamp': workflow_start.isoformat(),
-                'action': 'workflow_started',
-                'parameters': {
-                    'topic': topic,
-                    'content_type': content_type,
-                    'target_audience': target_audience,
-                    'word_count': word_count
-                }
-            })
+            workflow = self._prepare_workflow(**parameters, workflow_id=workflow_id, resume=resume)
+
+            # 按DAG执行工作流，每个任务在依赖完成后立即启动
+            executor = DagExecutor(self.task_graph, max_workers=self.dag_max_workers)
+            workflow['ready_at'] = executor.ready_at
+            outputs = executor.run(lambda name, upstream: self._run_stage(name, workflow))
+            result = outputs[self.task_graph.final_task]
+
+            return self._finish_workflow(result, workflow)
+
+        except Exception as e:
+            self._record_workflow_failure(e, workflow_id)
+            raise
+        finally:
+            self.workflow_history.end(workflow_id)
+
+    async def acreate_content(self,
+                              topic: str,
+                              content_type: str = "blog_post",
+                              target_audience: str = "技术专业人士",
+                              word_count: int = 1200,
+                              additional_requirements: Optional[str] = None,
+                              use_cache: bool = True,
+                              refresh_cache: bool = False,
+                              deadline_s: Optional[float] = None,
+                              max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """
+        create_content 的异步版本，每个任务通过 Crew.kickoff_async 执行
+
+        同一事件循环中可并发运行多个工作流，并发数量受 max_concurrency 限制。
+        注意 kickoff_async 内部使用 asyncio.to_thread，实际并发同时受事件循环默认线程池大小限制。
+
+        Args:
+            topic: 内容主题
+            content_type: 内容类型 (blog_post, article, report, etc.)
+            target_audience: 目标受众
+            word_count: 目标字数
+            additional_requirements: 额外要求
+            use_cache: 是否读写任务输出缓存
+            refresh_cache: 是否忽略已有缓存重新执行，并用新结果覆盖缓存
+            deadline_s: 工作流时间预算（秒），默认读取 WORKFLOW_DEADLINE_S，0 表示不限制
+            max_tokens: 工作流token预算，默认读取 WORKFLOW_MAX_TOKENS，0 表示不限制
+
+        Returns:
+            Dict: 与 create_content 相同结构的结果
+        """
+        workflow_id = uuid.uuid4().hex
+        parameters = {
+            'topic': topic,
+            'content_type': content_type,
+            'target_audience': target_audience,
+            'word_count': word_count,
+            'use_cache': use_cache,
+            'refresh_cache': refresh_cache,
+            'deadline_s': deadline_s,
+            'max_tokens': max_tokens
+        }
+        key = self._flight_key(parameters, additional_requirements)
+        if key is None:
+            return await self._arun_workflow(workflow_id, parameters)
+
+        # 合并的请求只等待结果，不占用并发名额
+        result, flight, role = await self.single_flight.ado(
+            key, lambda: self._arun_workflow(workflow_id, parameters), owner=workflow_id
+        )
+        return self._mark_coalesced(result, flight, role, workflow_id)
+
+    async def _arun_workflow(self, workflow_id: str, parameters: Dict[str, Any]) -> Dict[str, Any]:
+        """_run_workflow 的异步版本"""
+        async with self._get_async_semaphore():
+            self.workflow_history.begin(workflow_id)
+            try:
+                # 智能体和Crew的构建涉及工具与记忆存储初始化，放到线程中避免阻塞事件循环
+                workflow = await asyncio.to_thread(
+                    self._prepare_workflow, **parameters, workflow_id=workflow_id
+                )
+
+                # 按DAG执行工作流
+                executor = DagExecutor(self.task_graph)
+                workflow['ready_at'] = executor.ready_at
+                outputs = await executor.arun(lambda name, upstream: self._arun_stage(name, workflow))
+                result = outputs[self.task_graph.final_task]
+
+                return self._finish_workflow(result, workflow)
+
+            except Exception as e:
+                self._record_workflow_failure(e, workflow_id)
+                raise
+            finally:
+                # 被取消时没有完成或失败记录，取消后仍在线程中运行的部分也不再计数
+                self.workflow_history.end(workflow_id)
+
+    def create_content_stream(self,
+                              topic: str,
+                              content_type: str = "blog_post",
+                              target_audience: str = "技术专业人士",
+                              word_count: int = 1200,
+                              additional_requirements: Optional[str] = None,
+                              use_cache: bool = True,
+                              refresh_cache: bool = False,
+                              deadline_s: Optional[float] = None,
+                              max_tokens: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        流式创建内容，工作流执行过程中逐个返回事件
+
+        工作流在后台线程中执行，STREAM_AGENTS 中的智能体（默认写作和编辑）以流式方式调用LLM，
+        调用方可以在写作任务开始后立即展示生成中的内容，而不必等待编辑完成。
+
+        事件均为包含 type 和 timestamp 的字典，type 取值:
+            - stage_started: 任务开始，包含 stage
+            - token: LLM输出片段，包含 stage 和 chunk
+            - tool_started: 工具调用开始，包含 stage、tool 和 args
+            - tool_finished: 工具调用结束，包含 stage、tool、duration 和 error
+            - stage_finished: 任务完成，包含 stage、output、cached 和 metrics
+            - result: 最终结果，包含与 create_content 返回值相同结构的 result
+            - error: 工作流失败，包含 error；随后生成器抛出原始异常
+            - coalesced: 与正在执行的相同请求合并，包含 role 和 workflow_id；
+              之后只收到该工作流后续的事件和最终结果
+
+        Args:
+            topic: 内容主题
+            content_type: 内容类型 (blog_post, article, report, etc.)
+            target_audience: 目标受众
+            word_count: 目标字数
+            additional_requirements: 额外要求
+            use_cache: 是否读写任务输出缓存
+            refresh_cache: 是否忽略已有缓存重新执行，并用新结果覆盖缓存
+            deadline_s: 工作流时间预算（秒），默认读取 WORKFLOW_DEADLINE_S，0 表示不限制
+            max_tokens: 工作流token预算，默认读取 WORKFLOW_MAX_TOKENS，0 表示不限制
+
+        Yields:
+            Dict: 工作流事件
+        """
+        events = queue.Queue()
+        finished = object()
+        outcome = {}
+        workflow_id = uuid.uuid4().hex
+        parameters = {
+            'topic': topic,
+            'content_type': content_type,
+            'target_audience': target_audience,
+            'word_count': word_count,
+            'use_cache': use_cache,
+            'refresh_cache': refresh_cache,
+            'deadline_s': deadline_s,
+            'max_tokens': max_tokens
+        }
+
+        flight, role = None, 'leader'
+        key = self._flight_key(parameters, additional_requirements)
+        if key is not None:
+            # 加入请求时即订阅事件，合并进来的调用方不会遗漏执行者在此之后推送的事件
+            flight, role = self.single_flight.acquire(key, owner=workflow_id, listener=events.put)
+        if role != 'leader':
+            yield from self._follow_stream(flight, role, workflow_id, events)
+            return
+
+        # 事件经由 flight 同时推送给合并进来的流式调用方
+        event_sink = events.put if flight is None else flight.publish
+
+        def run_workflow():
+            self.workflow_history.begin(workflow_id)
+            try:
+                workflow = self._prepare_workflow(
+                    **parameters, workflow_id=workflow_id, event_sink=event_sink
+                )
+                executor = DagExecutor(self.task_graph, max_workers=self.dag_max_workers)
+                workflow['ready_at'] = executor.ready_at
+                outputs = executor.run(lambda name, upstream: self._run_stage(name, workflow))
+                outcome['result'] = self._finish_workflow(outputs[self.task_graph.final_task], workflow)
+                if flight is not None:
+                    self.single_flight.complete(flight, outcome['result'])
+            except Exception as e:
+                self._record_workflow_failure(e, workflow_id)
+                outcome['error'] = e
+                if flight is not None:
+                    self.single_flight.fail(flight, e)
+            finally:
+                self.workflow_history.end(workflow_id)
+                events.put(finished)
+
+        worker = threading.Thread(target=run_workflow, name="content-stream", daemon=True)
+        worker.start()
+
+        while True:
+            event = events.get()
+            if event is finished:
+                break
+            yield event
+
+        worker.join()
+        if 'error' in outcome:
+            yield self._make_event('error', workflow_id=workflow_id, error=str(outcome['error']))
+            raise outcome['error']
+
+        yield self._make_event('result', result=outcome['result'])
+
+    def _follow_stream(self, flight: Flight, role: str, workflow_id: str,
+                       events: queue.Queue) -> Iterator[Dict[str, Any]]:
+        """
+        合并到正在执行的流式或非流式请求，转发其后续事件并返回共享的结果
+
+        events 在加入请求时已订阅（in_flight），其中可能已有执行者推送的事件
+        """
+        finished = object()
+        # 执行者推送完全部事件后才会设置结果，回调放入的结束标记总在最后
+        flight.future.add_done_callback(lambda _: events.put(finished))
+        try:
+            yield self._make_event('coalesced', role=role, workflow_id=flight.owner)
+            while True:
+                event = events.get()
+                if event is finished:
+                    break
+                yield event
+        finally:
+            flight.unsubscribe(events.put)
+
+        try:
+            result = flight.result()
+        except Exception as e:
+            yield self._make_event('error', workflow_id=flight.owner, error=str(e))
+            raise
+        yield self._make_event('result', result=self._mark_coalesced(result, flight, role, workflow_id))
+
+    def _flight_key(self, parameters: Dict[str, Any], additional_requirements: Optional[str] = None) -> Optional[str]:
+        """
+        计算请求合并的键，未启用合并或要求强制刷新时返回 None
+
+        主题和附加要求去掉首尾空白后比较，其余参数（包括缓存和预算设置）必须完全相同。
+        """
+        if self.single_flight is None or parameters['refresh_cache']:
+            return None
+        return make_cache_key(
+            'workflow', {**parameters, 'topic': parameters['topic'].strip()},
+            (additional_requirements or '').strip()
+        )
 
-            # 准备变量替换
-            variables = {
+    def _mark_coalesced(self, result: Dict[str, Any], flight: Flight, role: str, workflow_id: str) -> Dict[str, Any]:
+        """在合并请求得到的结果中标记来源，并为该请求写一条历史记录"""
+        if role == 'leader':
+            return result
+
+        result['execution_info']['coalesced'] = role
+        self.workflow_history.append({
+            'workflow_id': workflow_id,
+            'action': 'workflow_coalesced',
+            'role': role,
+            'coalesced_into': flight.owner,
+            'parameters': {k: result['metadata'].get(k) for k in ('topic', 'content_type', 'target_audience')}
+        })
+        print(f"🔗 相同请求已合并到工作流 {flight.owner}（{'执行中' if role == 'in_flight' else '刚完成'}）")
+        return result
+
+    def create_content_batch(self,
+                             jobs: Iterable[Dict[str, Any]],
+                             max_workers: Optional[int] = None) -> Iterator[Dict[str, Any]]:
+        """
+        批量创建内容，按完成顺序逐个返回结果
+
+        所有任务共享同一个线程池，并复用已初始化的智能体实例。
+        单个任务失败不会中断整个批次，失败信息会在该任务的结果中返回。
+
+        Args:
+            jobs: 任务列表，每个任务为包含 topic/content_type/target_audience/
+                word_count/additional_requirements 的字典
+            max_workers: 最大并发任务数，默认读取 BATCH_MAX_WORKERS
+
+        Yields:
+            Dict: 单个任务的结果，包含 index、job、status、result 和 error
+        """
+        jobs = list(jobs)
+        max_workers = max_workers or settings.BATCH_MAX_WORKERS
+        print(f"\n📦 开始批量创作: {len(jobs)} 个任务, 并发数 {max_workers}")
+
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="content-batch")
+        try:
+            futures = {}
+            rejected = []
+            for index, job in enumerate(jobs):
+                try:
+                    job_kwargs = self._normalize_batch_job(job)
+                except ValueError as e:
+                    rejected.append({'index': index, 'job': job, 'status': 'failed', 'result': None, 'error': str(e)})
+                    continue
+                futures[executor.submit(self.create_content, **job_kwargs)] = (index, job)
+
+            # 参数校验失败的任务直接返回
+            yield from rejected
+
+            completed = 0
+            for future in as_completed(futures):
+                index, job = futures[future]
+                try:
+                    result = future.result()
+                    completed += 1
+                    yield {'index': index, 'job': job, 'status': 'completed', 'result': result, 'error': None}
+                except Exception as e:
+                    yield {'index': index, 'job': job, 'status': 'failed', 'result': None, 'error': str(e)}
+
+            print(f"📦 批量创作结束: {completed}/{len(jobs)} 个任务成功")
+
+        finally:
+            # 调用方提前停止迭代时，取消尚未开始的任务
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def _normalize_batch_job(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """校验批量任务参数并转换为 create_content 的参数"""
+        return normalize_job_parameters(job)
+
+    def _get_async_semaphore(self) -> asyncio.Semaphore:
+        """获取当前事件循环对应的并发信号量"""
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._async_semaphores[loop] = semaphore
+        return semaphore
+
+    def _prepare_workflow(self,
+                          topic: str,
+                          content_type: str,
+                          target_audience: str,
+                          word_count: int,
+                          use_cache: bool = True,
+                          refresh_cache: bool = False,
+                          deadline_s: Optional[float] = None,
+                          max_tokens: Optional[int] = None,
+                          workflow_id: Optional[str] = None,
+                          resume: bool = False,
+                          event_sink: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """记录工作流开始并创建所有任务"""
+        print(f"\n🎯 开始创建内容")
+        print(f"📋 主题: {topic}")
+        print(f"📝 类型: {content_type}")
+        print(f"👥 受众: {target_audience}")
+        print(f"📏 字数: {word_count}")
+        print("=" * 60)
+
+        # 记录工作流开始
+        workflow_id = workflow_id or uuid.uuid4().hex
+        workflow_start = datetime.now(timezone.utc)
+        self.workflow_history.append({
+            'workflow_id': workflow_id,
+            'timestamp': workflow_start.isoformat(),
+            'action': 'workflow_started',
+            'resumed': resume,
+            'parameters': {
                 'topic': topic,
                 'content_type': content_type,
                 'target_audience': target_audience,
                 'word_count': word_count
             }
+        })
 
-            # 创建智能体
-            agents = self._create_agents(variables)
+        # 准备变量替换
+        variables = {
+            'topic': topic,
+            'content_type': content_type,
+            'target_audience': target_audience,
+            'word_count': word_count
+        }
 
-            # 创建任务
-            tasks = self._create_tasks(agents, variables)
+        # 记录检查点，恢复执行时载入已完成任务的输出
+        checkpoints = {}
+        if self.checkpoint_store is not None:
+            if resume:
+                checkpoints = self.checkpoint_store.load_stages(workflow_id)
+                print(f"🔁 从检查点恢复工作流 {workflow_id}: 已完成 {len(checkpoints)} 个任务")
+            self.checkpoint_store.start_workflow(workflow_id, {
+                **variables, 'use_cache': use_cache, 'refresh_cache': refresh_cache,
+                'deadline_s': deadline_s, 'max_tokens': max_tokens
+            })
 
-            # 创建并执行Crew
-            crew = Crew(
-                agents=list(agents.values()),
-                tasks=tasks,
-                verbose=True,
-                memory=True
-            )
+        # 工作流预算（恢复执行时重新计时）
+        budget = self._create_budget(deadline_s, max_tokens)
 
-            print(f"\n🚀 启动内容创作工作流...")
-            print(f"👥 智能体数量: {len(agents)}")
-            print(f"📋 任务数量: {len(tasks)}")
+        # 创建任务（智能体在任务实际执行时才创建）
+        tasks = self._create_tasks(variables)
 
-            # 执行工作流
-            result = crew.kickoff()
+        print(f"\n🚀 启动内容创作工作流...")
+        print(f"📋 任务数量: {len(tasks)}")
+        print(f"🔀 执行顺序: {' -> '.join(self.task_graph.order)}")
 
-            # 处理结果
-            final_result = self._process_workflow_result(
-                result, workflow_start, variables
+        return {
+            'workflow_id': workflow_id,
+            'start_time': workflow_start,
+            'variables': variables,
+            'tasks': tasks,
+            'use_cache': use_cache and self.stage_cache is not None,
+            'refresh_cache': refresh_cache,
+            'llm_cache_mode': 'bypass' if not use_cache else ('refresh' if refresh_cache else 'use'),
+            'stage_cache': {},
+            'checkpoints': checkpoints,
+            'quality_gate': None,
+            'context_budget': {},
+            'budget': budget,
+            'stage_deadlines': {},
+            'stage_token_limits': {},
+            'degraded_stages': set(),
+            'stages': {},
+            'ready_at': {},
+            'event_sink': event_sink
+        }
+
+    def _create_budget(self, deadline_s: Optional[float], max_tokens: Optional[int]) -> Optional[WorkflowBudget]:
+        """创建工作流预算，未设置时读取默认配置，两项都不限制时返回 None"""
+        deadline_s = (settings.WORKFLOW_DEADLINE_S if deadline_s is None else deadline_s) or None
+        max_tokens = (settings.WORKFLOW_MAX_TOKENS if max_tokens is None else max_tokens) or None
+        if deadline_s is None and max_tokens is None:
+            return None
+
+        # 按智能体配置的 max_execution_time 分配时间和token
+        weights = {
+            name: self.agents_config.get(config['agent'], {}).get('max_execution_time') or 300
+            for name, config in self.stage_configs.items()
+            if name not in self.fanout_groups
+        }
+        print(f"⏳ 工作流预算: 时间 {deadline_s or '不限'}s, token {max_tokens or '不限'}")
+        return WorkflowBudget(self.task_graph, weights, deadline_s=deadline_s, max_tokens=max_tokens)
+
+    def _new_stage_crew(self, agent: Agent, task: Task) -> Crew:
+        """
+        单个任务组成一个Crew，由DAG调度器决定执行时机
+
+        crewai 的控制台输出是进程内共享的 Rich 实时面板，同时只能有一个，
+        任务或工作流可能并发执行时关闭 verbose，避免 "Only one live display may be active at once" 错误
+        """
+        return Crew(
+            agents=[agent],
+            tasks=[task],
+            verbose=self.dag_max_workers <= 1 and self.max_concurrency <= 1,
+            memory=settings.CREW_MEMORY
+        )
+
+    def _build_stage_crew(self, task_name: str, workflow: Dict[str, Any],
+                          allowance: Optional[Dict[str, Optional[float]]] = None) -> Crew:
+        """为任务准备独立的智能体和Crew，启用智能体池时复用相同结构的已有对象"""
+        task = workflow['tasks'][task_name]
+        agent_name, agent_config = self._get_stage_agent_config(task_name, workflow['variables'])
+        agent_config = self._apply_stage_budget(task_name, agent_config, allowance, workflow)
+        self._apply_context_budget(task_name, workflow)
+
+        # 流式工作流中，指定的智能体使用流式LLM逐个token输出
+        if workflow['event_sink'] is not None and agent_name in settings.STREAM_AGENTS:
+            agent_config = {**agent_config, 'llm': {**(agent_config.get('llm') or {}), 'stream': True}}
+
+        if self.agent_pool is not None:
+            return self.agent_pool.acquire(agent_name, agent_config, task)
+
+        task.agent = self._create_agent(agent_name, agent_config)
+        return self._new_stage_crew(task.agent, task)
+
+    def _apply_stage_budget(self, task_name: str, agent_config: Dict[str, Any],
+                            allowance: Optional[Dict[str, Optional[float]]],
+                            workflow: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        将分配给任务的时间额度写入智能体的 max_execution_time，token额度在执行时由 TokenLimitLLM 执行
+
+        额度低于配置值的 BUDGET_REDUCE_DEPTH_RATIO 时将 max_iter 降为1，减少研究等任务的迭代深度，
+        降级执行的输出不写入任务缓存。两个字段都可在智能体池中重新绑定，不影响复用。
+        """
+        budget = workflow['budget']
+        if budget is None or allowance is None:
+            return agent_config
+
+        action = 'run'
+        if allowance['time'] is not None:
+            configured = agent_config.get('max_execution_time')
+            seconds = max(1, int(allowance['time']))
+            workflow['stage_deadlines'][task_name] = time.monotonic() + allowance['time']
+            agent_config = {**agent_config, 'max_execution_time': min(configured, seconds) if configured else seconds}
+            if (configured and allowance['time'] < configured * settings.BUDGET_REDUCE_DEPTH_RATIO
+                    and agent_config.get('max_iter', 1) > 1):
+                agent_config['max_iter'] = 1
+                action = 'reduced'
+                workflow['degraded_stages'].add(task_name)
+                print(f"⏳ {task_name} 时间预算紧张 ({allowance['time']:.0f}s)，降低执行深度")
+        if allowance['tokens'] is not None:
+            workflow['stage_token_limits'][task_name] = max(1, allowance['tokens'])
+
+        budget.record(task_name, action, allowance)
+        return agent_config
+
+    def _allocate_stage_budget(self, task_name: str, workflow: Dict[str, Any]) -> Optional[Dict[str, Optional[float]]]:
+        """为任务分配一次预算额度，检查和执行共用同一份额度；未设置工作流预算时返回 None"""
+        if workflow['budget'] is None:
+            return None
+        return workflow['budget'].allocate(task_name)
+
+    def _check_stage_budget(self, task_name: str, allowance: Optional[Dict[str, Optional[float]]],
+                            workflow: Dict[str, Any]) -> Optional[TaskOutput]:
+        """
+        任务执行前检查分配到的预算额度
+
+        分配到的时间或token低于下限时，配置了 budget_fallback 的任务直接跳过；
+        其余任务在预算已耗尽时抛出 BudgetExceededError，尚有剩余时照常执行。
+        """
+        budget = workflow['budget']
+        if budget is None or allowance is None:
+            return None
+
+        insufficient = ((allowance['time'] is not None and allowance['time'] < settings.BUDGET_MIN_STAGE_SECONDS)
+                        or (allowance['tokens'] is not None
+                            and allowance['tokens'] < settings.BUDGET_MIN_STAGE_TOKENS))
+        if not insufficient:
+            return None
+
+        if self.stage_configs[task_name].get('budget_fallback'):
+            budget.record(task_name, 'skipped', allowance)
+            return self._apply_budget_fallback(task_name, workflow)
+
+        if budget.exhausted():
+            raise BudgetExceededError(
+                f"❌ 工作流预算已耗尽，无法执行 {task_name} "
+                f"(已用时 {budget.elapsed():.0f}s, 已用token {budget.tokens_used})"
             )
+        return None
+
+    def _recover_stage_budget(self, task_name: str, workflow: Dict[str, Any], error: Exception) -> TaskOutput:
+        """任务超出时间或token额度时，配置了 budget_fallback 的任务降级为上游输出，其余任务失败"""
+        timed_out = isinstance(error, StageDeadlineError)
+        workflow['budget'].record(task_name, 'timeout' if timed_out else 'token_limit')
+        if not self.stage_configs[task_name].get('budget_fallback'):
+            kind = '时间' if timed_out else 'token'
+            raise BudgetExceededError(f"❌ {task_name} 超出工作流{kind}预算") from error
+        return self._apply_budget_fallback(task_name, workflow)
+
+    def _apply_budget_fallback(self, task_name: str, workflow: Dict[str, Any]) -> TaskOutput:
+        """跳过任务，以 budget_fallback 指定的上游任务输出作为本任务输出"""
+        source = workflow['tasks'][self.stage_configs[task_name]['budget_fallback']].output
+        task = workflow['tasks'][task_name]
+        task.output = TaskOutput(
+            description=task.description,
+            raw=source.raw,
+            agent=source.agent
+        )
+        workflow['stage_cache'][task_name] = 'skipped'
+        print(f"⏳ 工作流预算不足，跳过 {task_name}")
+        return task.output
 
-            print(f"\n🎉 内容创作完成！")
-            print(f"⏱️  总耗时: {final_result['execution_info']['total_time']}")
-            print(f"📄 最终内容长度: {len(str(result))} 字符")
+    def _stage_timeout(self, workflow: Dict[str, Any]) -> Optional[float]:
+        """
+        任务的硬超时：工作流剩余时间
 
-            return final_result
+        crewai 的 max_execution_time 要等到智能体线程结束才抛出超时，不能保证截止时间，
+        因此在外层等待执行结果时再加一层超时。
+        """
+        if workflow['budget'] is None:
+            return None
+        return workflow['budget'].remaining_time()
 
+    def _apply_context_budget(self, task_name: str, workflow: Dict[str, Any]):
+        """
+        将任务的上下文压缩到预算以内
+
+        crewai 执行时从 task.context 中各任务的 output 拼接上下文，
+        超出预算时用输出为压缩文本的代理任务替换原上下文任务，原任务的输出保持不变。
+        context_keep 中的输出不压缩并优先占用预算，其余上游输出压缩到剩下的预算内。
+        """
+        tasks = workflow['tasks']
+        task = tasks[task_name]
+        context_task_names = self.task_graph.dependencies[task_name]
+        if not settings.CONTEXT_BUDGET_ENABLED or not context_task_names:
+            return
+
+        task_config = self.stage_configs[task_name]
+        budget = task_config.get('context_budget', settings.CONTEXT_BUDGET_TOKENS)
+        compressed, report = budget_context(
+            {name: tasks[name].output.raw for name in context_task_names},
+            budget,
+            keep=task_config.get('context_keep') or ()
+        )
+        if report['keep_overflow']:
+            # 保留的输出（如初稿）仍完整传入，任务照常执行
+            self.logger.warning(f"⚠️  {task_name} 保留的上游输出超出上下文预算 {report['keep_overflow']} tokens，"
+                                f"其余上游输出已全部省略")
+        workflow['context_budget'][task_name] = report
+
+        if report['dropped_tokens'] == 0:
+            task.context = [tasks[name] for name in context_task_names]
+            return
+
+        task.context = [
+            self._make_context_proxy(tasks[name], compressed[name]) for name in context_task_names
+        ]
+        print(f"✂️  {task_name} 上下文压缩: {report['original_tokens']} -> {report['kept_tokens']} tokens "
+              f"(预算 {budget})")
+
+    def _make_context_proxy(self, context_task: Task, raw: str) -> Task:
+        """创建只携带压缩后输出的代理任务"""
+        if raw == context_task.output.raw:
+            return context_task
+
+        proxy = Task(description=context_task.description, expected_output=context_task.expected_output)
+        proxy.output = TaskOutput(
+            description=context_task.description,
+            raw=raw,
+            agent=context_task.output.agent
+        )
+        return proxy
+
+    def _kickoff_stage_crew(self, crew: Crew, task_name: str, workflow: Dict[str, Any]):
+        """执行单任务Crew，完成后归还智能体池"""
+        listener = self._attach_stage_observers(crew, task_name, workflow)
+        try:
+            self._kickoff_with_timeout(crew, self._stage_timeout(workflow))
         except Exception as e:
-            self.logger.error(f"❌ 内容创作失败: {str(e)}")
-            print(f"❌ 创作过程中出现错误: {str(e)}")
-
-            # 记录错误
-            self.workflow_history.append({
-                'timestamp': datetime.now(timezone.utc).isoformat(),
-                'action': 'workflow_failed',
-                'error': str(e)
-            })
+            if self.agent_pool is not None:
+                self.agent_pool.discard(crew)
+            budget_error = self._stage_budget_error(crew, task_name, workflow, e)
+            if budget_error is not None:
+                raise budget_error from e
+            raise
+        finally:
+            self._detach_stage_observers(crew, task_name, workflow, listener)
+
+        if self.agent_pool is not None:
+            self.agent_pool.release(crew)
 
+    async def _akickoff_stage_crew(self, crew: Crew, task_name: str, workflow: Dict[str, Any]):
+        """_kickoff_stage_crew 的异步版本"""
+        listener = self._attach_stage_observers(crew, task_name, workflow)
+        timeout = self._stage_timeout(workflow)
+        try:
+            if timeout is None:
+                await crew.kickoff_async()
+            else:
+                try:
+                    await asyncio.wait_for(crew.kickoff_async(), max(timeout, 0))
+                except asyncio.TimeoutError:
+                    raise StageDeadlineError(f"任务执行超出工作流时间预算 ({timeout:.0f}s)")
+        except asyncio.CancelledError:
+            # 被取消时执行线程可能仍在使用智能体，不能归还智能体池
+            if self.agent_pool is not None:
+                self.agent_pool.discard(crew)
+            raise
+        except Exception as e:
+            if self.agent_pool is not None:
+                self.agent_pool.discard(crew)
+            budget_error = self._stage_budget_error(crew, task_name, workflow, e)
+            if budget_error is not None:
+                raise budget_error from e
             raise
+        finally:
+            self._detach_stage_observers(crew, task_name, workflow, listener)
+
+        if self.agent_pool is not None:
+            self.agent_pool.release(crew)
+
+    def _stage_budget_error(self, crew: Crew, task_name: str, workflow: Dict[str, Any],
+                            error: Exception) -> Optional[Exception]:
+        """
+        判断任务失败是否由工作流预算引起，是则返回对应的预算异常，否则返回 None
+
+        token额度用完时 TokenLimitLLM 拒绝调用，返回 StageTokenBudgetError。
 
-    def _create_agents(self, variables: Dict[str, Any]) -> Dict[str, Agent]:
-        """创建所有智能体"""
-        agents = {}
+        分配的时间额度写入了智能体的 max_execution_time，crewai 在额度用完时抛出普通的 TimeoutError，
+        只有此时已过任务的时间额度才视为超出预算；LLM、工具等自身的超时照常作为任务失败处理。
+        """
+        if isinstance(error, (StageDeadlineError, StageTokenBudgetError)):
+            return None
+        # crewai 会把LLM抛出的异常包装为 RuntimeError，从包装器的状态判断
+        limiter = crew.agents[0].llm
+        if isinstance(limiter, TokenLimitLLM) and limiter.exhausted:
+            return StageTokenBudgetError(f"❌ {task_name} 用完了分配的 {limiter.token_limit} tokens")
+        deadline = workflow['stage_deadlines'].get(task_name)
+        if isinstance(error, TimeoutError) and deadline is not None and time.monotonic() >= deadline:
+            return StageDeadlineError(f"任务执行超出分配的时间额度: {str(error)}")
+        return None
+
+    def _kickoff_with_timeout(self, crew: Crew, timeout: Optional[float]):
+        """
+        执行Crew，超过 timeout 秒未完成时抛出 StageDeadlineError
 
+        超时后执行线程无法强制终止，会在后台自然结束；其Crew不会归还智能体池。
+        """
+        if timeout is None:
+            crew.kickoff()
+            return
+
+        outcome = {}
+
+        def run():
+            try:
+                crew.kickoff()
+            except Exception as e:
+                outcome['error'] = e
+
+        worker = threading.Thread(target=run, name="stage-kickoff", daemon=True)
+        worker.start()
+        worker.join(max(timeout, 0))
+        if worker.is_alive():
+            raise StageDeadlineError(f"任务执行超出工作流时间预算 ({timeout:.0f}s)")
+        if 'error' in outcome:
+            raise outcome['error']
+
+    def _attach_stage_observers(self, crew: Crew, task_name: str, workflow: Dict[str, Any]):
+        """在执行前订阅任务所用智能体的事件和步骤回调，用于统计指标和推送流式事件"""
+        agent = crew.agents[0]
+        metrics = workflow['stages'][task_name]
+        token_limit = workflow['stage_token_limits'].get(task_name)
+        if token_limit is not None:
+            # 用量由 crewai 的回调累计在智能体上，只计算本次任务的部分
+            token_process = agent._token_process
+            baseline = token_process.total_tokens
+            agent.llm = TokenLimitLLM(agent.llm, token_limit, lambda: token_process.total_tokens - baseline)
+        metrics.begin_usage(crew.calculate_usage_metrics())
+        agent.step_callback = metrics.on_step
+        if isinstance(agent.llm, DelegatingLLM):
+            metrics.begin_llm_counters(agent.llm.collect_stats())
+        # use_cache=False / refresh_cache 同样作用于LLM响应缓存
+        for caching_llm in find_wrappers(agent.llm, CachingLLM):
+            caching_llm.mode = workflow['llm_cache_mode']
+
+        stream_listener = self._make_stream_listener(task_name, workflow)
+
+        def listener(source, event):
+            metrics.on_event(source, event)
+            if stream_listener is not None:
+                stream_listener(source, event)
+
+        event_router.subscribe(agent.id, listener)
+        return listener
+
+    def _detach_stage_observers(self, crew: Crew, task_name: str, workflow: Dict[str, Any], listener):
+        """执行结束后取消订阅，并统计本次执行的token用量"""
+        agent = crew.agents[0]
+        event_router.unsubscribe(agent.id, listener)
+        # 智能体会被池复用，回调不能留在智能体上
+        agent.step_callback = None
+        workflow['stages'][task_name].end_usage(crew.calculate_usage_metrics())
+        if isinstance(agent.llm, DelegatingLLM):
+            workflow['stages'][task_name].end_llm_counters(agent.llm.collect_stats())
+        for caching_llm in find_wrappers(agent.llm, CachingLLM):
+            caching_llm.mode = 'use'
+        if isinstance(agent.llm, TokenLimitLLM):
+            # 输出上限被额度压低过的结果可能不完整，不写入任务缓存
+            if agent.llm.stats['token_capped'] or agent.llm.exhausted:
+                workflow['degraded_stages'].add(task_name)
+            agent.llm = agent.llm.llm
+
+    def _make_event(self, event_type: str, **fields) -> Dict[str, Any]:
+        """构造流式事件"""
+        return {'type': event_type, 'timestamp': datetime.now(timezone.utc).isoformat(), **fields}
+
+    def _emit_event(self, workflow: Dict[str, Any], event_type: str, **fields):
+        """向流式工作流的调用方推送事件，非流式工作流直接忽略"""
+        if workflow['event_sink'] is not None:
+            workflow['event_sink'](self._make_event(event_type, **fields))
+
+    def _make_stream_listener(self, task_name: str, workflow: Dict[str, Any]):
+        """将任务所用智能体的LLM和工具事件转换为流式事件"""
+        if workflow['event_sink'] is None:
+            return None
+
+        def listener(source, event):
+            if isinstance(event, LLMStreamChunkEvent):
+                # 函数调用参数片段不属于正文输出
+                if event.tool_call is None:
+                    self._emit_event(workflow, 'token', stage=task_name, chunk=event.chunk)
+            elif isinstance(event, ToolUsageStartedEvent):
+                self._emit_event(workflow, 'tool_started', stage=task_name,
+                                 tool=event.tool_name, args=event.tool_args)
+            elif isinstance(event, ToolUsageFinishedEvent):
+                duration = (event.finished_at - event.started_at).total_seconds()
+                self._emit_event(workflow, 'tool_finished', stage=task_name,
+                                 tool=event.tool_name, duration=round(duration, 3), error=None)
+            elif isinstance(event, ToolUsageErrorEvent):
+                self._emit_event(workflow, 'tool_finished', stage=task_name,
+                                 tool=event.tool_name, duration=None, error=str(event.error))
+
+        return listener
+
+    def _run_stage(self, task_name: str, workflow: Dict[str, Any]) -> TaskOutput:
+        """执行单个任务（拆分任务的合并节点在本地合并，不调用LLM）"""
+        self._start_stage(task_name, workflow)
         try:
-            # 创建研究员
-            researcher_config = self._substitute_variables(
-                self.agents_config['researcher'].copy(), variables
-            )
-            agents['researcher'] = self.researcher_agent_instance.create_agent(researcher_config)
-            print("✅ 研究员智能体已创建")
+            output = self._load_checkpointed_stage(task_name, workflow)
+            if output is None:
+                output = self._run_local_stage(task_name, workflow)
+                if output is None:
+                    cache_key = self._get_stage_cache_key(task_name, workflow)
+                    output = self._load_cached_stage(task_name, cache_key, workflow)
+                    if output is None:
+                        allowance = self._allocate_stage_budget(task_name, workflow)
+                        output = self._check_stage_budget(task_name, allowance, workflow)
+                    if output is None:
+                        try:
+                            crew = self._build_stage_crew(task_name, workflow, allowance)
+                            self._kickoff_stage_crew(crew, task_name, workflow)
+                            output = self._store_stage_output(task_name, cache_key, workflow)
+                        except (StageDeadlineError, StageTokenBudgetError) as e:
+                            output = self._recover_stage_budget(task_name, workflow, e)
+                self._save_checkpoint(task_name, output, workflow)
+        except Exception:
+            self._finish_stage(task_name, None, workflow)
+            raise
 
-            # 创建分析师
-            analyst_config = self._substitute_variables(
-                self.agents_config['analyst'].copy(), variables
-            )
-            agents['analyst'] = self.analyst_agent_instance.create_agent(analyst_config)
-            print("✅ 分析师智能体已创建")
+        self._finish_stage(task_name, output, workflow)
+        return output
 
-            # 创建写作者
-            writer_config = self._substitute_variables(
-                self.agents_config['writer'].copy(), variables
-            )
-            agents['writer'] = self.writer_agent_instance.create_agent(writer_config)
-            print("✅ 写作者智能体已创建")
+    async def _arun_stage(self, task_name: str, workflow: Dict[str, Any]) -> TaskOutput:
+        """_run_stage 的异步版本"""
+        self._start_stage(task_name, workflow)
+        try:
+            output = self._load_checkpointed_stage(task_name, workflow)
+            if output is None:
+                output = self._run_local_stage(task_name, workflow)
+                if output is None:
+                    cache_key = self._get_stage_cache_key(task_name, workflow)
+                    output = await asyncio.to_thread(self._load_cached_stage, task_name, cache_key, workflow)
+                    if output is None:
+                        allowance = self._allocate_stage_budget(task_name, workflow)
+                        output = self._check_stage_budget(task_name, allowance, workflow)
+                    if output is None:
+                        try:
+                            crew = await asyncio.to_thread(self._build_stage_crew, task_name, workflow, allowance)
+                            await self._akickoff_stage_crew(crew, task_name, workflow)
+                            output = await asyncio.to_thread(self._store_stage_output, task_name, cache_key, workflow)
+                        except (StageDeadlineError, StageTokenBudgetError) as e:
+                            output = self._recover_stage_budget(task_name, workflow, e)
+                await asyncio.to_thread(self._save_checkpoint, task_name, output, workflow)
+        except BaseException:
+            # 其他任务失败时调度器会取消本任务（CancelledError），同样记为失败
+            self._finish_stage(task_name, None, workflow)
+            raise
 
-            # 创建编辑员
-            editor_config = self._substitute_variables(
-                self.agents_config['editor'].copy(), variables
-            )
-            agents['editor'] = self.editor_agent_instance.create_agent(editor_config)
-            print("✅ 编辑员智能体已创建")
+        self._finish_stage(task_name, output, workflow)
+        return output
 
-            return agents
+    def _run_local_stage(self, task_name: str, workflow: Dict[str, Any]) -> Optional[TaskOutput]:
+        """不需要调用LLM的任务：拆分任务的合并节点、通过质量门的编辑任务；其余任务返回 None"""
+        if task_name in self.fanout_groups:
+            return self._merge_fanout_outputs(task_name, workflow)
+        return self._apply_quality_gate(task_name, workflow)
+
+    def _apply_quality_gate(self, task_name: str, workflow: Dict[str, Any]) -> Optional[TaskOutput]:
+        """
+        对配置了 quality_gate_source 的任务，先用编辑员的本地规则为初稿评分
+
+        评分达到阈值时跳过该任务，直接以初稿作为任务输出；否则照常执行。
+        两种情况下评分报告都会记录在结果的 quality_report 中。
+        """
+        source = self.stage_configs[task_name].get('quality_gate_source')
+        if source is None or self.quality_gate_threshold is None:
+            return None
+
+        content_type = workflow['variables']['content_type']
+        if settings.QUALITY_GATE_CONTENT_TYPES and content_type not in settings.QUALITY_GATE_CONTENT_TYPES:
+            return None
+
+        draft = workflow['tasks'][source].output
+        analysis = self.editor_agent_instance.analyze_content_quality(draft.raw, content_type)
+        report = self.editor_agent_instance.generate_editing_report(analysis)
+        score = analysis['overall_score']
+        passed = score >= self.quality_gate_threshold
+
+        workflow['quality_gate'] = {
+            'stage': task_name,
+            'source': source,
+            'score': score,
+            'threshold': self.quality_gate_threshold,
+            'skipped': passed,
+            'report': report
+        }
+
+        if not passed:
+            print(f"🧪 初稿质量评分 {score} 低于阈值 {self.quality_gate_threshold}，执行 {task_name}")
+            return None
+
+        task = workflow['tasks'][task_name]
+        task.output = TaskOutput(
+            description=task.description,
+            raw=draft.raw,
+            agent=draft.agent
+        )
+        workflow['stage_cache'][task_name] = 'skipped'
+        print(f"🧪 初稿质量评分 {score} 达到阈值 {self.quality_gate_threshold}，跳过 {task_name}")
+        return task.output
+
+    def _start_stage(self, task_name: str, workflow: Dict[str, Any]):
+        """开始统计任务指标"""
+        metrics = StageMetrics(task_name, agent=self.stage_configs[task_name].get('agent'))
+        metrics.start(workflow['ready_at'].get(task_name))
+        workflow['stages'][task_name] = metrics
+        self._emit_event(workflow, 'stage_started', stage=task_name)
+
+    def _finish_stage(self, task_name: str, output: Optional[TaskOutput], workflow: Dict[str, Any]):
+        """结束任务指标统计并输出结构化记录，output 为 None 表示任务失败"""
+        metrics = workflow['stages'][task_name]
+        cached = workflow['stage_cache'].get(task_name) in ('hit', 'checkpoint')
+        metrics.finish('completed' if output is not None else 'failed', cached=cached)
+        if workflow['budget'] is not None:
+            workflow['budget'].consume(metrics.tokens['total_tokens'], task_name)
+        self.workflow_history.append({
+            'workflow_id': workflow['workflow_id'],
+            'action': 'stage_completed' if output is not None else 'stage_failed',
+            'stage': task_name,
+            'cached': cached,
+            'wall_time': round(metrics.wall_time, 3)
+        })
+        log_stage_metrics(metrics, workflow_id=workflow['workflow_id'], topic=workflow['variables']['topic'])
+
+        if output is not None:
+            self._emit_event(workflow, 'stage_finished', stage=task_name, output=output.raw,
+                             cached=cached, metrics=metrics.to_dict())
+
+    def _get_stage_cache_key(self, task_name: str, workflow: Dict[str, Any]) -> Optional[str]:
+        """
+        计算任务输出的缓存键
+
+        由替换变量后的任务描述、智能体配置和上游任务输出共同决定，
+        因此同一主题的研究结果可以在不同内容类型之间复用。
+        """
+        if not workflow['use_cache']:
+            return None
+
+        tasks = workflow['tasks']
+        task = tasks[task_name]
+        _, agent_config = self._get_stage_agent_config(task_name, workflow['variables'])
+        upstream_outputs = [
+            tasks[context_task_name].output.raw
+            for context_task_name in self.task_graph.dependencies[task_name]
+        ]
+
+        return make_cache_key('stage', task.description, task.expected_output, agent_config, upstream_outputs)
+
+    def _load_cached_stage(self, task_name: str, cache_key: Optional[str],
+                           workflow: Dict[str, Any]) -> Optional[TaskOutput]:
+        """命中缓存时直接写回任务输出，跳过LLM调用"""
+        if cache_key is None:
+            workflow['stage_cache'][task_name] = 'bypass'
+            return None
+
+        if workflow['refresh_cache']:
+            workflow['stage_cache'][task_name] = 'refresh'
+            return None
+
+        cached = self.stage_cache.get(cache_key)
+        if cached is None:
+            workflow['stage_cache'][task_name] = 'miss'
+            return None
+
+        task = workflow['tasks'][task_name]
+        task.output = TaskOutput(
+            description=task.description,
+            raw=cached['raw'],
+            agent=cached['agent']
+        )
+        workflow['stage_cache'][task_name] = 'hit'
+        print(f"♻️  {task_name} 命中缓存，跳过执行")
+        return task.output
+
+    def _store_stage_output(self, task_name: str, cache_key: Optional[str],
+                            workflow: Dict[str, Any]) -> TaskOutput:
+        """保存任务输出到缓存，因预算降低执行深度或输出上限的结果不缓存"""
+        output = workflow['tasks'][task_name].output
+        if cache_key is not None and task_name not in workflow['degraded_stages']:
+            try:
+                self.stage_cache.set(cache_key, {'raw': output.raw, 'agent': output.agent})
+            except Exception as e:
+                # 缓存写入失败不影响工作流
+                self.logger.warning(f"⚠️  任务输出缓存写入失败: {task_name}, 错误: {str(e)}")
+        return output
+
+    def _load_checkpointed_stage(self, task_name: str, workflow: Dict[str, Any]) -> Optional[TaskOutput]:
+        """恢复执行时，已有检查点的任务直接写回输出"""
+        checkpoint = workflow['checkpoints'].get(task_name)
+        if checkpoint is None:
+            return None
+
+        task = workflow['tasks'][task_name]
+        task.output = TaskOutput(
+            description=task.description,
+            raw=checkpoint['raw'],
+            agent=checkpoint['agent'] or ''
+        )
+        workflow['stage_cache'][task_name] = 'checkpoint'
+        print(f"📌 {task_name} 从检查点恢复，跳过执行")
+        return task.output
+
+    def _save_checkpoint(self, task_name: str, output: TaskOutput, workflow: Dict[str, Any]):
+        """保存任务检查点"""
+        if self.checkpoint_store is None:
+            return
+        try:
+            self.checkpoint_store.save_stage(workflow['workflow_id'], task_name, output.raw, output.agent)
+        except Exception as e:
+            # 检查点写入失败不影响工作流
+            self.logger.warning(f"⚠️  任务检查点写入失败: {task_name}, 错误: {str(e)}")
+
+    def _merge_fanout_outputs(self, task_name: str, workflow: Dict[str, Any]) -> TaskOutput:
+        """将子任务输出按维度合并为一份完整报告，写回原任务供下游任务作为上下文"""
+        tasks = workflow['tasks']
+        sections = []
+        for subtask_name in self.fanout_groups[task_name]:
+            dimension = self.stage_configs[subtask_name]['dimension']
+            sections.append(f"## {dimension}\n\n{tasks[subtask_name].output.raw}")
+
+        task = tasks[task_name]
+        task.output = TaskOutput(
+            description=task.description,
+            raw="\n\n".join(sections),
+            agent=tasks[self.fanout_groups[task_name][0]].output.agent
+        )
+        print(f"✅ {task_name} 已合并 {len(sections)} 个子任务输出")
+        return task.output
+
+    def _finish_workflow(self, result: Any, workflow: Dict[str, Any]) -> Dict[str, Any]:
+        """处理工作流结果并输出摘要"""
+        final_result = self._process_workflow_result(
+            result, workflow['start_time'], workflow['variables'], workflow['workflow_id']
+        )
+        final_result['execution_info']['stage_cache'] = workflow['stage_cache']
+        final_result['execution_info']['context_budget'] = workflow['context_budget']
+        if workflow['budget'] is not None:
+            final_result['execution_info']['budget'] = workflow['budget'].to_dict()
+        if workflow['quality_gate'] is not None:
+            gate = workflow['quality_gate']
+            final_result['execution_info']['quality_gate'] = {k: v for k, v in gate.items() if k != 'report'}
+            final_result['quality_report'] = gate['report']
+        if self.checkpoint_store is not None:
+            self.checkpoint_store.finish_workflow(workflow['workflow_id'], 'completed')
+        # 按DAG拓扑顺序返回每个任务的指标
+        final_result['execution_info']['stages'] = {
+            name: workflow['stages'][name].to_dict()
+            for name in self.task_graph.order if name in workflow['stages']
+        }
+        summary = summarize_stages(workflow['stages'])
+        final_result['execution_info']['stage_summary'] = summary
+        llm_lookups = summary['llm_cache_hits'] + summary['llm_cache_misses']
+        final_result['execution_info']['llm_cache'] = {
+            'hits': summary['llm_cache_hits'],
+            'misses': summary['llm_cache_misses'],
+            'hit_rate': round(summary['llm_cache_hits'] / llm_lookups, 3) if llm_lookups else None
+        }
+        rag_stats = rag_store_stats()
+        if rag_stats is not None:
+            final_result['execution_info']['rag_store'] = rag_stats
+        prefetch_stats = research_prefetch_stats()
+        if prefetch_stats is not None:
+            final_result['execution_info']['research_prefetch'] = prefetch_stats
+
+        print(f"\n🎉 内容创作完成！")
+        print(f"⏱️  总耗时: {final_result['execution_info']['total_time']}")
+        print(f"📄 最终内容长度: {len(str(result))} 字符")
+        for name, stage in final_result['execution_info']['stages'].items():
+            print(f"  - {name}: {stage['wall_time']:.1f}s, LLM调用 {stage['llm_calls']} 次, "
+                  f"token {stage['total_tokens']}, 工具调用 {stage['tool_calls']} 次, 重试 {stage['retries']} 次")
+
+        return final_result
+
+    def _record_workflow_failure(self, error: Exception, workflow_id: Optional[str] = None):
+        """记录工作流失败"""
+        self.logger.error(f"❌ 内容创作失败: {str(error)}")
+        print(f"❌ 创作过程中出现错误: {str(error)}")
+
+        if self.checkpoint_store is not None and workflow_id is not None:
+            try:
+                self.checkpoint_store.finish_workflow(workflow_id, 'failed', str(error))
+            except Exception as e:
+                self.logger.warning(f"⚠️  工作流状态更新失败: {str(e)}")
+            print(f"💡 可调用 resume_workflow('{workflow_id}') 从检查点继续")
+
+        # 记录错误
+        self.workflow_history.append({
+            'workflow_id': workflow_id,
+            'timestamp': datetime.now(timezone.utc).isoformat(),
+            'action': 'workflow_failed',
+            'error': str(error)
+        })
+
+    def _get_stage_agent_config(self, task_name: str, variables: Dict[str, Any]):
+        """返回任务对应的智能体名称和替换变量后的智能体配置"""
+        agent_name = self.stage_configs[task_name]['agent']
+        if agent_name not in self.agent_factories:
+            raise ValueError(f"未知的智能体: {agent_name}")
+
+        agent_config = self.agent_templates[agent_name].render(variables)
+        return agent_name, agent_config
+
+    def _create_agent(self, agent_name: str, agent_config: Dict[str, Any]) -> Agent:
+        """根据 agents.yaml 中的名称和配置创建智能体"""
+        try:
+            agent = self.agent_factories[agent_name].create_agent(agent_config)
+            print(f"✅ {agent.role} 智能体已创建")
+            return agent
 
         except Exception as e:
             self.logger.error(f"❌ 智能体创建失败: {str(e)}")
             raise
 
-    def _create_tasks(self, agents: Dict[str, Agent], variables: Dict[str, Any]) -> List[Task]:
-        """创建所有任务"""
-        tasks = []
+    def _create_tasks(self, variables: Dict[str, Any]) -> Dict[str, Task]:
+        """按DAG拓扑顺序创建所有任务"""
         task_objects = {}
 
         try:
-            # 按依赖顺序创建任务
-            task_order = ['research_task', 'analysis_task', 'writing_task', 'editing_task']
-
-            for task_name in task_order:
-                task_config = self._substitute_variables(
-                    self.tasks_config[task_name].copy(), variables
-                )
+            for task_name in self.task_graph.order:
+                task_config = self.stage_templates[task_name].render(variables)
 
-                # 处理上下文依赖
-                context_tasks = []
-                if 'context' in task_config:
-                    for context_task_name in task_config['context']:
-                        if context_task_name in task_objects:
-                            context_tasks.append(task_objects[context_task_name])
+                # 处理上下文依赖（拓扑顺序保证依赖任务已创建）
+                context_tasks = [
+                    task_objects[context_task_name]
+                    for context_task_name in self.task_graph.dependencies[task_name]
+                ]
 
-                # 创建任务
+                # 创建任务（命中缓存和拆分任务的合并节点都不需要智能体）
                 task = Task(
                     description=task_config['description'],
                     expected_output=task_config['expected_output'],
-                    agent=agents[task_config['agent']],
                     context=context_tasks if context_tasks else None
                 )
 
-                tasks.append(task)
                 task_objects[task_name] = task
                 print(f"✅ {task_name} 任务已创建")
 
-            return tasks
+            return task_objects
 
         except Exception as e:
             self.logger.error(f"❌ 任务创建失败: {str(e)}")
             raise
 
-    def _substitute_variables(self, config: Dict[str, Any], variables: Dict[str, Any]) -> Dict[str, Any]:
-        """在配置中替换变量"""
-
-        def substitute_string(text: str) -> str:
-            for key, value in variables.items():
-                text = text.replace(f'{{{key}}}', str(value))
-            return text
-
-        def substitute_recursive(obj):
-            if isinstance(obj, str):
-                return substitute_string(obj)
-            elif isinstance(obj, dict):
-                return {k: substitute_recursive(v) for k, v in obj.items()}
-            elif isinstance(obj, list):
-                return [substitute_recursive(item) for item in obj]
-            else:
-                return obj
-
-        return substitute_recursive(config)
-
     def _process_workflow_result(self,
                                  result: Any,
                                  start_time: datetime,
-                                 variables: Dict[str, Any]) -> Dict[str, Any]:
+                                 variables: Dict[str, Any],
+                                 workflow_id: Optional[str] = None) -> Dict[str, Any]:
         """处理工作流结果"""
         end_time = datetime.now(timezone.utc)
         total_time = end_time - start_time
 
         # 记录工作流完成
-        self.workflow_history.append({
+        completed_entry = self.workflow_history.append({
+            'workflow_id': workflow_id,
             'timestamp': end_time.isoformat(),
             'action': 'workflow_completed',
             'total_time_seconds': total_time.total_seconds()
@@ -372,10 +1591,11 @@ class ContentCrew:
                 'actual_length': len(str(result))
             },
             'execution_info': {
+                'workflow_id': workflow_id,
                 'start_time': start_time.isoformat(),
                 'end_time': end_time.isoformat(),
                 'total_time': str(total_time).split('.')[0],  # 去掉微秒
-                'workflow_steps': len(self.workflow_history)
+                'workflow_steps': completed_entry.get('step', 0)
             },
             'quality_metrics': {
                 'content_length_match': abs(len(str(result)) - variables['word_count'] * 5) < variables[
@@ -387,6 +1607,25 @@ class ContentCrew:
 
         return processed_result
 
+    def history(self,
+                since: Optional[Any] = None,
+                status: Optional[str] = None,
+                limit: Optional[int] = 100,
+                workflow_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        查询工作流历史记录
+
+        Args:
+            since: 只返回该时间之后的记录（datetime 或 ISO 格式字符串）
+            status: 按状态过滤（started/completed/failed）
+            limit: 最多返回的最新记录数，为 None 时不限制
+            workflow_id: 只返回指定工作流的记录
+
+        Returns:
+            List[Dict]: 按时间顺序排列的记录
+        """
+        return self.workflow_history.history(since=since, status=status, limit=limit, workflow_id=workflow_id)
+
     def save_result(self, result: Dict[str, Any], output_dir: Optional[str] = None) -> str:
         """
         保存创作结果到文件
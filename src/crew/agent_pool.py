@@ -0,0 +1,171 @@
+"""
+智能体池 - 跨工作流复用已构建的 Agent 和单任务 Crew
+"""
+import json
+import threading
+import logging
+from collections import defaultdict
+from typing import Dict, Any, List, Callable
+
+from crewai import Agent, Task, Crew
+
+# 每次借出时重新绑定的字段，其余配置相同的智能体视为同一结构
+REBINDABLE_FIELDS = ('role', 'goal', 'backstory', 'max_iter', 'max_execution_time')
+
+
+class AgentPool:
+    """
+    智能体池
+
+    构建 Agent（工具装配、参数校验）和 Crew（记忆存储初始化）的开销较大。
+    池按"智能体名称 + 除可重绑定字段外的配置"分组保存空闲的单任务 Crew，
+    借出时把本次请求的 role/goal/backstory 等字段重新绑定到池中的智能体上。
+    每个 Crew 同一时间只会被一个任务使用。
+    """
+
+    def __init__(self,
+                 agent_factory: Callable[[str, Dict[str, Any]], Agent],
+                 crew_factory: Callable[[Agent, Task], Crew],
+                 max_idle_per_key: int = 8):
+        """
+        Args:
+            agent_factory: 根据智能体名称和配置创建 Agent
+            crew_factory: 根据 Agent 和 Task 创建单任务 Crew
+            max_idle_per_key: 每种结构最多保留的空闲 Crew 数量
+        """
+        self.logger = logging.getLogger(__name__)
+        self.agent_factory = agent_factory
+        self.crew_factory = crew_factory
+        self.max_idle_per_key = max_idle_per_key
+        self._idle: Dict[str, List[Crew]] = defaultdict(list)
+        self._leased: Dict[int, str] = {}
+        self._lock = threading.Lock()
+        self.stats = {'hits': 0, 'misses': 0, 'discarded': 0}
+
+    def _pool_key(self, agent_name: str, agent_config: Dict[str, Any]) -> str:
+        structure = {k: v for k, v in agent_config.items() if k not in REBINDABLE_FIELDS}
+        return agent_name + ':' + json.dumps(structure, ensure_ascii=False, sort_keys=True, default=str)
+
+    def acquire(self, agent_name: str, agent_config: Dict[str, Any], task: Task) -> Crew:
+        """
+        借出一个执行指定任务的 Crew
+
+        Args:
+            agent_name: agents.yaml 中的智能体名称
+            agent_config: 替换变量后的智能体配置
+            task: 要执行的任务
+
+        Returns:
+            Crew: 只包含该任务和对应智能体的 Crew，用完后需调用 release
+        """
+        key = self._pool_key(agent_name, agent_config)
+
+        with self._lock:
+            crew = self._idle[key].pop() if self._idle[key] else None
+            self.stats['hits' if crew is not None else 'misses'] += 1
+
+        if crew is None:
+            agent = self.agent_factory(agent_name, agent_config)
+            task.agent = agent
+            crew = self.crew_factory(agent, task)
+        else:
+            agent = crew.agents[0]
+            self._rebind(agent, agent_config)
+            task.agent = agent
+            crew.tasks = [task]
+
+        with self._lock:
+            self._leased[id(crew)] = key
+        return crew
+
+    def _rebind(self, agent: Agent, agent_config: Dict[str, Any]):
+        """将本次请求的字段绑定到复用的智能体上"""
+        for field in REBINDABLE_FIELDS:
+            if field in agent_config:
+                setattr(agent, field, agent_config[field])
+
+    def release(self, crew: Crew):
+        """归还 Crew，超出空闲上限时直接丢弃"""
+        with self._lock:
+            key = self._leased.pop(id(crew), None)
+            if key is None:
+                return
+            if len(self._idle[key]) < self.max_idle_per_key:
+                self._idle[key].append(crew)
+            else:
+                self.stats['discarded'] += 1
+
+    def discard(self, crew: Crew):
+        """丢弃执行失败的 Crew，不再放回池中"""
+        with self._lock:
+            if self._leased.pop(id(crew), None) is not None:
+                self.stats['discarded'] += 1
+
+    def clear(self):
+        """清空所有空闲 Crew"""
+        with self._lock:
+            self._idle.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """返回复用统计"""
+        with self._lock:
+            idle = sum(len(crews) for crews in self._idle.values())
+            return {**self.stats, 'idle': idle, 'leased': len(self._leased)}
+
+
+# 基准测试：对比每次新建与池化复用的单任务 Crew 构建开销
+def benchmark_agent_pool(iterations: int = 20):
+    """
+    基准测试智能体池（需要设置 OPENAI_API_KEY，但不会调用LLM）
+
+    在 ContentCrew 上分别以禁用和启用智能体池的方式准备 iterations 次写作任务的 Crew，
+    对比平均耗时。
+    """
+    import time
+    from src.crew.ContentCrew import ContentCrew
+
+    print("🏊 基准测试智能体池...")
+
+    try:
+        content_crew = ContentCrew()
+        variables = {'topic': '人工智能', 'content_type': 'blog_post',
+                     'target_audience': '技术爱好者', 'word_count': 800}
+        agent_name, agent_config = content_crew._get_stage_agent_config('writing_task', variables)
+
+        def new_task():
+            return Task(description='基准测试任务', expected_output='基准测试输出')
+
+        # 每次新建
+        start = time.perf_counter()
+        for _ in range(iterations):
+            task = new_task()
+            task.agent = content_crew._create_agent(agent_name, agent_config)
+            content_crew._new_stage_crew(task.agent, task)
+        cold = (time.perf_counter() - start) / iterations
+
+        # 池化复用
+        pool = AgentPool(content_crew._create_agent, content_crew._new_stage_crew)
+        start = time.perf_counter()
+        for _ in range(iterations):
+            crew = pool.acquire(agent_name, agent_config, new_task())
+            pool.release(crew)
+        pooled = (time.perf_counter() - start) / iterations
+
+        print(f"\n📊 单任务Crew准备耗时（{iterations} 次平均）")
+        print(f"  - 每次新建: {cold * 1000:.2f} ms")
+        print(f"  - 池化复用: {pooled * 1000:.2f} ms")
+        print(f"  - 加速比: {cold / max(pooled, 1e-9):.1f}x")
+        print(f"  - 池统计: {pool.get_stats()}")
+        return True
+
+    except Exception as e:
+        print(f"❌ 基准测试失败: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # 设置日志
+    logging.basicConfig(level=logging.INFO)
+
+    # 运行基准测试
+    benchmark_agent_pool()
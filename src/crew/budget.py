@@ -0,0 +1,230 @@
+"""
+工作流预算 - 将整个工作流的截止时间和token上限分配到各个任务
+"""
+import time
+import threading
+import logging
+from typing import Dict, Any, List, Optional
+
+from src.crew.scheduler import TaskGraph
+
+
+class BudgetExceededError(RuntimeError):
+    """工作流预算耗尽且无法降级"""
+
+
+class StageTokenBudgetError(BudgetExceededError):
+    """任务用完了工作流分配的token额度"""
+
+
+class StageDeadlineError(TimeoutError):
+    """任务执行超出工作流分配的时间，与LLM、工具等自身的超时区分"""
+
+
+class WorkflowBudget:
+    """
+    工作流预算
+
+    每个任务开始时，按"该任务权重 / 从该任务到终点的最长剩余路径权重"的比例
+    从剩余时间和剩余token中为其分配额度，先完成的任务节省下来的预算自动留给后续任务。
+    权重通常取各智能体配置的 max_execution_time。
+
+    并行执行的任务共享同一段时间，但不能共享token：token按"该任务权重 / 尚未分配的所有任务权重之和"
+    的比例分配并从余额中预留，任务结束调用 consume 时按实际用量结算，
+    因此同时就绪的任务分配到的token合计不超过预算。
+    """
+
+    def __init__(self,
+                 graph: TaskGraph,
+                 weights: Dict[str, float],
+                 deadline_s: Optional[float] = None,
+                 max_tokens: Optional[int] = None):
+        """
+        Args:
+            graph: 任务DAG
+            weights: 任务名到权重的映射
+            deadline_s: 整个工作流的时间预算（秒），None 表示不限制
+            max_tokens: 整个工作流的token预算，None 表示不限制
+        """
+        self.deadline_s = deadline_s
+        self.max_tokens = max_tokens
+        self.weights = weights
+        self.tokens_used = 0
+        self.tokens_reserved = 0
+        self._reservations: Dict[str, int] = {}
+        # 已分配或已结束的任务，不再参与token分配
+        self._settled = set()
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self._started_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._path_weights = self._compute_path_weights(graph)
+
+    def _compute_path_weights(self, graph: TaskGraph) -> Dict[str, float]:
+        """计算每个任务到终点的最长路径权重（含自身）"""
+        successors: Dict[str, List[str]] = {name: [] for name in graph.order}
+        for name, deps in graph.dependencies.items():
+            for dep in deps:
+                successors[dep].append(name)
+
+        path_weights: Dict[str, float] = {}
+        for name in reversed(graph.order):
+            downstream = max((path_weights[s] for s in successors[name]), default=0.0)
+            path_weights[name] = self.weights.get(name, 0.0) + downstream
+        return path_weights
+
+    def elapsed(self) -> float:
+        return time.monotonic() - self._started_at
+
+    def remaining_time(self) -> Optional[float]:
+        if self.deadline_s is None:
+            return None
+        return self.deadline_s - self.elapsed()
+
+    def remaining_tokens(self) -> Optional[int]:
+        if self.max_tokens is None:
+            return None
+        with self._lock:
+            return self.max_tokens - self.tokens_used
+
+    def _available_tokens(self) -> int:
+        """扣除已用和其他任务预留的token后可分配的余额，调用方需持有锁"""
+        return max(0, self.max_tokens - self.tokens_used - self.tokens_reserved)
+
+    def _token_share(self, task_name: str) -> float:
+        """token分配比例，调用方需持有锁"""
+        pending_weight = sum(weight for name, weight in self.weights.items()
+                             if name not in self._settled or name == task_name)
+        if pending_weight <= 0:
+            return 1.0
+        return self.weights.get(task_name, 0.0) / pending_weight
+
+    def _share(self, task_name: str) -> float:
+        path_weight = self._path_weights.get(task_name, 0.0)
+        if path_weight <= 0:
+            return 1.0
+        return self.weights.get(task_name, 0.0) / path_weight
+
+    def allocate(self, task_name: str) -> Dict[str, Optional[float]]:
+        """
+        为即将执行的任务分配额度，每个任务只应分配一次
+
+        分配的token从余额中预留，直到任务结束时通过 consume 结算。
+
+        Returns:
+            Dict: time（秒）和 tokens，不限制的项为 None
+        """
+        share = self._share(task_name)
+        remaining_time = self.remaining_time()
+        tokens = None
+        if self.max_tokens is not None:
+            with self._lock:
+                tokens = int(self._available_tokens() * self._token_share(task_name))
+                self._settled.add(task_name)
+                self.tokens_reserved += tokens - self._reservations.get(task_name, 0)
+                self._reservations[task_name] = tokens
+        return {
+            'time': None if remaining_time is None else remaining_time * share,
+            'tokens': tokens
+        }
+
+    def exhausted(self) -> bool:
+        """时间或token预算是否已经用完"""
+        remaining_time = self.remaining_time()
+        remaining_tokens = self.remaining_tokens()
+        return ((remaining_time is not None and remaining_time <= 0)
+                or (remaining_tokens is not None and remaining_tokens <= 0))
+
+    def consume(self, tokens: int, task_name: Optional[str] = None):
+        """记录任务实际消耗的token，并释放该任务预留的额度"""
+        with self._lock:
+            self.tokens_used += tokens
+            if task_name is not None:
+                self._settled.add(task_name)
+                self.tokens_reserved -= self._reservations.pop(task_name, 0)
+
+    def record(self, task_name: str, action: str, allowance: Optional[Dict[str, Optional[float]]] = None):
+        """记录任务的预算处理结果（run/reduced/skipped/timeout/token_limit），allowance 为 None 时保留已记录的额度"""
+        with self._lock:
+            entry = self.stages.setdefault(task_name, {'time_allowance': None, 'token_allowance': None})
+            entry['action'] = action
+            if allowance is not None:
+                entry['time_allowance'] = None if allowance['time'] is None else round(allowance['time'], 1)
+                entry['token_allowance'] = allowance['tokens']
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'deadline_s': self.deadline_s,
+                'max_tokens': self.max_tokens,
+                'elapsed': round(self.elapsed(), 3),
+                'tokens_used': self.tokens_used,
+                'tokens_reserved': self.tokens_reserved,
+                'stages': {name: dict(entry) for name, entry in self.stages.items()}
+            }
+
+
+# 用于单独测试的函数
+def test_workflow_budget():
+    """测试工作流预算（无需API Key）"""
+    print("⏳ 测试工作流预算...")
+
+    try:
+        graph = TaskGraph({
+            'research_task': [],
+            'analysis_task': ['research_task'],
+            'writing_task': ['research_task', 'analysis_task'],
+            'editing_task': ['writing_task']
+        })
+        weights = {'research_task': 300, 'analysis_task': 200, 'writing_task': 400, 'editing_task': 250}
+        budget = WorkflowBudget(graph, weights, deadline_s=115, max_tokens=23000)
+
+        allowance = budget.allocate('research_task')
+        assert abs(allowance['time'] - 30) < 1
+        assert allowance['tokens'] == 6000
+        print(f"✅ 研究任务分配: {allowance['time']:.1f}s, {allowance['tokens']} tokens")
+
+        budget.consume(0, 'research_task')
+        assert budget.tokens_reserved == 0
+
+        budget.consume(23000)
+        assert budget.exhausted()
+        print("✅ token预算耗尽检测正常")
+
+        # 拆分后的子任务同时就绪，分配的token合计不能超过预算
+        fanout_graph = TaskGraph({
+            'research_task': [],
+            'research_task__a': ['research_task'],
+            'research_task__b': ['research_task'],
+            'research_task__c': ['research_task'],
+            'writing_task': ['research_task__a', 'research_task__b', 'research_task__c']
+        })
+        fanout_weights = {'research_task': 0, 'research_task__a': 300, 'research_task__b': 300,
+                          'research_task__c': 300, 'writing_task': 100}
+        fanout = WorkflowBudget(fanout_graph, fanout_weights, max_tokens=10000)
+        allocated = [fanout.allocate(name)['tokens']
+                     for name in ('research_task__a', 'research_task__b', 'research_task__c')]
+        assert sum(allocated) <= 10000 and len(set(allocated)) == 1
+        assert fanout.allocate('writing_task')['tokens'] > 0
+        fanout.consume(allocated[0] // 2, 'research_task__a')
+        assert fanout.remaining_tokens() == 10000 - allocated[0] // 2
+        assert fanout.tokens_reserved == sum(allocated[1:]) + fanout._reservations['writing_task']
+        print(f"✅ 并行子任务分配: {allocated}，合计不超过预算")
+
+        unlimited = WorkflowBudget(graph, weights)
+        assert unlimited.allocate('editing_task') == {'time': None, 'tokens': None}
+        assert not unlimited.exhausted()
+
+        print("\n🎉 工作流预算测试通过！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 测试失败: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # 设置日志
+    logging.basicConfig(level=logging.INFO)
+
+    # 运行测试
+    test_workflow_budget()
@@ -0,0 +1,218 @@
+"""
+工作流检查点 - 按 workflow_id 保存已完成任务的输出，失败或中断后从断点继续
+"""
+import json
+import time
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+
+class CheckpointStore:
+    """
+    检查点存储
+
+    workflows 表记录工作流参数和状态，stage_checkpoints 表记录每个已完成任务的输出。
+    同一进程内多线程共享一个连接（加锁），多进程之间依赖 SQLite 的 WAL 模式。
+    """
+
+    def __init__(self, path: Path, retention: Optional[float] = None):
+        """
+        Args:
+            path: SQLite 数据库文件路径
+            retention: 检查点保留时间（秒），超过后在初始化和每个工作流结束时清理，None 表示永久保留
+        """
+        self.logger = logging.getLogger(__name__)
+        self.path = Path(path)
+        self.retention = retention
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS workflows (
+                    workflow_id TEXT PRIMARY KEY,
+                    parameters TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS stage_checkpoints (
+                    workflow_id TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    raw TEXT NOT NULL,
+                    agent TEXT,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (workflow_id, stage)
+                )
+            """)
+            self._conn.commit()
+
+        if retention:
+            self.purge(older_than=retention)
+
+    def start_workflow(self, workflow_id: str, parameters: Dict[str, Any]):
+        """记录工作流开始（恢复执行时保留原有的创建时间）"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO workflows (workflow_id, parameters, status, error, created_at, updated_at) "
+                "VALUES (?, ?, 'running', NULL, ?, ?) "
+                "ON CONFLICT(workflow_id) DO UPDATE SET status = 'running', error = NULL, updated_at = ?",
+                (workflow_id, json.dumps(parameters, ensure_ascii=False), now, now, now)
+            )
+            self._conn.commit()
+
+    def finish_workflow(self, workflow_id: str, status: str, error: Optional[str] = None):
+        """更新工作流状态（completed/failed），并清理过期的检查点，长期运行的服务不会无限增长"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE workflows SET status = ?, error = ?, updated_at = ? WHERE workflow_id = ?",
+                (status, error, time.time(), workflow_id)
+            )
+            self._conn.commit()
+
+        if self.retention:
+            self.purge(older_than=self.retention)
+
+    def save_stage(self, workflow_id: str, stage: str, raw: str, agent: Optional[str] = None):
+        """保存已完成任务的输出"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO stage_checkpoints (workflow_id, stage, raw, agent, created_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (workflow_id, stage, raw, agent, time.time())
+            )
+            self._conn.execute(
+                "UPDATE workflows SET updated_at = ? WHERE workflow_id = ?", (time.time(), workflow_id)
+            )
+            self._conn.commit()
+
+    def load_stages(self, workflow_id: str) -> Dict[str, Dict[str, Any]]:
+        """返回工作流中已完成任务的输出，键为任务名"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT stage, raw, agent FROM stage_checkpoints WHERE workflow_id = ?", (workflow_id,)
+            ).fetchall()
+        return {stage: {'raw': raw, 'agent': agent} for stage, raw, agent in rows}
+
+    def get_workflow(self, workflow_id: str) -> Optional[Dict[str, Any]]:
+        """返回工作流参数和状态，不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT parameters, status, error, created_at, updated_at FROM workflows WHERE workflow_id = ?",
+                (workflow_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        parameters, status, error, created_at, updated_at = row
+        return {
+            'workflow_id': workflow_id,
+            'parameters': json.loads(parameters),
+            'status': status,
+            'error': error,
+            'created_at': created_at,
+            'updated_at': updated_at
+        }
+
+    def list_workflows(self, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        """按更新时间倒序列出工作流"""
+        query = "SELECT workflow_id FROM workflows"
+        params: List[Any] = []
+        if status is not None:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY updated_at DESC LIMIT ?"
+        params.append(limit)
+
+        with self._lock:
+            workflow_ids = [row[0] for row in self._conn.execute(query, params).fetchall()]
+        return [self.get_workflow(workflow_id) for workflow_id in workflow_ids]
+
+    def purge(self, older_than: float):
+        """删除超过指定时间（秒）未更新的工作流及其检查点"""
+        cutoff = time.time() - older_than
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM stage_checkpoints WHERE workflow_id IN "
+                "(SELECT workflow_id FROM workflows WHERE updated_at < ?)", (cutoff,)
+            )
+            self._conn.execute("DELETE FROM workflows WHERE updated_at < ?", (cutoff,))
+            self._conn.commit()
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+# 用于单独测试的函数
+def test_checkpoint_store():
+    """测试检查点存储（无需API Key）"""
+    import tempfile
+
+    print("📌 测试检查点存储...")
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = CheckpointStore(Path(tmp_dir) / 'checkpoints.sqlite3')
+
+            store.start_workflow('wf-1', {'topic': '人工智能', 'word_count': 800})
+            store.save_stage('wf-1', 'research_task', '研究报告', '内容研究专家')
+            store.save_stage('wf-1', 'analysis_task', '分析报告', '内容分析师')
+            store.finish_workflow('wf-1', 'failed', 'editing_task 超时')
+
+            workflow = store.get_workflow('wf-1')
+            assert workflow['status'] == 'failed'
+            assert workflow['parameters']['topic'] == '人工智能'
+            assert set(store.load_stages('wf-1')) == {'research_task', 'analysis_task'}
+            print(f"✅ 已保存 {len(store.load_stages('wf-1'))} 个任务检查点")
+
+            # 恢复执行时状态重置为 running，检查点保留
+            store.start_workflow('wf-1', {'topic': '人工智能', 'word_count': 800})
+            assert store.get_workflow('wf-1')['status'] == 'running'
+            assert len(store.load_stages('wf-1')) == 2
+            print("✅ 恢复执行保留已有检查点")
+
+            time.sleep(0.02)
+            store.purge(older_than=0.01)
+            assert store.get_workflow('wf-1') is None and not store.load_stages('wf-1')
+            print("✅ 过期检查点清理正常")
+
+            store.close()
+
+            # 工作流结束时清理过期的检查点
+            store = CheckpointStore(Path(tmp_dir) / 'retained.sqlite3', retention=0.05)
+            store.start_workflow('wf-old', {'topic': '旧主题'})
+            store.save_stage('wf-old', 'research_task', '旧研究报告')
+            store.finish_workflow('wf-old', 'failed', '中断')
+            time.sleep(0.1)
+            store.start_workflow('wf-new', {'topic': '新主题'})
+            store.finish_workflow('wf-new', 'completed')
+            assert store.get_workflow('wf-old') is None and not store.load_stages('wf-old')
+            assert store.get_workflow('wf-new')['status'] == 'completed'
+            print("✅ 工作流结束时清理过期检查点")
+            store.close()
+
+        print("\n🎉 检查点存储测试通过！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 测试失败: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # 设置日志
+    logging.basicConfig(level=logging.INFO)
+
+    # 运行测试
+    test_checkpoint_store()
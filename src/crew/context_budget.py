@@ -0,0 +1,242 @@
+"""
+上下文预算 - 将下游任务的上下文压缩到指定的token预算内
+
+采用本地抽取式压缩：把上游输出拆分为标题、列表项和句子，优先保留要点、
+数据和信息来源，按原顺序拼接，不调用LLM。
+"""
+import re
+import logging
+from typing import Dict, Any, List, Tuple, Iterable
+
+# 中日韩字符
+CJK_PATTERN = re.compile(r'[\u3400-\u9fff\uf900-\ufaff]')
+# 非中文的单词和符号
+WORD_PATTERN = re.compile(r'[A-Za-z0-9_]+|[^\sA-Za-z0-9_\u3400-\u9fff\uf900-\ufaff]')
+
+URL_PATTERN = re.compile(r'https?://\S+')
+NUMBER_PATTERN = re.compile(r'\d+(?:[.,]\d+)*\s*(?:%|％|万|亿|千|百|倍|年|月|日|元|美元|个|项|家|人|次)?')
+HEADING_PATTERN = re.compile(r'^\s*(#{1,6}\s|\d+[.、)]\s*|[一二三四五六七八九十]+[、.]|\*\*[^*]+\*\*\s*$)')
+BULLET_PATTERN = re.compile(r'^\s*([-*•·]|\d+[.)])\s+')
+KEY_POINT_PATTERN = re.compile(r'关键|核心|结论|总结|建议|发现|趋势|重要|要点|摘要|'
+                               r'key|conclusion|summary|finding|insight', re.IGNORECASE)
+# 过长的行按句子继续拆分
+SENTENCE_SPLIT_PATTERN = re.compile(r'(?<=[。！？；!?;])|(?<=\.)\s+')
+MAX_UNIT_CHARS = 200
+
+OMISSION_MARK = "……"
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的token数
+
+    不依赖具体模型的分词器：中文字符按1个token计，其余按单词/符号计并乘以1.3，
+    对 GPT 系列模型的中英文混合文本误差在可接受范围内。
+    """
+    if not text:
+        return 0
+    cjk = len(CJK_PATTERN.findall(text))
+    others = len(WORD_PATTERN.findall(text))
+    return cjk + int(others * 1.3 + 0.5)
+
+
+def split_units(text: str) -> List[str]:
+    """按行拆分文本，过长的行再按句子拆分"""
+    units = []
+    for line in text.splitlines():
+        line = line.rstrip()
+        if not line.strip():
+            continue
+        if len(line) <= MAX_UNIT_CHARS or HEADING_PATTERN.match(line):
+            units.append(line)
+            continue
+        units.extend(sentence for sentence in SENTENCE_SPLIT_PATTERN.split(line) if sentence and sentence.strip())
+    return units
+
+
+def score_unit(unit: str, index: int, total: int) -> float:
+    """为单个片段打分：标题、信息来源、数据和要点优先，靠前的片段略微优先"""
+    score = 1.0
+    if HEADING_PATTERN.match(unit):
+        score += 3.0
+    if URL_PATTERN.search(unit):
+        score += 3.0
+    numbers = len(NUMBER_PATTERN.findall(unit))
+    if numbers:
+        score += 2.0 + 0.5 * min(numbers - 1, 2)
+    if KEY_POINT_PATTERN.search(unit):
+        score += 1.5
+    if BULLET_PATTERN.match(unit):
+        score += 0.5
+    score += 1.0 - index / max(total, 1)
+    return score
+
+
+def compress_text(text: str, budget: int) -> Tuple[str, Dict[str, int]]:
+    """
+    将文本压缩到 budget 个token以内
+
+    Returns:
+        Tuple: (压缩后的文本, 包含 original_tokens/kept_tokens/dropped_tokens/dropped_units 的统计)
+    """
+    original_tokens = estimate_tokens(text)
+    if original_tokens <= budget:
+        return text, {'original_tokens': original_tokens, 'kept_tokens': original_tokens,
+                      'dropped_tokens': 0, 'dropped_units': 0}
+
+    units = split_units(text)
+    unit_tokens = [estimate_tokens(unit) for unit in units]
+    ranked = sorted(range(len(units)), key=lambda i: (-score_unit(units[i], i, len(units)), i))
+
+    # 为省略标记预留空间
+    mark_tokens = estimate_tokens(OMISSION_MARK)
+    selected = set()
+    used = 0
+    for i in ranked:
+        cost = unit_tokens[i] + mark_tokens
+        if used + cost <= budget:
+            selected.add(i)
+            used += cost
+
+    lines = []
+    previous = -1
+    for i in sorted(selected):
+        if i != previous + 1:
+            lines.append(OMISSION_MARK)
+        lines.append(units[i])
+        previous = i
+    if previous != len(units) - 1:
+        lines.append(OMISSION_MARK)
+
+    compressed = "\n".join(lines)
+    kept_tokens = estimate_tokens(compressed)
+    return compressed, {
+        'original_tokens': original_tokens,
+        'kept_tokens': kept_tokens,
+        'dropped_tokens': max(0, original_tokens - kept_tokens),
+        'dropped_units': len(units) - len(selected)
+    }
+
+
+def allocate_budget(sizes: Dict[str, int], budget: int) -> Dict[str, int]:
+    """
+    按上游输出大小分配预算
+
+    能完整放入平均份额的输出按实际大小分配，剩余预算在较长的输出之间平均分配。
+    """
+    allocation = {}
+    remaining = dict(sizes)
+    left = budget
+    while remaining:
+        share = left // len(remaining)
+        fits = {name: size for name, size in remaining.items() if size <= share}
+        if not fits:
+            for name in remaining:
+                allocation[name] = share
+            break
+        for name, size in fits.items():
+            allocation[name] = size
+            left -= size
+            del remaining[name]
+    return allocation
+
+
+def budget_context(sources: Dict[str, str],
+                   budget: int,
+                   keep: Iterable[str] = ()) -> Tuple[Dict[str, str], Dict[str, Any]]:
+    """
+    将多个上游输出压缩到总预算以内
+
+    Args:
+        sources: 上游任务名到输出文本的映射
+        budget: 上下文总token预算
+        keep: 不压缩的上游任务（如编辑任务所需的初稿），按实际大小占用预算，其余输出压缩到剩下的预算内；
+            keep 的输出本身超出预算时仍完整保留（其余输出只剩省略标记），超出的token数记为 keep_overflow
+
+    Returns:
+        Tuple: (上游任务名到压缩后文本的映射, 压缩统计)
+    """
+    keep = set(keep)
+    sizes = {name: estimate_tokens(text) for name, text in sources.items()}
+    kept_budget = sum(size for name, size in sizes.items() if name in keep)
+    allocation = allocate_budget(
+        {name: size for name, size in sizes.items() if name not in keep},
+        max(0, budget - kept_budget)
+    )
+
+    compressed = {}
+    details = {}
+    for name, text in sources.items():
+        if name in keep:
+            compressed[name] = text
+            details[name] = {'original_tokens': sizes[name], 'kept_tokens': sizes[name],
+                             'dropped_tokens': 0, 'dropped_units': 0}
+        else:
+            compressed[name], details[name] = compress_text(text, allocation[name])
+
+    original = sum(sizes.values())
+    kept = sum(detail['kept_tokens'] for detail in details.values())
+    return compressed, {
+        'budget': budget,
+        'original_tokens': original,
+        'kept_tokens': kept,
+        'dropped_tokens': max(0, original - kept),
+        'dropped_ratio': round(1 - kept / original, 3) if original else 0.0,
+        'keep_overflow': max(0, kept_budget - budget),
+        'sources': details
+    }
+
+
+# 用于单独测试的函数
+def test_context_budget():
+    """测试上下文预算（无需API Key）"""
+    print("✂️  测试上下文预算...")
+
+    try:
+        filler = "这一段是较为冗长的背景描述，主要用于铺垫，没有具体的数据或结论。" * 3
+        research = "\n".join(
+            ["# 研究报告", "## 关键发现"]
+            + [f"- 市场规模在2024年增长了{i * 3}%，达到{i * 10}亿元" for i in range(1, 6)]
+            + [filler for _ in range(40)]
+            + ["## 信息来源", "- https://www.gov.cn/report", "- https://www.nature.com/articles/ai"]
+        )
+        draft = "# 初稿标题\n\n正文内容。"
+
+        compressed, report = budget_context(
+            {'research_task': research, 'writing_task': draft}, budget=300, keep=['writing_task']
+        )
+
+        assert report['kept_tokens'] <= 300
+        assert compressed['writing_task'] == draft
+        assert 'https://www.gov.cn/report' in compressed['research_task']
+        assert '增长了3%' in compressed['research_task']
+        print(f"✅ {report['original_tokens']} -> {report['kept_tokens']} tokens，"
+              f"丢弃比例 {report['dropped_ratio']:.0%}")
+
+        # 超出预算的初稿仍完整保留，其余输出只剩省略标记
+        long_draft = "人工智能正在改变医疗行业。" * 500
+        kept, kept_report = budget_context(
+            {'research_task': research, 'writing_task': long_draft}, budget=5000, keep=['writing_task']
+        )
+        assert kept['writing_task'] == long_draft and kept['research_task'] == OMISSION_MARK
+        assert kept_report['keep_overflow'] == estimate_tokens(long_draft) - 5000
+        print(f"✅ 不压缩的输出超出预算时完整保留: 超出 {kept_report['keep_overflow']} tokens")
+
+        small, small_report = budget_context({'analysis_task': '简短分析'}, budget=300)
+        assert small['analysis_task'] == '简短分析' and small_report['dropped_tokens'] == 0
+        print("✅ 预算内的上下文保持不变")
+
+        print("\n🎉 上下文预算测试通过！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 测试失败: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # 设置日志
+    logging.basicConfig(level=logging.INFO)
+
+    # 运行测试
+    test_context_budget()
@@ -0,0 +1,110 @@
+"""
+事件路由 - 将 crewai 事件总线上的 LLM/工具事件按智能体分发给订阅者
+"""
+import threading
+import logging
+from collections import defaultdict
+from typing import Dict, Any, List, Callable, Optional
+
+from crewai.utilities.events import (
+    crewai_event_bus,
+    LLMCallStartedEvent,
+    LLMCallCompletedEvent,
+    LLMCallFailedEvent,
+    LLMStreamChunkEvent,
+    ToolUsageStartedEvent,
+    ToolUsageFinishedEvent,
+    ToolUsageErrorEvent,
+)
+
+from src.llm.resilience import call_abandoned, claim_stream_output
+
+# 订阅者回调，参数与 crewai 事件处理函数相同: (source, event)
+Listener = Callable[[Any, Any], None]
+
+# 需要路由的事件类型
+ROUTED_EVENTS = (
+    LLMCallStartedEvent,
+    LLMCallCompletedEvent,
+    LLMCallFailedEvent,
+    LLMStreamChunkEvent,
+    ToolUsageStartedEvent,
+    ToolUsageFinishedEvent,
+    ToolUsageErrorEvent,
+)
+
+
+class AgentEventRouter:
+    """
+    智能体事件路由器
+
+    crewai 的事件总线是全局的，并发执行的多个工作流会收到彼此的事件。
+    设置 max_execution_time 后智能体在独立线程中执行，无法按线程区分，
+    因此这里按事件所属智能体的 id 分发。每个 Crew 同一时间只执行一个任务，
+    所以订阅者收到的就是自己正在执行的任务的事件。
+    """
+
+    def __init__(self):
+        self.logger = logging.getLogger(__name__)
+        self._listeners: Dict[str, List[Listener]] = defaultdict(list)
+        self._lock = threading.Lock()
+        self._registered = False
+
+    def _register(self):
+        """在事件总线上注册处理函数（只注册一次）"""
+        with self._lock:
+            if self._registered:
+                return
+            for event_type in ROUTED_EVENTS:
+                crewai_event_bus.on(event_type)(self._dispatch)
+            self._registered = True
+
+    def _get_agent_id(self, source: Any, event: Any) -> Optional[str]:
+        """LLM事件自带 agent_id，工具事件从事件或 ToolUsage 对象上取智能体"""
+        agent_id = getattr(event, 'agent_id', None)
+        if agent_id is None:
+            agent = getattr(event, 'agent', None) or getattr(source, 'agent', None)
+            agent_id = getattr(agent, 'id', None)
+        return str(agent_id) if agent_id is not None else None
+
+    def _dispatch(self, source: Any, event: Any):
+        agent_id = self._get_agent_id(source, event)
+        if agent_id is None:
+            return
+
+        # 超时或对冲落败而被放弃的LLM调用仍在后台运行，它的事件不再转发；
+        # 流式输出一经转发，该次LLM调用失败后不再重试，避免订阅者收到重复的输出
+        if call_abandoned():
+            return
+        with self._lock:
+            listeners = list(self._listeners.get(agent_id, ()))
+        if listeners and isinstance(event, LLMStreamChunkEvent) and not claim_stream_output():
+            return
+
+        for listener in listeners:
+            try:
+                listener(source, event)
+            except Exception as e:
+                # 订阅者异常不能影响智能体执行
+                self.logger.warning(f"⚠️  事件处理失败: {type(event).__name__}, 错误: {str(e)}")
+
+    def subscribe(self, agent_id: Any, listener: Listener):
+        """订阅指定智能体的事件"""
+        self._register()
+        with self._lock:
+            self._listeners[str(agent_id)].append(listener)
+
+    def unsubscribe(self, agent_id: Any, listener: Listener):
+        """取消订阅"""
+        with self._lock:
+            listeners = self._listeners.get(str(agent_id))
+            if not listeners:
+                return
+            if listener in listeners:
+                listeners.remove(listener)
+            if not listeners:
+                del self._listeners[str(agent_id)]
+
+
+# 进程内共享的路由器
+event_router = AgentEventRouter()
@@ -0,0 +1,304 @@
+"""
+工作流历史 - 内存环形缓冲区 + 追加写入的 JSONL 日志（按大小轮转）
+"""
+import os
+import json
+import threading
+import logging
+from collections import deque, Counter, OrderedDict
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Iterator, Union
+
+from src.utils.locks import ReadWriteLock
+
+# action 到状态的映射，history(status=...) 按状态过滤
+ACTION_STATUS = {
+    'workflow_started': 'started',
+    'workflow_completed': 'completed',
+    'workflow_failed': 'failed',
+    # 合并到其他工作流的请求只有这一条记录
+    'workflow_coalesced': 'completed',
+    'stage_completed': 'completed',
+    'stage_failed': 'failed',
+}
+
+
+class WorkflowHistory:
+    """
+    工作流历史记录
+
+    内存中只保留最近 max_entries 条记录，全部记录追加写入 JSONL 日志，
+    日志超过 max_bytes 时轮转为 .1、.2 ...，最多保留 backup_count 个旧文件。
+    多个进程可以写同一个日志：大小检查、轮转和追加在日志旁的 .lock 文件锁内完成，读取时持有共享锁。
+    查询范围超出内存缓冲区时从日志文件读取。
+    """
+
+    def __init__(self,
+                 log_path: Optional[Union[str, Path]] = None,
+                 max_entries: int = 1000,
+                 max_bytes: int = 10 * 1024 * 1024,
+                 backup_count: int = 5):
+        """
+        Args:
+            log_path: JSONL 日志路径，为 None 时只保存在内存中
+            max_entries: 内存中保留的最大记录数
+            max_bytes: 单个日志文件的最大字节数
+            backup_count: 保留的轮转文件数量
+        """
+        self.logger = logging.getLogger(__name__)
+        self.log_path = Path(log_path) if log_path else None
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._entries = deque(maxlen=max_entries)
+        # 进行中的工作流的记录数，工作流结束后移除，保证内存不随运行时间增长
+        self._active_steps: Counter = Counter()
+        # 已结束计数的工作流，被取消后仍在线程中运行的部分再写入记录时不重新计数
+        self._ended: "OrderedDict[str, None]" = OrderedDict()
+        self._max_ended = max(max_entries, 1000)
+        self._evicted = False
+        self._lock = threading.Lock()
+
+        self._file_lock: Optional[ReadWriteLock] = None
+        if self.log_path is not None:
+            self.log_path.parent.mkdir(parents=True, exist_ok=True)
+            self._file_lock = ReadWriteLock(self.log_path.with_name(f"{self.log_path.name}.lock"))
+
+    def append(self, entry: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        追加一条记录
+
+        Args:
+            entry: 记录内容，需包含 workflow_id 和 action，缺少 timestamp 时自动补充
+
+        Returns:
+            Dict: 写入的记录，step 为该记录在所属工作流中的序号（从1开始）
+        """
+        entry = dict(entry)
+        entry.setdefault('timestamp', datetime.now(timezone.utc).isoformat())
+        entry.setdefault('status', ACTION_STATUS.get(entry.get('action')))
+        workflow_id = entry.get('workflow_id')
+
+        with self._lock:
+            if workflow_id is not None and workflow_id not in self._ended:
+                self._active_steps[workflow_id] += 1
+                entry['step'] = self._active_steps[workflow_id]
+                if entry.get('action') in ('workflow_completed', 'workflow_failed', 'workflow_coalesced'):
+                    del self._active_steps[workflow_id]
+
+            if len(self._entries) == self._entries.maxlen:
+                self._evicted = True
+            self._entries.append(entry)
+
+            if self.log_path is not None:
+                try:
+                    self._write(entry)
+                except OSError as e:
+                    # 日志写入失败不影响工作流
+                    self.logger.warning(f"⚠️  历史记录写入失败: {str(e)}")
+
+        return entry
+
+    def _write(self, entry: Dict[str, Any]):
+        line = json.dumps(entry, ensure_ascii=False, default=str) + '\n'
+        # 其他进程可能同时写入或轮转，检查大小、轮转和追加必须在同一次文件锁内完成
+        with self._file_lock.write():
+            if self.log_path.exists() and self.log_path.stat().st_size + len(line.encode('utf-8')) > self.max_bytes:
+                self._rotate()
+            with open(self.log_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def _rotate(self):
+        """workflow_history.jsonl -> .1 -> .2 ...，超出 backup_count 的最旧文件被删除"""
+        oldest = self._backup_path(self.backup_count)
+        if oldest.exists():
+            oldest.unlink()
+        for index in range(self.backup_count - 1, -1, -1):
+            source = self._backup_path(index)
+            if source.exists():
+                os.replace(source, self._backup_path(index + 1))
+
+    def _backup_path(self, index: int) -> Path:
+        return self.log_path if index == 0 else self.log_path.with_name(f"{self.log_path.name}.{index}")
+
+    def begin(self, workflow_id: str):
+        """开始（或恢复）工作流的步骤计数，与 end 成对使用"""
+        with self._lock:
+            self._ended.pop(workflow_id, None)
+
+    def end(self, workflow_id: str):
+        """
+        结束工作流的步骤计数
+
+        工作流完成或失败的记录会自动结束计数；被取消（如 acreate_content 的任务被取消）
+        的工作流没有这些记录，执行方在 finally 中调用，避免计数一直留在内存中。
+        之后同一工作流再写入的记录（取消后仍在后台线程中运行的部分）不带 step
+        """
+        with self._lock:
+            self._active_steps.pop(workflow_id, None)
+            self._ended[workflow_id] = None
+            while len(self._ended) > self._max_ended:
+                self._ended.popitem(last=False)
+
+    def steps(self, workflow_id: str) -> int:
+        """返回进行中的工作流已记录的步骤数（包括本次开始记录）"""
+        with self._lock:
+            return self._active_steps.get(workflow_id, 0)
+
+    def history(self,
+                since: Optional[Union[str, datetime]] = None,
+                status: Optional[str] = None,
+                limit: Optional[int] = 100,
+                workflow_id: Optional[str] = None,
+                action: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        查询历史记录
+
+        Args:
+            since: 只返回该时间之后的记录（datetime 或 ISO 格式字符串）
+            status: 按状态过滤（started/completed/failed）
+            limit: 最多返回的记录数，返回最新的记录，为 None 时不限制
+            workflow_id: 只返回指定工作流的记录
+            action: 按记录类型过滤（如 workflow_completed）
+
+        Returns:
+            List[Dict]: 按时间顺序排列的记录
+        """
+        if isinstance(since, datetime):
+            if since.tzinfo is None:
+                since = since.replace(tzinfo=timezone.utc)
+            since = since.isoformat()
+
+        def matches(entry):
+            return ((since is None or entry.get('timestamp', '') > since)
+                    and (status is None or entry.get('status') == status)
+                    and (workflow_id is None or entry.get('workflow_id') == workflow_id)
+                    and (action is None or entry.get('action') == action))
+
+        with self._lock:
+            buffered = list(self._entries)
+            evicted = self._evicted
+
+        results = deque(maxlen=limit)
+        for entry in buffered:
+            if matches(entry):
+                results.append(entry)
+
+        # 内存缓冲区已覆盖查询范围时无需读取日志
+        covered = (not evicted or (since is not None and buffered and buffered[0].get('timestamp', '') <= since)
+                   or (limit is not None and len(results) >= limit))
+        if covered or self.log_path is None:
+            return list(results)
+
+        results = deque(maxlen=limit)
+        for entry in self._read_log():
+            if matches(entry):
+                results.append(entry)
+        return list(results)
+
+    def _read_log(self) -> Iterator[Dict[str, Any]]:
+        """按时间顺序读取所有日志文件（从最旧的轮转文件开始），读取期间其他进程不会轮转"""
+        with self._file_lock.read():
+            paths = [self._backup_path(index) for index in range(self.backup_count, -1, -1)]
+            for path in paths:
+                try:
+                    with open(path, 'r', encoding='utf-8') as f:
+                        for line in f:
+                            try:
+                                yield json.loads(line)
+                            except json.JSONDecodeError:
+                                continue
+                except FileNotFoundError:
+                    continue
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            return iter(list(self._entries))
+
+
+# 用于单独测试的函数
+def test_workflow_history():
+    """测试工作流历史（无需API Key）"""
+    import sys
+    import tempfile
+    import subprocess
+
+    print("📜 测试工作流历史...")
+
+    try:
+        with tempfile.TemporaryDirectory() as temp_dir:
+            log_path = Path(temp_dir) / 'workflow_history.jsonl'
+            history = WorkflowHistory(log_path, max_entries=5, max_bytes=2000, backup_count=3)
+
+            for i in range(20):
+                workflow_id = f"wf-{i}"
+                history.append({'workflow_id': workflow_id, 'action': 'workflow_started'})
+                history.append({'workflow_id': workflow_id, 'action': 'stage_completed', 'stage': 'writing_task'})
+                assert history.steps(workflow_id) == 2
+                finished = history.append({'workflow_id': workflow_id,
+                                           'action': 'workflow_failed' if i % 4 == 0 else 'workflow_completed'})
+                assert finished['step'] == 3
+
+            assert len(history) == 5
+            assert not history._active_steps
+            print(f"✅ 内存中保留 {len(history)} 条记录")
+
+            rotated = sorted(p.name for p in Path(temp_dir).glob('*.jsonl*') if p.suffix != '.lock')
+            assert len(rotated) <= 4
+            print(f"✅ 日志文件: {rotated}")
+
+            failed = history.history(status='failed', action='workflow_failed', limit=None)
+            assert failed and all(entry['action'] == 'workflow_failed' for entry in failed)
+            print(f"✅ 从日志中查询到 {len(failed)} 条失败记录")
+
+            latest = history.history(limit=2)
+            assert [entry['workflow_id'] for entry in latest] == ['wf-19', 'wf-19']
+
+            # 被取消的工作流没有结束记录，由执行方结束计数
+            history.begin('wf-cancelled')
+            history.append({'workflow_id': 'wf-cancelled', 'action': 'workflow_started'})
+            history.end('wf-cancelled')
+            late = history.append({'workflow_id': 'wf-cancelled', 'action': 'stage_completed'})
+            assert not history._active_steps and 'step' not in late
+            history.begin('wf-cancelled')
+            assert history.append({'workflow_id': 'wf-cancelled', 'action': 'workflow_started'})['step'] == 1
+            history.end('wf-cancelled')
+            print("✅ 被取消的工作流不残留步骤计数")
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            # 多个进程写同一个日志并频繁轮转，记录不丢失也不重复
+            log_path = Path(temp_dir) / 'workflow_history.jsonl'
+            script = (
+                "import sys\n"
+                "from src.crew.history import WorkflowHistory\n"
+                "history = WorkflowHistory(sys.argv[1], max_bytes=3000, backup_count=100)\n"
+                "for i in range(100):\n"
+                "    history.append({'workflow_id': f'{sys.argv[2]}-{i}', 'action': 'workflow_started'})\n"
+            )
+            env = {**os.environ, 'PYTHONPATH': str(Path(__file__).resolve().parents[2])}
+            writers = [subprocess.Popen([sys.executable, '-c', script, str(log_path), f'p{n}'], env=env)
+                       for n in range(4)]
+            for writer in writers:
+                assert writer.wait() == 0
+            reader = WorkflowHistory(log_path, max_bytes=3000, backup_count=100)
+            ids = [entry['workflow_id'] for entry in reader._read_log()]
+            assert len(ids) == 400 and len(set(ids)) == 400
+            print(f"✅ 4个进程并发写入并轮转: {len(list(Path(temp_dir).glob('*.jsonl*'))) - 1} 个日志文件，400 条记录完整")
+
+        print("\n🎉 工作流历史测试通过！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 测试失败: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # 设置日志
+    logging.basicConfig(level=logging.INFO)
+
+    # 运行测试
+    test_workflow_history()
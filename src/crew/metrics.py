@@ -0,0 +1,166 @@
+"""
+任务指标 - 记录每个任务的耗时、LLM调用、token用量和工具调用
+"""
+import json
+import time
+import logging
+from typing import Dict, Any, List, Optional
+
+from crewai.utilities.events import (
+    LLMCallStartedEvent,
+    LLMCallCompletedEvent,
+    LLMCallFailedEvent,
+    ToolUsageFinishedEvent,
+    ToolUsageErrorEvent,
+)
+
+logger = logging.getLogger(__name__)
+
+# 从 Crew.usage_metrics 中统计的token字段
+USAGE_FIELDS = ('prompt_tokens', 'completion_tokens', 'cached_prompt_tokens', 'total_tokens')
+# LLM包装器（src.llm）的计数，在指标中以 llm_ 前缀输出
+LLM_COUNTER_FIELDS = ('cache_hits', 'cache_misses', 'retries', 'timeouts', 'hedges', 'hedge_wins',
+                      'fallbacks', 'failovers')
+
+
+class StageMetrics:
+    """
+    单个任务的执行指标
+
+    LLM和工具数据来自事件路由器转发的该任务智能体的事件，
+    执行步数来自智能体的 step_callback，token用量取 Crew.usage_metrics 在执行前后的差值
+    （智能体池复用的智能体上 token 计数是累计的）。
+    """
+
+    def __init__(self, stage: str, agent: Optional[str] = None):
+        self.stage = stage
+        self.agent = agent
+        self.status = 'pending'
+        self.cached = False
+        self.queue_wait = 0.0
+        self.wall_time = 0.0
+        self.llm_calls = 0
+        self.llm_failures = 0
+        self.llm_time = 0.0
+        self.steps = 0
+        self.tokens = {field: 0 for field in USAGE_FIELDS}
+        self.tools: List[Dict[str, Any]] = []
+        self._started_at: Optional[float] = None
+        self._llm_started_at: Optional[float] = None
+        self._usage_before: Dict[str, int] = {}
+        self.llm_counters = {field: 0 for field in LLM_COUNTER_FIELDS}
+        self._counters_before: Dict[str, int] = {}
+
+    def start(self, ready_at: Optional[float] = None):
+        """任务开始执行，ready_at 为依赖全部完成的时间（time.perf_counter）"""
+        self._started_at = time.perf_counter()
+        self.status = 'running'
+        if ready_at is not None:
+            self.queue_wait = max(0.0, self._started_at - ready_at)
+
+    def finish(self, status: str = 'completed', cached: bool = False):
+        """任务结束"""
+        if self._started_at is not None:
+            self.wall_time = time.perf_counter() - self._started_at
+        self.status = status
+        self.cached = cached
+
+    def begin_usage(self, usage: Any):
+        """记录执行前的 Crew.usage_metrics"""
+        self._usage_before = {field: getattr(usage, field, 0) or 0 for field in USAGE_FIELDS}
+
+    def end_usage(self, usage: Any):
+        """累加执行前后 Crew.usage_metrics 的差值"""
+        for field in USAGE_FIELDS:
+            delta = (getattr(usage, field, 0) or 0) - self._usage_before.get(field, 0)
+            self.tokens[field] += max(0, delta)
+
+    def begin_llm_counters(self, stats: Optional[Dict[str, int]]):
+        """记录执行前LLM包装器的计数（DelegatingLLM.collect_stats）"""
+        self._counters_before = dict(stats or {})
+
+    def end_llm_counters(self, stats: Optional[Dict[str, int]]):
+        """累加执行前后LLM包装器计数的差值"""
+        for field in self.llm_counters:
+            delta = (stats or {}).get(field, 0) - self._counters_before.get(field, 0)
+            self.llm_counters[field] += max(0, delta)
+
+    def on_step(self, step: Any):
+        """智能体每完成一步（思考/工具调用/最终答案）调用一次"""
+        self.steps += 1
+
+    def on_event(self, source: Any, event: Any):
+        """处理事件路由器转发的LLM和工具事件"""
+        if isinstance(event, LLMCallStartedEvent):
+            self.llm_calls += 1
+            self._llm_started_at = time.perf_counter()
+        elif isinstance(event, (LLMCallCompletedEvent, LLMCallFailedEvent)):
+            if self._llm_started_at is not None:
+                self.llm_time += time.perf_counter() - self._llm_started_at
+                self._llm_started_at = None
+            if isinstance(event, LLMCallFailedEvent):
+                self.llm_failures += 1
+        elif isinstance(event, ToolUsageFinishedEvent):
+            self.tools.append({
+                'tool': event.tool_name,
+                'duration': round((event.finished_at - event.started_at).total_seconds(), 3),
+                'from_cache': event.from_cache,
+                'error': None
+            })
+        elif isinstance(event, ToolUsageErrorEvent):
+            self.tools.append({
+                'tool': event.tool_name,
+                'duration': None,
+                'from_cache': False,
+                'error': str(event.error)
+            })
+
+    @property
+    def retries(self) -> int:
+        """失败后重试的LLM调用（智能体重试和 ResilientLLM 重试）和工具调用次数"""
+        return (self.llm_failures + self.llm_counters['retries']
+                + sum(1 for tool in self.tools if tool['error'] is not None))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'stage': self.stage,
+            'agent': self.agent,
+            'status': self.status,
+            'cached': self.cached,
+            'queue_wait': round(self.queue_wait, 3),
+            'wall_time': round(self.wall_time, 3),
+            'llm_calls': self.llm_calls,
+            'llm_failures': self.llm_failures,
+            'llm_time': round(self.llm_time, 3),
+            'steps': self.steps,
+            'prompt_tokens': self.tokens['prompt_tokens'],
+            'completion_tokens': self.tokens['completion_tokens'],
+            'cached_prompt_tokens': self.tokens['cached_prompt_tokens'],
+            'total_tokens': self.tokens['total_tokens'],
+            **{f'llm_{field}': value for field, value in self.llm_counters.items()},
+            'tool_calls': len(self.tools),
+            'tool_time': round(sum(tool['duration'] or 0 for tool in self.tools), 3),
+            'tools': list(self.tools),
+            'retries': self.retries
+        }
+
+
+def log_stage_metrics(metrics: StageMetrics, **context):
+    """以单行JSON输出任务指标，context 中的字段（如主题）一并记录"""
+    record = {'event': 'stage_metrics', **context, **metrics.to_dict()}
+    logger.info(json.dumps(record, ensure_ascii=False, default=str))
+
+
+def summarize_stages(stages: Dict[str, StageMetrics]) -> Dict[str, Any]:
+    """汇总所有任务的指标"""
+    records = [metrics.to_dict() for metrics in stages.values()]
+    return {
+        'llm_calls': sum(r['llm_calls'] for r in records),
+        'prompt_tokens': sum(r['prompt_tokens'] for r in records),
+        'completion_tokens': sum(r['completion_tokens'] for r in records),
+        'total_tokens': sum(r['total_tokens'] for r in records),
+        **{f'llm_{field}': sum(r[f'llm_{field}'] for r in records) for field in LLM_COUNTER_FIELDS},
+        'tool_calls': sum(r['tool_calls'] for r in records),
+        'retries': sum(r['retries'] for r in records),
+        'slowest_stage': max(records, key=lambda r: r['wall_time'])['stage'] if records else None
+    }
@@ -0,0 +1,154 @@
+"""
+提示词模板 - 在加载配置时预编译占位符，渲染时对每个字符串只做一次拼接
+"""
+import re
+import logging
+from typing import Dict, Any, List, Iterable, Set
+
+# 配置中支持的占位符形如 {topic}
+PLACEHOLDER_PATTERN = re.compile(r'\{(\w+)\}')
+
+# 工作流提供的模板变量
+TEMPLATE_VARIABLES = ('topic', 'content_type', 'target_audience', 'word_count')
+
+
+class StringTemplate:
+    """单个字符串的渲染计划：字面量片段和变量名交替排列"""
+
+    __slots__ = ('segments', 'fields')
+
+    def __init__(self, text: str):
+        self.segments = []
+        self.fields = []
+        position = 0
+        for match in PLACEHOLDER_PATTERN.finditer(text):
+            self.segments.append((True, text[position:match.start()]))
+            self.segments.append((False, match.group(1)))
+            self.fields.append(match.group(1))
+            position = match.end()
+        self.segments.append((True, text[position:]))
+
+    def render(self, variables: Dict[str, Any]) -> str:
+        return ''.join(
+            segment if is_literal else str(variables[segment])
+            for is_literal, segment in self.segments
+        )
+
+
+class ConfigTemplate:
+    """
+    配置模板 - 预编译整个配置结构
+
+    不含占位符的字符串和其他值在渲染时直接复用，只有含占位符的字符串需要拼接。
+    """
+
+    def __init__(self, config: Any, known_variables: Iterable[str] = TEMPLATE_VARIABLES, name: str = "config"):
+        """
+        Args:
+            config: 配置结构（dict/list/str/标量）
+            known_variables: 允许出现的占位符名称
+            name: 配置名称，用于错误提示
+
+        Raises:
+            ValueError: 配置中存在未知占位符
+        """
+        self.name = name
+        self.fields: Set[str] = set()
+        unknown: List[str] = []
+        self._plan = self._compile(config, set(known_variables), name, unknown)
+
+        if unknown:
+            raise ValueError(f"配置中存在未知占位符: {', '.join(unknown)}")
+
+    def _compile(self, obj: Any, known: Set[str], path: str, unknown: List[str]):
+        if isinstance(obj, str):
+            if '{' not in obj:
+                return obj
+            template = StringTemplate(obj)
+            if not template.fields:
+                return obj
+            for field in template.fields:
+                if field not in known:
+                    unknown.append(f"{path}: {{{field}}}")
+            self.fields.update(template.fields)
+            return template
+        elif isinstance(obj, dict):
+            return {k: self._compile(v, known, f"{path}.{k}", unknown) for k, v in obj.items()}
+        elif isinstance(obj, list):
+            return [self._compile(item, known, f"{path}[{i}]", unknown) for i, item in enumerate(obj)]
+        else:
+            return obj
+
+    def render(self, variables: Dict[str, Any]) -> Any:
+        """按预编译计划渲染配置，返回新的配置结构"""
+        return self._render(self._plan, variables)
+
+    def _render(self, plan: Any, variables: Dict[str, Any]) -> Any:
+        if isinstance(plan, StringTemplate):
+            return plan.render(variables)
+        elif isinstance(plan, dict):
+            return {k: self._render(v, variables) for k, v in plan.items()}
+        elif isinstance(plan, list):
+            return [self._render(item, variables) for item in plan]
+        else:
+            return plan
+
+
+def compile_configs(configs: Dict[str, Dict[str, Any]],
+                    source: str,
+                    known_variables: Iterable[str] = TEMPLATE_VARIABLES) -> Dict[str, ConfigTemplate]:
+    """
+    编译一组配置（如 agents.yaml 中的所有智能体）
+
+    Args:
+        configs: 名称到配置的映射
+        source: 配置来源，用于错误提示
+        known_variables: 允许出现的占位符名称
+
+    Returns:
+        Dict: 名称到配置模板的映射
+    """
+    return {
+        name: ConfigTemplate(config, known_variables, name=f"{source} {name}")
+        for name, config in configs.items()
+    }
+
+
+# 用于单独测试的函数
+def test_prompt_templates():
+    """测试提示词模板（无需API Key）"""
+    print("🧩 测试提示词模板...")
+
+    try:
+        config = {
+            'role': '内容研究专家',
+            'goal': '收集关于{topic}的信息，字数{word_count}',
+            'tools': ['SerperDevTool'],
+            'max_iter': 3
+        }
+        template = ConfigTemplate(config, name='researcher')
+        rendered = template.render({'topic': 'AI', 'word_count': 800})
+        assert rendered['goal'] == '收集关于AI的信息，字数800'
+        assert rendered['role'] is config['role']
+        print(f"✅ 渲染结果: {rendered['goal']}")
+
+        try:
+            ConfigTemplate({'goal': '关于{topc}'}, name='typo')
+            raise AssertionError("未知占位符未被检测")
+        except ValueError as e:
+            print(f"✅ 未知占位符检测: {e}")
+
+        print("\n🎉 提示词模板测试通过！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 测试失败: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # 设置日志
+    logging.basicConfig(level=logging.INFO)
+
+    # 运行测试
+    test_prompt_templates()
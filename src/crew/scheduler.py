@@ -0,0 +1,257 @@
+"""
+任务调度器 - 根据 tasks.yaml 中的 context 依赖构建 DAG 并并发执行
+"""
+import time
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Dict, Any, List, Callable, Awaitable
+
+
+class TaskGraph:
+    """任务依赖图 - 节点为任务名，边为 context 依赖"""
+
+    def __init__(self, dependencies: Dict[str, List[str]]):
+        """
+        Args:
+            dependencies: 任务名到其依赖任务名列表的映射（保持配置中的顺序）
+        """
+        self.dependencies = {name: list(deps or []) for name, deps in dependencies.items()}
+        self._validate()
+        self.order = self._topological_order()
+
+    @classmethod
+    def from_tasks_config(cls, tasks_config: Dict[str, Any]) -> 'TaskGraph':
+        """从任务配置构建依赖图"""
+        return cls({
+            name: config.get('context') or []
+            for name, config in tasks_config.items()
+        })
+
+    def _validate(self):
+        """检查依赖是否都指向已定义的任务"""
+        for name, deps in self.dependencies.items():
+            for dep in deps:
+                if dep not in self.dependencies:
+                    raise ValueError(f"任务 {name} 依赖了未定义的任务: {dep}")
+                if dep == name:
+                    raise ValueError(f"任务 {name} 不能依赖自身")
+
+    def _topological_order(self) -> List[str]:
+        """按依赖关系排序，同层任务保持配置中的顺序"""
+        remaining = {name: set(deps) for name, deps in self.dependencies.items()}
+        order = []
+
+        while remaining:
+            ready = [name for name, deps in remaining.items() if not deps]
+            if not ready:
+                raise ValueError(f"任务依赖存在循环: {', '.join(remaining)}")
+            for name in ready:
+                order.append(name)
+                del remaining[name]
+            for deps in remaining.values():
+                deps.difference_update(ready)
+
+        return order
+
+    def sinks(self) -> List[str]:
+        """没有被其他任务依赖的任务（按拓扑顺序）"""
+        depended = {dep for deps in self.dependencies.values() for dep in deps}
+        return [name for name in self.order if name not in depended]
+
+    @property
+    def final_task(self) -> str:
+        """工作流的最终任务，多个终点时取拓扑顺序中的最后一个"""
+        return self.sinks()[-1]
+
+
+class DagExecutor:
+    """DAG 执行器 - 每个任务在其依赖全部完成后立即启动"""
+
+    def __init__(self, graph: TaskGraph, max_workers: int = 4):
+        self.graph = graph
+        self.max_workers = max_workers
+        self.logger = logging.getLogger(__name__)
+        # 每个任务依赖全部完成、进入待执行状态的时间（time.perf_counter），用于统计排队等待
+        self.ready_at: Dict[str, float] = {}
+
+    def _initial_state(self):
+        """返回每个任务尚未完成的依赖集合"""
+        return {name: set(deps) for name, deps in self.graph.dependencies.items()}
+
+    def _upstream(self, name: str, outputs: Dict[str, Any]) -> Dict[str, Any]:
+        return {dep: outputs[dep] for dep in self.graph.dependencies[name]}
+
+    def run(self, run_node: Callable[[str, Dict[str, Any]], Any]) -> Dict[str, Any]:
+        """
+        在线程池中执行所有任务
+
+        Args:
+            run_node: 执行单个任务的函数，参数为任务名和上游任务输出
+
+        Returns:
+            Dict: 任务名到输出的映射
+        """
+        outputs = {}
+        waiting = self._initial_state()
+        error = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="dag-task") as pool:
+            running = {}
+
+            def submit_ready():
+                for name in [n for n in self.graph.order if n in waiting and not waiting[n]]:
+                    del waiting[name]
+                    self.ready_at[name] = time.perf_counter()
+                    running[pool.submit(run_node, name, self._upstream(name, outputs))] = name
+
+            submit_ready()
+            while running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        outputs[name] = future.result()
+                    except Exception as e:
+                        self.logger.error(f"❌ 任务 {name} 执行失败: {str(e)}")
+                        error = error or e
+                        continue
+                    for deps in waiting.values():
+                        deps.discard(name)
+
+                # 出现失败后不再启动新任务，等待已启动的任务结束
+                if error is None:
+                    submit_ready()
+
+        if error is not None:
+            raise error
+
+        return outputs
+
+    async def arun(self, run_node: Callable[[str, Dict[str, Any]], Awaitable[Any]]) -> Dict[str, Any]:
+        """
+        在当前事件循环中执行所有任务
+
+        出现失败或调用方取消时，取消其余已启动的任务并等待其结束后再返回，不留下孤立的任务。
+
+        Args:
+            run_node: 执行单个任务的协程函数，参数为任务名和上游任务输出
+
+        Returns:
+            Dict: 任务名到输出的映射
+        """
+        outputs = {}
+        waiting = self._initial_state()
+        error = None
+        running = {}
+
+        def submit_ready():
+            for name in [n for n in self.graph.order if n in waiting and not waiting[n]]:
+                del waiting[name]
+                self.ready_at[name] = time.perf_counter()
+                running[asyncio.ensure_future(run_node(name, self._upstream(name, outputs)))] = name
+
+        try:
+            submit_ready()
+            while running and error is None:
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        outputs[name] = future.result()
+                    except Exception as e:
+                        self.logger.error(f"❌ 任务 {name} 执行失败: {str(e)}")
+                        error = error or e
+                        continue
+                    for deps in waiting.values():
+                        deps.discard(name)
+
+                if error is None:
+                    submit_ready()
+        finally:
+            for future in running:
+                future.cancel()
+            if running:
+                await asyncio.gather(*running, return_exceptions=True)
+
+        if error is not None:
+            raise error
+
+        return outputs
+
+
+# 用于单独测试的函数
+def test_dag_executor():
+    """测试DAG调度器（无需API Key）"""
+    import time
+
+    print("🔀 测试DAG调度器...")
+
+    try:
+        graph = TaskGraph({
+            'research_a': [],
+            'research_b': [],
+            'analysis': ['research_a', 'research_b'],
+            'writing_a': ['analysis'],
+            'writing_b': ['analysis'],
+            'editing': ['writing_a', 'writing_b'],
+        })
+        print(f"📋 拓扑顺序: {' -> '.join(graph.order)}")
+        print(f"🏁 最终任务: {graph.final_task}")
+
+        def run_node(name, upstream):
+            time.sleep(0.1)
+            return f"{name}({', '.join(upstream.values())})"
+
+        start = time.perf_counter()
+        outputs = DagExecutor(graph, max_workers=4).run(run_node)
+        elapsed = time.perf_counter() - start
+
+        assert outputs['editing'].startswith('editing(')
+        # 关键路径为4层，串行执行需要6个任务的时间
+        print(f"⏱️  执行耗时: {elapsed:.2f}s（串行约0.60s）")
+
+        # 异步执行时一个任务失败，其余已启动的任务被取消并等待结束
+        cancelled = []
+
+        async def arun_node(name, upstream):
+            if name == 'research_a':
+                raise RuntimeError("研究失败")
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(name)
+                raise
+
+        async def arun_failing():
+            try:
+                await DagExecutor(graph).arun(arun_node)
+                raise AssertionError("任务失败未被抛出")
+            except RuntimeError as e:
+                assert str(e) == "研究失败"
+            # 返回前已等待被取消的任务结束
+            assert cancelled == ['research_b']
+
+        asyncio.run(asyncio.wait_for(arun_failing(), timeout=5))
+        print("✅ 异步执行失败时取消其余任务")
+
+        try:
+            TaskGraph({'a': ['b'], 'b': ['a']})
+            raise AssertionError("循环依赖未被检测")
+        except ValueError as e:
+            print(f"✅ 循环依赖检测: {e}")
+
+        print("\n🎉 DAG调度器测试通过！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 测试失败: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # 设置日志
+    logging.basicConfig(level=logging.INFO)
+
+    # 运行测试
+    test_dag_executor()
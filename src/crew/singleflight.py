@@ -0,0 +1,273 @@
+"""
+请求合并（single-flight）- 相同参数的并发请求只执行一次，所有调用方共享结果
+
+多个用户或客户端几乎同时请求同一主题时，后到的请求挂到正在执行的工作流上等待，
+不再各自完整执行一遍；可选的新鲜度窗口让刚完成之后到达的相同请求直接复用结果。
+只在进程内生效，同步调用（线程）和异步调用（事件循环）可以互相合并。
+"""
+import copy
+import time
+import asyncio
+import threading
+import logging
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple
+
+logger = logging.getLogger(__name__)
+
+# acquire 返回的角色：leader 负责执行，in_flight 等待执行中的请求，recent 复用新鲜度窗口内的结果
+FLIGHT_ROLES = ('leader', 'in_flight', 'recent')
+
+
+class Flight:
+    """
+    一次正在执行（或刚完成）的请求
+
+    结果通过 concurrent.futures.Future 传递，线程和事件循环都可以等待；
+    执行者通过 publish 推送的事件会转发给所有订阅者（流式调用方）。
+    """
+
+    def __init__(self, key: str, owner: Optional[str] = None):
+        self.key = key
+        self.owner = owner
+        self.future: Future = Future()
+        self.started_at = time.time()
+        self.completed_at: Optional[float] = None
+        self.followers = 0
+        self._listeners: List[Callable[[Any], None]] = []
+        self._lock = threading.Lock()
+
+    def subscribe(self, listener: Callable[[Any], None]):
+        """订阅执行者之后推送的事件"""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def unsubscribe(self, listener: Callable[[Any], None]):
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def publish(self, event: Any):
+        """向所有订阅者推送事件，单个订阅者出错不影响其他订阅者"""
+        with self._lock:
+            listeners = list(self._listeners)
+        for listener in listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                logger.warning(f"⚠️  合并请求的事件推送失败: {str(e)}")
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        """等待并返回结果的副本，执行失败时抛出相同的异常"""
+        return copy.deepcopy(self.future.result(timeout))
+
+    async def aresult(self) -> Any:
+        """result 的异步版本"""
+        return copy.deepcopy(await asyncio.wrap_future(self.future))
+
+
+class SingleFlight:
+    """
+    按键合并并发请求
+
+    同一个键同时只有一个执行者，其余调用方等待其结果；执行成功后结果在
+    freshness_s 秒内仍可被相同的请求直接复用（0 表示只合并执行中的请求）。
+    """
+
+    def __init__(self, freshness_s: float = 0, max_recent: int = 256):
+        """
+        Args:
+            freshness_s: 完成后结果可复用的时间（秒）
+            max_recent: 新鲜度窗口内最多保留的结果数量
+        """
+        self.freshness_s = freshness_s
+        self.max_recent = max_recent
+        self._in_flight: Dict[str, Flight] = {}
+        self._recent: "OrderedDict[str, Flight]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {'leaders': 0, 'in_flight': 0, 'recent': 0}
+
+    def acquire(self, key: str, owner: Optional[str] = None,
+                listener: Optional[Callable[[Any], None]] = None) -> Tuple[Flight, str]:
+        """
+        加入或发起一次请求
+
+        Args:
+            key: 请求键，相同的键视为相同请求
+            owner: 执行者标识（如工作流ID），仅在成为执行者时记录
+            listener: 订阅执行者推送的事件（角色为 leader 或 in_flight 时），
+                在加入请求的同时订阅，执行者此后推送的事件不会遗漏；调用方结束时负责 unsubscribe
+
+        Returns:
+            Tuple[Flight, str]: 请求和角色；角色为 leader 时调用方必须执行并调用 complete 或 fail
+        """
+        now = time.time()
+        with self._lock:
+            flight = self._in_flight.get(key)
+            if flight is not None:
+                flight.followers += 1
+                if listener is not None:
+                    flight.subscribe(listener)
+                self.stats['in_flight'] += 1
+                return flight, 'in_flight'
+
+            flight = self._recent.get(key)
+            if flight is not None:
+                if now - flight.completed_at <= self.freshness_s:
+                    self.stats['recent'] += 1
+                    return flight, 'recent'
+                del self._recent[key]
+
+            flight = Flight(key, owner)
+            if listener is not None:
+                flight.subscribe(listener)
+            self._in_flight[key] = flight
+            self.stats['leaders'] += 1
+            return flight, 'leader'
+
+    def complete(self, flight: Flight, result: Any):
+        """执行成功，唤醒等待者并在新鲜度窗口内保留结果"""
+        flight.completed_at = time.time()
+        with self._lock:
+            self._in_flight.pop(flight.key, None)
+            if self.freshness_s > 0:
+                self._recent[flight.key] = flight
+                self._recent.move_to_end(flight.key)
+                while len(self._recent) > self.max_recent:
+                    self._recent.popitem(last=False)
+        flight.future.set_result(result)
+
+    def fail(self, flight: Flight, error: BaseException):
+        """执行失败，等待者收到相同的异常，失败结果不保留"""
+        flight.completed_at = time.time()
+        with self._lock:
+            self._in_flight.pop(flight.key, None)
+        flight.future.set_exception(error)
+
+    def do(self, key: str, fn: Callable[[], Any], owner: Optional[str] = None) -> Tuple[Any, Flight, str]:
+        """
+        同步执行或等待相同请求的结果
+
+        Returns:
+            Tuple: (结果, 请求, 角色)，非执行者得到的是结果的副本
+        """
+        flight, role = self.acquire(key, owner)
+        if role != 'leader':
+            return flight.result(), flight, role
+        return self._lead(flight, fn), flight, role
+
+    async def ado(self, key: str, fn: Callable[[], Awaitable[Any]],
+                  owner: Optional[str] = None) -> Tuple[Any, Flight, str]:
+        """do 的异步版本，fn 返回协程"""
+        flight, role = self.acquire(key, owner)
+        if role != 'leader':
+            return await flight.aresult(), flight, role
+        try:
+            result = await fn()
+        except BaseException as e:
+            # 包括取消在内的任何退出都要结束请求，否则等待者会一直阻塞
+            self.fail(flight, e)
+            raise
+        self.complete(flight, result)
+        return result, flight, role
+
+    def _lead(self, flight: Flight, fn: Callable[[], Any]) -> Any:
+        try:
+            result = fn()
+        except BaseException as e:
+            self.fail(flight, e)
+            raise
+        self.complete(flight, result)
+        return result
+
+    def in_flight(self) -> int:
+        """正在执行的请求数量"""
+        with self._lock:
+            return len(self._in_flight)
+
+
+# 用于单独测试的函数
+def test_single_flight():
+    """测试请求合并（无需API Key）"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    print("🔗 测试请求合并...")
+
+    try:
+        flights = SingleFlight(freshness_s=0.2)
+        calls = []
+
+        def work():
+            calls.append(1)
+            time.sleep(0.1)
+            return {'content': '结果'}
+
+        with ThreadPoolExecutor(max_workers=5) as pool:
+            outcomes = list(pool.map(lambda _: flights.do('same', work), range(5)))
+        assert len(calls) == 1
+        assert sorted(role for _, _, role in outcomes).count('leader') == 1
+        assert all(result == {'content': '结果'} for result, _, _ in outcomes)
+        print(f"✅ 5个并发请求只执行1次: {flights.stats}")
+
+        _, _, role = flights.do('same', work)
+        assert role == 'recent' and len(calls) == 1
+        print("✅ 新鲜度窗口内复用结果")
+
+        time.sleep(0.25)
+        _, _, role = flights.do('same', work)
+        assert role == 'leader' and len(calls) == 2
+        print("✅ 新鲜度窗口过后重新执行")
+
+        def broken():
+            time.sleep(0.05)
+            raise RuntimeError("执行失败")
+
+        errors = []
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            for future in [pool.submit(flights.do, 'broken', broken) for _ in range(3)]:
+                try:
+                    future.result()
+                except RuntimeError as e:
+                    errors.append(str(e))
+        assert errors == ["执行失败"] * 3
+        assert flights.acquire('broken')[1] == 'leader'
+        print("✅ 失败结果传给所有等待者且不被复用")
+
+        # 加入时即订阅：执行者在等待者开始读取之前推送的事件也不会丢失
+        followed = []
+        leader, _ = flights.acquire('stream', owner='leader')
+        flight, role = flights.acquire('stream', listener=followed.append)
+        assert role == 'in_flight' and flight is leader
+        leader.publish({'type': 'token', 'chunk': '第一段'})
+        leader.publish({'type': 'token', 'chunk': '第二段'})
+        flights.complete(leader, 'done')
+        assert [event['chunk'] for event in followed] == ['第一段', '第二段']
+        print("✅ 合并请求在加入时订阅，不遗漏执行者先推送的事件")
+
+        async def run_async():
+            async def awork():
+                calls.append(1)
+                await asyncio.sleep(0.05)
+                return 'async'
+            return await asyncio.gather(*(flights.ado('async', awork) for _ in range(3)))
+
+        before = len(calls)
+        results = asyncio.run(run_async())
+        assert len(calls) == before + 1 and all(result == 'async' for result, _, _ in results)
+        print("✅ 异步请求合并正常")
+
+        print("\n🎉 请求合并测试通过！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 测试失败: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # 设置日志
+    logging.basicConfig(level=logging.INFO)
+
+    # 运行测试
+    test_single_flight()
@@ -0,0 +1,189 @@
+"""
+LLM响应缓存 - 按模型、消息、温度和工具精确匹配，复用相同提示词的回复
+
+重试、不同用户请求相同主题、界面重新生成等场景中完全相同的提示词反复出现，
+命中缓存时直接返回已保存的回复，不发起LLM调用，也不产生token用量。
+缓存保存在本地 SQLite 中，按过期时间和最近最少使用淘汰。
+"""
+import threading
+import logging
+from typing import Dict, Any, List, Optional, Union
+
+from crewai import BaseLLM
+from crewai.utilities.events import crewai_event_bus, LLMStreamChunkEvent
+
+from src.config import settings
+from src.llm.wrapper import DelegatingLLM
+from src.utils.cache_store import SQLiteCache, make_cache_key
+
+logger = logging.getLogger(__name__)
+
+# 缓存模式：use 读写缓存，refresh 只写不读（强制重新生成），bypass 不读不写
+CACHE_MODES = ('use', 'refresh', 'bypass')
+
+_shared_cache: Optional[SQLiteCache] = None
+_shared_cache_lock = threading.Lock()
+_lookup_state = threading.local()
+
+
+def get_llm_cache() -> SQLiteCache:
+    """进程内共享的LLM响应缓存，首次使用时创建"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = SQLiteCache(
+                settings.CACHE_DIR / 'llm_cache.sqlite3',
+                namespace='llm_responses',
+                default_ttl=settings.LLM_CACHE_TTL or None,
+                max_entries=settings.LLM_CACHE_MAX_ENTRIES or None,
+                max_bytes=settings.LLM_CACHE_MAX_BYTES or None
+            )
+        return _shared_cache
+
+
+def last_call_cached() -> bool:
+    """当前线程最近一次经过 CachingLLM 的调用是否命中了缓存（路由据此排除命中的耗时）"""
+    return getattr(_lookup_state, 'hit', False)
+
+
+def is_cacheable_temperature(temperature: Optional[float]) -> bool:
+    """温度大于0的回复本身是随机的，只有 LLM_CACHE_ALLOW_TEMPERATURE 开启时才缓存"""
+    return not temperature or temperature <= 0 or settings.LLM_CACHE_ALLOW_TEMPERATURE
+
+
+class CachingLLM(DelegatingLLM):
+    """
+    带响应缓存的LLM包装
+
+    缓存键由模型、消息、温度、工具、停止词和 max_tokens 计算；只缓存文本回复，
+    调用方传入 available_functions（原生函数调用）时直接透传。
+    命中和未命中分别计入 stats 的 cache_hits 和 cache_misses。
+    """
+
+    def __init__(self, llm: BaseLLM, cache: Optional[SQLiteCache] = None):
+        """
+        Args:
+            llm: 被包装的LLM
+            cache: 缓存存储，默认使用进程内共享的LLM响应缓存
+        """
+        super().__init__(llm)
+        self._cache = cache
+        self.mode = 'use'
+        self.stats = {'cache_hits': 0, 'cache_misses': 0}
+
+    @property
+    def cache(self) -> SQLiteCache:
+        if self._cache is None:
+            self._cache = get_llm_cache()
+        return self._cache
+
+    def cache_key(self, messages: Union[str, List[Dict[str, str]]], tools: Optional[List[dict]] = None) -> str:
+        """计算请求的缓存键"""
+        return make_cache_key(
+            'llm', self._llm.model, messages, self._llm.temperature, tools,
+            sorted(self._llm.stop or []), getattr(self._llm, 'max_tokens', None)
+        )
+
+    def call(self,
+             messages: Union[str, List[Dict[str, str]]],
+             tools: Optional[List[dict]] = None,
+             callbacks: Optional[List[Any]] = None,
+             available_functions: Optional[Dict[str, Any]] = None,
+             from_task: Optional[Any] = None,
+             from_agent: Optional[Any] = None) -> Union[str, Any]:
+        _lookup_state.hit = False
+        if (self.mode == 'bypass' or available_functions
+                or not is_cacheable_temperature(self._llm.temperature)):
+            return self._llm.call(messages, tools=tools, callbacks=callbacks,
+                                  available_functions=available_functions,
+                                  from_task=from_task, from_agent=from_agent)
+
+        key = self.cache_key(messages, tools)
+        if self.mode == 'use':
+            try:
+                cached = self.cache.get(key)
+            except Exception as e:
+                logger.warning(f"⚠️  LLM缓存读取失败: {str(e)}")
+                cached = None
+            if cached is not None:
+                self._count('cache_hits')
+                _lookup_state.hit = True
+                if self.stream:
+                    # 流式调用方仍然收到一次完整的输出事件
+                    crewai_event_bus.emit(self._llm, event=LLMStreamChunkEvent(
+                        chunk=cached, from_task=from_task, from_agent=from_agent
+                    ))
+                return cached
+
+        self._count('cache_misses')
+        response = self._llm.call(messages, tools=tools, callbacks=callbacks,
+                                  available_functions=available_functions,
+                                  from_task=from_task, from_agent=from_agent)
+        if isinstance(response, str) and response.strip():
+            try:
+                self.cache.set(key, response)
+            except Exception as e:
+                logger.warning(f"⚠️  LLM缓存写入失败: {str(e)}")
+        return response
+
+
+# 用于单独测试的函数
+def test_caching_llm():
+    """测试LLM响应缓存（无需API Key）"""
+    import tempfile
+    from pathlib import Path
+    from src.llm.fake import FakeLLM
+
+    print("💾 测试LLM响应缓存...")
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = SQLiteCache(Path(tmp_dir) / 'llm.sqlite3', namespace='test')
+            llm = CachingLLM(FakeLLM(latency=0, output_tokens=100), cache=cache)
+            messages = [{'role': 'user', 'content': 'Current Task: 介绍人工智能'}]
+
+            first = llm.call(messages)
+            second = llm.call(messages)
+            assert first == second
+            assert llm.stats == {'cache_hits': 1, 'cache_misses': 1}
+            print(f"✅ 相同提示词命中缓存: {llm.stats}")
+
+            llm.call([{'role': 'user', 'content': 'Current Task: 介绍机器学习'}])
+            assert llm.stats['cache_misses'] == 2
+            print("✅ 不同提示词未命中")
+
+            llm.mode = 'bypass'
+            llm.call(messages)
+            assert llm.stats == {'cache_hits': 1, 'cache_misses': 2}
+            print("✅ bypass 模式不读写缓存")
+
+            llm.mode = 'use'
+            llm.stop = ['\nObservation:']
+            assert llm.llm.stop == ['\nObservation:']
+            llm.call(messages)
+            assert llm.stats['cache_misses'] == 3
+            print("✅ 停止词同步到被包装的LLM，并参与缓存键")
+
+            creative = CachingLLM(FakeLLM(latency=0, temperature=0.7), cache=cache)
+            creative.call(messages)
+            creative.call(messages)
+            expected = 1 if settings.LLM_CACHE_ALLOW_TEMPERATURE else 0
+            assert creative.stats['cache_hits'] == expected
+            print("✅ 温度大于0时默认不缓存")
+
+            cache.close()
+
+        print("\n🎉 LLM响应缓存测试通过！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 测试失败: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # 设置日志
+    logging.basicConfig(level=logging.INFO)
+
+    # 运行测试
+    test_caching_llm()
@@ -0,0 +1,142 @@
+"""
+LLM工厂 - 根据智能体配置中的 llm 设置创建 LLM 实例
+"""
+import os
+import logging
+from pathlib import Path
+from dotenv import load_dotenv
+from typing import Dict, Any, Optional
+
+# 找到项目根目录并加载环境变量
+current_dir = Path(__file__).parent
+project_root = current_dir.parent.parent
+env_path = project_root / '.env'
+
+if env_path.exists():
+    load_dotenv(env_path)
+
+from crewai import LLM, BaseLLM
+from src.config import settings
+
+logger = logging.getLogger(__name__)
+
+# 未写明模型时按顺序读取的环境变量：本项目的 DEFAULT_MODEL，其后为 crewai 使用的变量
+DEFAULT_MODEL_ENV_VARS = ('DEFAULT_MODEL', 'MODEL', 'MODEL_NAME', 'OPENAI_MODEL_NAME')
+# 环境变量都未设置时的模型（与 crewai 的默认模型相同）
+FALLBACK_MODEL = 'gpt-4o-mini'
+
+
+def resolve_model(spec: Optional[Dict[str, Any]] = None) -> str:
+    """
+    确定 llm 设置使用的模型，所有创建 LLM 的路径共用这一规则
+
+    优先级：spec 中的 model > DEFAULT_MODEL > MODEL > MODEL_NAME > OPENAI_MODEL_NAME > gpt-4o-mini
+    """
+    model = (spec or {}).get('model')
+    if model:
+        return model
+    for name in DEFAULT_MODEL_ENV_VARS:
+        if os.getenv(name):
+            return os.getenv(name)
+    return FALLBACK_MODEL
+
+
+def resolve_temperature(spec: Optional[Dict[str, Any]] = None) -> Optional[float]:
+    """确定 llm 设置使用的温度：spec 中的 temperature > TEMPERATURE > 模型默认值"""
+    temperature = (spec or {}).get('temperature')
+    if temperature is None and os.getenv("TEMPERATURE"):
+        temperature = float(os.getenv("TEMPERATURE"))
+    return temperature
+
+
+def create_llm(spec: Optional[Dict[str, Any]] = None) -> BaseLLM:
+    """
+    根据 llm 设置创建 LLM
+
+    Args:
+        spec: llm 设置，支持 model、temperature、max_tokens、stream、cache、
+            timeout、max_retries、hedge、fallbacks、max_latency_s、max_error_rate；
+            未写明的模型和温度按 resolve_model / resolve_temperature 的规则从环境变量读取。
+            LLM_BACKEND=fake 时总是返回离线模拟LLM。
+            LLM_RESILIENCE_ENABLED 开启时包装超时、重试和对冲请求（spec 中 resilience: false 可单独关闭），
+            LLM_CACHE_ENABLED 开启时在外层包装响应缓存（spec 中 cache: false 可单独关闭），
+            命中缓存的请求不经过重试和超时。
+            fallbacks 为按顺序排列的备用模型设置，未写的字段沿用主模型的设置，
+            LLM_ROUTING_ENABLED 开启时返回在主模型和备用模型之间路由的 RoutingLLM
+
+    Returns:
+        LLM: 配置好的 LLM 实例
+    """
+    spec = spec or {}
+    fallbacks = spec.get('fallbacks') or []
+    primary_spec = {k: v for k, v in spec.items() if k not in ('fallbacks', 'max_latency_s', 'max_error_rate')}
+    primary = _create_wrapped_llm(primary_spec)
+    if not fallbacks or not settings.LLM_ROUTING_ENABLED:
+        return primary
+
+    from src.llm.router import RoutingLLM
+
+    candidates = [primary]
+    for fallback in fallbacks:
+        fallback_spec = {**primary_spec, **(fallback if isinstance(fallback, dict) else {'model': fallback})}
+        candidates.append(_create_wrapped_llm(fallback_spec))
+
+    logger.info(f"✅ 模型路由: {' -> '.join(llm.model for llm in candidates)}")
+    return RoutingLLM(
+        candidates,
+        max_latency_s=spec.get('max_latency_s'),
+        max_error_rate=spec.get('max_error_rate')
+    )
+
+
+def _create_wrapped_llm(spec: Dict[str, Any]) -> BaseLLM:
+    """创建单个模型并按设置包装容错和响应缓存"""
+    llm = _create_base_llm(spec)
+
+    use_resilience = spec.get('resilience', settings.LLM_RESILIENCE_ENABLED)
+    use_cache = spec.get('cache', settings.LLM_CACHE_ENABLED)
+    if not use_resilience and not use_cache:
+        return llm
+
+    if use_resilience:
+        from src.llm.resilience import ResilientLLM
+
+        llm = ResilientLLM(
+            llm,
+            timeout=spec.get('timeout'),
+            max_retries=spec.get('max_retries'),
+            hedge=spec.get('hedge')
+        )
+
+    if use_cache:
+        from src.llm.cache import CachingLLM, is_cacheable_temperature
+
+        if spec.get('cache') or is_cacheable_temperature(llm.temperature):
+            llm = CachingLLM(llm)
+        else:
+            logger.info(f"ℹ️  {llm.model} 温度为 {llm.temperature}，不启用LLM响应缓存")
+    return llm
+
+
+def _create_base_llm(spec: Dict[str, Any]) -> BaseLLM:
+    """创建未包装的 LLM"""
+    if settings.FAKE_LLM:
+        from src.llm.fake import FakeLLM
+
+        return FakeLLM(
+            model=spec.get('model') or 'fake',
+            temperature=spec.get('temperature'),
+            max_tokens=spec.get('max_tokens'),
+            stream=spec.get('stream', False)
+        )
+
+    model = resolve_model(spec)
+    temperature = resolve_temperature(spec)
+    llm = LLM(
+        model=model,
+        temperature=temperature,
+        max_tokens=spec.get('max_tokens'),
+        stream=spec.get('stream', False)
+    )
+    logger.info(f"✅ LLM 已创建: {model}{'（流式输出）' if spec.get('stream') else ''}")
+    return llm
@@ -0,0 +1,332 @@
+"""
+离线模拟LLM - 不访问网络，按提示词确定性地生成 ReAct 格式的回复
+
+用于在没有 API Key 和网络的环境中对完整工作流做基准测试（调度、并发、内存），
+延迟、输出长度和 token 速率可通过 FAKE_LLM_* 环境变量配置。
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import itertools
+import logging
+import threading
+from types import SimpleNamespace
+from typing import Dict, Any, List, Optional, Union
+
+from crewai import BaseLLM
+from crewai.tools import BaseTool
+from crewai.utilities.events import (
+    crewai_event_bus,
+    LLMCallStartedEvent,
+    LLMCallCompletedEvent,
+    LLMCallFailedEvent,
+    LLMStreamChunkEvent,
+)
+from crewai.utilities.events.llm_events import LLMCallType
+from pydantic import BaseModel, Field
+
+from src.config import settings
+from src.crew.context_budget import estimate_tokens
+from src.llm.resilience import CallCancelledError, cancellable_sleep
+
+logger = logging.getLogger(__name__)
+
+# 区分多个实例的故障注入序列
+_instance_ids = itertools.count()
+
+TOOL_NAME_PATTERN = re.compile(r"Tool Name: (.+)")
+TOOL_ARGS_PATTERN = re.compile(r"Tool Arguments: \{'(\w+)'")
+TASK_PATTERN = re.compile(r"Current Task: (.+)")
+
+# 模拟生成内容使用的素材
+FAKE_SOURCES = [
+    "https://www.gov.cn/zhengce/report",
+    "https://www.nature.com/articles/fake-research",
+    "https://www.stats.gov.cn/sj/zxfb/",
+    "https://arxiv.org/abs/2401.00001",
+    "https://www.ieee.org/publications/",
+]
+FAKE_FILLER = [
+    "相关研究表明，该领域在过去三年保持了稳定增长，应用场景持续扩展。",
+    "业内人士认为，技术成熟度和成本下降是推动普及的两个关键因素。",
+    "从用户反馈来看，易用性和可靠性仍然是影响采纳的主要考量。",
+    "政策层面的支持为行业发展提供了良好的外部环境。",
+    "与此同时，数据安全和合规要求也对企业提出了更高的标准。",
+]
+
+
+class FakeLLM(BaseLLM):
+    """
+    离线模拟LLM
+
+    同一提示词和随机种子总是得到相同的回复和延迟。提示词中包含工具说明时，
+    先输出 FAKE_LLM_TOOL_CALLS 次 Action（调用第一个工具），之后给出 Final Answer。
+    与真实 LLM 一样发送 LLM 调用和流式输出事件，并通过 callbacks 上报 token 用量。
+    """
+
+    def __init__(self,
+                 model: str = "fake",
+                 temperature: Optional[float] = None,
+                 max_tokens: Optional[int] = None,
+                 stream: bool = False,
+                 latency: Optional[float] = None,
+                 latency_sigma: Optional[float] = None,
+                 tokens_per_second: Optional[float] = None,
+                 output_tokens: Optional[int] = None,
+                 tool_calls: Optional[int] = None,
+                 seed: Optional[int] = None,
+                 responses: Optional[Dict[str, str]] = None,
+                 stall_rate: Optional[float] = None,
+                 stall_s: Optional[float] = None,
+                 error_rate: Optional[float] = None):
+        """
+        Args:
+            model: 模型名称（仅用于标识）
+            temperature: 温度（不影响输出）
+            max_tokens: 输出token上限
+            stream: 是否以流式事件逐段输出
+            latency: 首token延迟的中位数（秒），默认读取 FAKE_LLM_LATENCY_S
+            latency_sigma: 延迟对数正态分布的 sigma，默认读取 FAKE_LLM_LATENCY_SIGMA
+            tokens_per_second: 输出速率，0 表示不模拟生成耗时，默认读取 FAKE_LLM_TOKENS_PER_S
+            output_tokens: 最终答案的平均token数，默认读取 FAKE_LLM_OUTPUT_TOKENS
+            tool_calls: 最终答案之前的工具调用次数，默认读取 FAKE_LLM_TOOL_CALLS
+            seed: 随机种子，默认读取 FAKE_LLM_SEED
+            responses: 预设回复，键为任务描述中的关键词，默认读取 FAKE_LLM_RESPONSES_FILE
+            stall_rate: 调用卡住的概率，默认读取 FAKE_LLM_STALL_RATE
+            stall_s: 卡住的时长（秒），默认读取 FAKE_LLM_STALL_S
+            error_rate: 调用抛出连接错误的概率，默认读取 FAKE_LLM_ERROR_RATE
+        """
+        super().__init__(model=model, temperature=temperature)
+        self.max_tokens = max_tokens
+        self.stream = stream
+        self.latency = settings.FAKE_LLM_LATENCY_S if latency is None else latency
+        self.latency_sigma = settings.FAKE_LLM_LATENCY_SIGMA if latency_sigma is None else latency_sigma
+        self.tokens_per_second = settings.FAKE_LLM_TOKENS_PER_S if tokens_per_second is None else tokens_per_second
+        self.output_tokens = settings.FAKE_LLM_OUTPUT_TOKENS if output_tokens is None else output_tokens
+        self.tool_calls = settings.FAKE_LLM_TOOL_CALLS if tool_calls is None else tool_calls
+        self.seed = settings.FAKE_LLM_SEED if seed is None else seed
+        self.responses = load_fake_responses() if responses is None else responses
+        self.stall_rate = settings.FAKE_LLM_STALL_RATE if stall_rate is None else stall_rate
+        self.stall_s = settings.FAKE_LLM_STALL_S if stall_s is None else stall_s
+        self.error_rate = settings.FAKE_LLM_ERROR_RATE if error_rate is None else error_rate
+        # 故障按实例和调用次序抽取（与提示词无关），重试和对冲请求可能得到不同的结果
+        self._fault_rng = random.Random(f"{self.seed}:faults:{next(_instance_ids)}")
+        self._fault_lock = threading.Lock()
+
+    def call(self,
+             messages: Union[str, List[Dict[str, str]]],
+             tools: Optional[List[dict]] = None,
+             callbacks: Optional[List[Any]] = None,
+             available_functions: Optional[Dict[str, Any]] = None,
+             from_task: Optional[Any] = None,
+             from_agent: Optional[Any] = None) -> str:
+        if isinstance(messages, str):
+            messages = [{'role': 'user', 'content': messages}]
+
+        crewai_event_bus.emit(self, event=LLMCallStartedEvent(
+            messages=messages, tools=tools, callbacks=callbacks,
+            available_functions=available_functions, from_task=from_task, from_agent=from_agent
+        ))
+
+        try:
+            prompt = "\n".join(str(message.get('content', '')) for message in messages)
+            rng = random.Random(f"{self.seed}:{hashlib.sha256(prompt.encode('utf-8')).hexdigest()}")
+            self._inject_faults()
+            response = self._respond(messages, prompt, rng)
+            completion_tokens = estimate_tokens(response)
+            self._simulate_latency(response, completion_tokens, rng, from_task, from_agent)
+            self._report_usage(callbacks, estimate_tokens(prompt), completion_tokens)
+        except CallCancelledError:
+            # 对冲请求中被放弃的一方，不计为失败
+            raise
+        except Exception as e:
+            crewai_event_bus.emit(self, event=LLMCallFailedEvent(
+                error=str(e), from_task=from_task, from_agent=from_agent
+            ))
+            raise
+
+        crewai_event_bus.emit(self, event=LLMCallCompletedEvent(
+            messages=messages, response=response, call_type=LLMCallType.LLM_CALL,
+            from_task=from_task, from_agent=from_agent
+        ))
+        return response
+
+    def _inject_faults(self):
+        """按配置的概率模拟卡住或连接错误"""
+        if not self.stall_rate and not self.error_rate:
+            return
+        with self._fault_lock:
+            stall = self._fault_rng.random() < self.stall_rate
+            error = self._fault_rng.random() < self.error_rate
+        if error:
+            raise ConnectionError("模拟LLM连接错误")
+        if stall:
+            cancellable_sleep(self.stall_s)
+
+    def _respond(self, messages: List[Dict[str, str]], prompt: str, rng: random.Random) -> str:
+        """工具调用次数未用完时输出 Action，否则输出 Final Answer"""
+        task_match = TASK_PATTERN.search(prompt)
+        task = task_match.group(1).strip() if task_match else prompt.strip().splitlines()[-1]
+
+        tool_names = TOOL_NAME_PATTERN.findall(prompt)
+        observations = sum(
+            str(message.get('content', '')).count('Observation:')
+            for message in messages if message.get('role') == 'assistant'
+        )
+        if tool_names and observations < self.tool_calls:
+            tool_name = tool_names[0].strip()
+            args_match = TOOL_ARGS_PATTERN.search(prompt)
+            argument = args_match.group(1) if args_match else 'query'
+            return (f"Thought: 需要先检索相关资料\n"
+                    f"Action: {tool_name}\n"
+                    f"Action Input: {json.dumps({argument: task[:60]}, ensure_ascii=False)}")
+
+        for keyword, answer in self.responses.items():
+            if keyword in task:
+                return f"Thought: I now can give a great answer\nFinal Answer: {answer}"
+
+        return f"Thought: I now can give a great answer\nFinal Answer: {self._generate(task, rng)}"
+
+    def _generate(self, task: str, rng: random.Random) -> str:
+        """按模板生成包含标题、要点、数据和来源的 Markdown 内容"""
+        target = max(50, int(rng.gauss(self.output_tokens, self.output_tokens * 0.2)))
+        if self.max_tokens:
+            target = min(target, self.max_tokens)
+
+        lines = [f"# {task[:40]}", "", "## 关键发现"]
+        for i in range(3):
+            lines.append(f"- 指标{i + 1}在2024年增长了{rng.randint(5, 60)}%，规模达到{rng.randint(10, 900)}亿元")
+        lines += ["", "## 详细分析"]
+        while estimate_tokens("\n".join(lines)) < target:
+            lines.append(rng.choice(FAKE_FILLER))
+        lines += ["", "## 信息来源"] + [f"- {url}" for url in rng.sample(FAKE_SOURCES, 2)]
+        return "\n".join(lines)
+
+    def _simulate_latency(self, response: str, completion_tokens: int, rng: random.Random,
+                          from_task: Optional[Any], from_agent: Optional[Any]):
+        """首token延迟 + 按速率生成输出，流式模式下逐段发送输出事件"""
+        if self.latency > 0:
+            cancellable_sleep(self.latency * rng.lognormvariate(0, self.latency_sigma))
+
+        generation_time = completion_tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0
+        if not self.stream:
+            if generation_time:
+                cancellable_sleep(generation_time)
+            return
+
+        chunks = [response[i:i + 20] for i in range(0, len(response), 20)]
+        for chunk in chunks:
+            if generation_time:
+                cancellable_sleep(generation_time / len(chunks))
+            crewai_event_bus.emit(self, event=LLMStreamChunkEvent(
+                chunk=chunk, from_task=from_task, from_agent=from_agent
+            ))
+
+    def _report_usage(self, callbacks: Optional[List[Any]], prompt_tokens: int, completion_tokens: int):
+        """以 litellm 回调的形式上报 token 用量，crewai 据此统计智能体的用量"""
+        usage = SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                                prompt_tokens_details=None)
+        now = time.time()
+        for callback in callbacks or []:
+            if hasattr(callback, 'log_success_event'):
+                callback.log_success_event(kwargs={}, response_obj={'usage': usage}, start_time=now, end_time=now)
+
+    def supports_function_calling(self) -> bool:
+        return False
+
+    def get_context_window_size(self) -> int:
+        return 128000
+
+
+class FakeSearchInput(BaseModel):
+    """FakeSearchTool 的输入"""
+    search_query: str = Field(..., description="搜索关键词")
+
+
+class FakeSearchTool(BaseTool):
+    """离线模拟搜索工具，返回确定性的搜索结果，替代离线模式下的 SerperDevTool"""
+
+    name: str = "Search the internet"
+    description: str = "搜索互联网并返回相关网页的标题、链接和摘要"
+    args_schema: type[BaseModel] = FakeSearchInput
+
+    def _run(self, search_query: str) -> str:
+        if settings.FAKE_TOOL_LATENCY_S > 0:
+            time.sleep(settings.FAKE_TOOL_LATENCY_S)
+
+        rng = random.Random(f"{settings.FAKE_LLM_SEED}:{search_query}")
+        results = [
+            {
+                'title': f"{search_query[:30]} - 研究报告{i + 1}",
+                'link': url,
+                'snippet': rng.choice(FAKE_FILLER)
+            }
+            for i, url in enumerate(rng.sample(FAKE_SOURCES, 3))
+        ]
+        return json.dumps({'searchParameters': {'q': search_query}, 'organic': results}, ensure_ascii=False)
+
+
+def load_fake_responses() -> Dict[str, str]:
+    """读取 FAKE_LLM_RESPONSES_FILE 中的预设回复"""
+    if not settings.FAKE_LLM_RESPONSES_FILE:
+        return {}
+    try:
+        with open(settings.FAKE_LLM_RESPONSES_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"⚠️  预设回复文件读取失败: {str(e)}")
+        return {}
+
+
+# 用于单独测试的函数
+def test_fake_llm():
+    """测试离线模拟LLM（无需API Key）"""
+    from crewai import Agent, Task, Crew
+
+    print("🧪 测试离线模拟LLM...")
+
+    try:
+        llm = FakeLLM(latency=0.01, output_tokens=200)
+        agent = Agent(
+            role='内容研究专家',
+            goal='收集关于人工智能的信息',
+            backstory='你是一位研究专家',
+            llm=llm,
+            tools=[FakeSearchTool()],
+            verbose=False
+        )
+        task = Task(description='研究人工智能在医疗领域的应用', expected_output='研究报告', agent=agent)
+        crew = Crew(agents=[agent], tasks=[task], verbose=False)
+
+        first = crew.kickoff().raw
+        assert '## 信息来源' in first
+        usage = crew.calculate_usage_metrics()
+        assert usage.total_tokens > 0 and usage.successful_requests == 2
+        print(f"✅ 工具调用后给出最终答案，token {usage.total_tokens}")
+
+        second = Crew(agents=[agent], tasks=[
+            Task(description='研究人工智能在医疗领域的应用', expected_output='研究报告', agent=agent)
+        ], verbose=False).kickoff().raw
+        assert first == second
+        print("✅ 相同提示词输出一致")
+
+        canned = FakeLLM(latency=0, responses={'医疗': '预设内容'})
+        answer = canned.call([{'role': 'user', 'content': 'Current Task: 医疗报告'}])
+        assert answer.endswith('Final Answer: 预设内容')
+
+        print("\n🎉 离线模拟LLM测试通过！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 测试失败: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # 设置日志
+    logging.basicConfig(level=logging.INFO)
+
+    # 运行测试
+    test_fake_llm()
@@ -0,0 +1,264 @@
+"""
+模型路由 - 按观测到的延迟和错误率在主模型和备用模型之间切换
+
+每个智能体可以在 agents.yaml 的 llm 设置中配置按顺序排列的 fallbacks。
+主模型的延迟或错误率（指数加权移动平均）超过阈值时，一段冷却时间内请求改发给第一个健康的备用模型；
+调用出现可重试的错误时立即改用下一个候选模型：除最后一个候选外，候选模型的 ResilientLLM 只调用一次、不重试，
+超时或出错后直接切换，不必等完整的重试和退避周期。
+"""
+import time
+import threading
+import logging
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+from crewai import BaseLLM
+
+from src.config import settings
+from src.llm.cache import last_call_cached
+from src.llm.resilience import failover_scope, is_retryable
+from src.llm.wrapper import DelegatingLLM, caller_role
+
+logger = logging.getLogger(__name__)
+
+
+class ModelHealth:
+    """
+    单个模型（按智能体角色区分）的健康状况
+
+    延迟和错误率使用指数加权移动平均，样本达到 min_samples 后才参与判断；
+    超过阈值后在 cooldown_s 秒内视为不健康，冷却结束后清空统计重新观察。
+    """
+
+    def __init__(self, alpha: float = 0.3, min_samples: int = 3, cooldown_s: float = 60):
+        self.alpha = alpha
+        self.min_samples = min_samples
+        self.cooldown_s = cooldown_s
+        self.latency: Optional[float] = None
+        self.error_rate = 0.0
+        self.samples = 0
+        self.unhealthy_until = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, latency: Optional[float], ok: bool):
+        """记录一次调用结果，失败的调用不更新延迟"""
+        with self._lock:
+            self.samples += 1
+            self.error_rate += self.alpha * ((0.0 if ok else 1.0) - self.error_rate)
+            if ok and latency is not None:
+                self.latency = latency if self.latency is None else self.latency + self.alpha * (latency - self.latency)
+
+    def is_healthy(self, max_latency_s: Optional[float], max_error_rate: Optional[float]) -> bool:
+        """判断是否健康，超过阈值时进入冷却"""
+        now = time.time()
+        with self._lock:
+            if self.unhealthy_until:
+                if now < self.unhealthy_until:
+                    return False
+                self.latency, self.error_rate, self.samples, self.unhealthy_until = None, 0.0, 0, 0.0
+
+            if self.samples < self.min_samples:
+                return True
+            too_slow = bool(max_latency_s) and self.latency is not None and self.latency > max_latency_s
+            too_flaky = max_error_rate is not None and self.error_rate > max_error_rate
+            if too_slow or too_flaky:
+                self.unhealthy_until = now + self.cooldown_s
+                return False
+            return True
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'latency': round(self.latency, 3) if self.latency is not None else None,
+                'error_rate': round(self.error_rate, 3),
+                'samples': self.samples,
+                'cooling_down': self.unhealthy_until > time.time()
+            }
+
+
+_health: Dict[Tuple[str, Optional[str]], ModelHealth] = {}
+_health_lock = threading.Lock()
+
+
+def get_model_health(model: str, role: Optional[str] = None) -> ModelHealth:
+    """按模型和智能体角色共享的健康状况，智能体池中的多个实例共用"""
+    with _health_lock:
+        key = (model, role)
+        if key not in _health:
+            _health[key] = ModelHealth(
+                alpha=settings.LLM_ROUTER_EWMA_ALPHA,
+                min_samples=settings.LLM_ROUTER_MIN_SAMPLES,
+                cooldown_s=settings.LLM_ROUTER_COOLDOWN_S
+            )
+        return _health[key]
+
+
+def model_health_report() -> List[Dict[str, Any]]:
+    """所有已观测模型的健康状况"""
+    with _health_lock:
+        items = list(_health.items())
+    return [{'model': model, 'role': role, **health.snapshot()} for (model, role), health in items]
+
+
+class RoutingLLM(DelegatingLLM):
+    """
+    在多个候选LLM之间路由
+
+    按配置顺序选择第一个健康的候选（都不健康时仍按顺序尝试），
+    可重试的错误发生时改用下一个候选（候选内部不重试，只有最后一个候选按自己的设置重试），
+    已经输出过流式内容或执行过函数的调用失败后不再切换。命中响应缓存的调用不计入延迟。
+    计数记录在 stats 中：fallbacks（由备用模型完成的调用）、failovers（调用失败后切换模型的次数）。
+    """
+
+    def __init__(self,
+                 candidates: List[BaseLLM],
+                 max_latency_s: Optional[float] = None,
+                 max_error_rate: Optional[float] = None):
+        """
+        Args:
+            candidates: 按优先级排列的LLM，第一个为主模型
+            max_latency_s: 延迟阈值（秒），0 表示不按延迟切换，默认读取 LLM_ROUTER_MAX_LATENCY_S
+            max_error_rate: 错误率阈值（0-1），默认读取 LLM_ROUTER_MAX_ERROR_RATE
+        """
+        if not candidates:
+            raise ValueError("❌ 模型路由至少需要一个候选LLM")
+        self.candidates = list(candidates)
+        super().__init__(self.candidates[0])
+        self.max_latency_s = settings.LLM_ROUTER_MAX_LATENCY_S if max_latency_s is None else max_latency_s
+        self.max_error_rate = settings.LLM_ROUTER_MAX_ERROR_RATE if max_error_rate is None else max_error_rate
+        self.stats = {'fallbacks': 0, 'failovers': 0}
+
+    @property
+    def stop(self) -> Optional[List[str]]:
+        return self.candidates[0].stop
+
+    @stop.setter
+    def stop(self, value: Optional[List[str]]):
+        for llm in self.candidates:
+            llm.stop = value
+
+    @property
+    def stream(self) -> bool:
+        return getattr(self.candidates[0], 'stream', False)
+
+    @stream.setter
+    def stream(self, value: bool):
+        for llm in self.candidates:
+            llm.stream = value
+
+    def wrapped_llms(self) -> List[BaseLLM]:
+        return list(self.candidates)
+
+    def route(self, role: Optional[str] = None) -> List[int]:
+        """返回本次调用尝试候选的顺序：健康的候选在前，其余按配置顺序在后"""
+        healthy = [
+            index for index, llm in enumerate(self.candidates)
+            if get_model_health(llm.model, role).is_healthy(self.max_latency_s, self.max_error_rate)
+        ]
+        return healthy + [index for index in range(len(self.candidates)) if index not in healthy]
+
+    def call(self,
+             messages: Union[str, List[Dict[str, str]]],
+             tools: Optional[List[dict]] = None,
+             callbacks: Optional[List[Any]] = None,
+             available_functions: Optional[Dict[str, Any]] = None,
+             from_task: Optional[Any] = None,
+             from_agent: Optional[Any] = None) -> Union[str, Any]:
+        role = caller_role(from_task, from_agent)
+        order = self.route(role)
+
+        for position, index in enumerate(order):
+            llm = self.candidates[index]
+            health = get_model_health(llm.model, role)
+            last = position == len(order) - 1
+            started = time.perf_counter()
+            with failover_scope(single_attempt=not last) as scope:
+                try:
+                    response = llm.call(messages, tools=tools, callbacks=callbacks,
+                                        available_functions=available_functions,
+                                        from_task=from_task, from_agent=from_agent)
+                except Exception as e:
+                    health.record(None, ok=False)
+                    if last or not is_retryable(e) or scope.side_effects:
+                        raise
+                    self._count('failovers')
+                    logger.warning(f"⚠️  {llm.model} 调用失败，改用 {self.candidates[order[position + 1]].model}: {str(e)}")
+                    continue
+
+            if not last_call_cached():
+                health.record(time.perf_counter() - started, ok=True)
+            if index != 0:
+                self._count('fallbacks')
+            return response
+
+    def supports_function_calling(self) -> bool:
+        return all(llm.supports_function_calling() for llm in self.candidates)
+
+    def get_context_window_size(self) -> int:
+        # 按最小的窗口截断上下文，切换到任何候选都不会超长
+        return min(llm.get_context_window_size() for llm in self.candidates)
+
+
+# 用于单独测试的函数
+def test_routing_llm():
+    """测试模型路由（无需API Key）"""
+    from src.llm.fake import FakeLLM
+
+    print("🧭 测试模型路由...")
+
+    try:
+        messages = [{'role': 'user', 'content': 'Current Task: 介绍人工智能'}]
+
+        # 主模型总是出错：立即切换到备用模型，错误率超过阈值后直接路由到备用模型
+        router = RoutingLLM([FakeLLM(model='fake-broken', latency=0, error_rate=1.0),
+                             FakeLLM(model='fake-backup', latency=0)], max_error_rate=0.5)
+        for _ in range(6):
+            assert 'Final Answer' in router.call(messages)
+        assert router.stats['fallbacks'] == 6
+        assert router.stats['failovers'] < 6
+        print(f"✅ 出错时切换到备用模型: {router.stats}")
+
+        # 主模型变慢：延迟超过阈值后改用备用模型，冷却结束后重新尝试主模型
+        slow = FakeLLM(model='fake-slow', latency=0.05, latency_sigma=0)
+        router = RoutingLLM([slow, FakeLLM(model='fake-fast', latency=0)], max_latency_s=0.02)
+        get_model_health('fake-slow').cooldown_s = 0.3
+        for _ in range(6):
+            router.call(messages)
+        assert router.stats['fallbacks'] >= 2
+        print(f"✅ 延迟超过阈值后改用备用模型: {router.stats}")
+
+        time.sleep(0.35)
+        assert router.route() == [0, 1]
+        print("✅ 冷却结束后重新尝试主模型")
+
+        # 候选模型内部不重试：主模型超时一次后立即切换，不等完整的重试和退避周期
+        from src.llm.resilience import ResilientLLM
+
+        stalled = ResilientLLM(FakeLLM(model='fake-stalled', latency=0, stall_rate=1.0, stall_s=5),
+                               timeout=0.2, max_retries=3, backoff_base=1, hedge=False)
+        backup = ResilientLLM(FakeLLM(model='fake-standby', latency=0), timeout=5, max_retries=3, hedge=False)
+        router = RoutingLLM([stalled, backup], max_error_rate=1.0)
+        started = time.perf_counter()
+        assert 'Final Answer' in router.call(messages)
+        elapsed = time.perf_counter() - started
+        assert stalled.stats['retries'] == 0 and stalled.stats['timeouts'] == 1 and elapsed < 0.5
+        print(f"✅ 主模型超时一次即切换: {elapsed:.2f}s")
+
+        router.stop = ['\nObservation:']
+        assert all(llm.stop == ['\nObservation:'] for llm in router.candidates)
+        print("✅ 停止词同步到所有候选模型")
+
+        print(f"📊 模型健康状况: {model_health_report()}")
+        print("\n🎉 模型路由测试通过！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 测试失败: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # 设置日志
+    logging.basicConfig(level=logging.INFO)
+
+    # 运行测试
+    test_routing_llm()
@@ -0,0 +1,141 @@
+"""
+任务token额度 - 在每次LLM调用时执行工作流预算分配给任务的token额度
+
+工作流预算在任务开始前按比例分配token额度，但一个任务内智能体会多次调用LLM。
+包装器在每次调用前检查任务已用的token和本次请求的估算输入token，额度不足时拒绝调用；
+剩余额度低于模型的 max_tokens 时，本次调用的输出上限降为剩余额度，避免单个任务超支整个工作流的预算。
+"""
+import threading
+import logging
+from typing import Dict, Any, List, Optional, Union, Callable
+
+from crewai import BaseLLM
+
+from src.crew.budget import StageTokenBudgetError
+from src.crew.context_budget import estimate_tokens
+from src.llm.wrapper import DelegatingLLM
+
+logger = logging.getLogger(__name__)
+
+
+def base_llms(llm: BaseLLM) -> List[BaseLLM]:
+    """包装链（包括路由的所有候选）最内层的LLM"""
+    if not isinstance(llm, DelegatingLLM):
+        return [llm]
+    leaves = []
+    for wrapped in llm.wrapped_llms():
+        leaves.extend(base_llms(wrapped))
+    return leaves
+
+
+class TokenLimitLLM(DelegatingLLM):
+    """
+    限制任务token用量的LLM包装
+
+    usage 返回任务开始以来已用的token（crewai 通过回调统计在智能体上），
+    扣除本次请求的估算输入token后没有剩余时 exhausted 为 True，调用抛出 StageTokenBudgetError。
+    计数记录在 stats 中：token_capped（降低输出上限的调用次数）、token_refused（被拒绝的调用次数）。
+    """
+
+    def __init__(self, llm: BaseLLM, token_limit: int, usage: Callable[[], int]):
+        """
+        Args:
+            llm: 被包装的LLM
+            token_limit: 任务的token额度（输入和输出合计）
+            usage: 返回任务已用token数的函数
+        """
+        super().__init__(llm)
+        self.token_limit = token_limit
+        self.usage = usage
+        self.exhausted = False
+        # 同一智能体同时只执行一个任务，但对冲请求等可能并发调用
+        self._limit_lock = threading.Lock()
+        self.stats = {'token_capped': 0, 'token_refused': 0}
+
+    def remaining(self) -> int:
+        return self.token_limit - self.usage()
+
+    def call(self,
+             messages: Union[str, List[Dict[str, str]]],
+             tools: Optional[List[dict]] = None,
+             callbacks: Optional[List[Any]] = None,
+             available_functions: Optional[Dict[str, Any]] = None,
+             from_task: Optional[Any] = None,
+             from_agent: Optional[Any] = None) -> Union[str, Any]:
+        prompt = messages if isinstance(messages, str) else "\n".join(
+            str(message.get('content') or '') for message in messages)
+        remaining = self.remaining() - estimate_tokens(prompt)
+        if remaining <= 0:
+            self.exhausted = True
+            self._count('token_refused')
+            raise StageTokenBudgetError(f"任务已用完分配的 {self.token_limit} tokens")
+
+        with self._limit_lock:
+            capped = {}
+            for llm in base_llms(self._llm):
+                configured = getattr(llm, 'max_tokens', None)
+                if configured is None or remaining < configured:
+                    capped[id(llm)] = (llm, configured)
+                    llm.max_tokens = remaining
+            if capped:
+                self._count('token_capped')
+        try:
+            return self._llm.call(messages, tools=tools, callbacks=callbacks,
+                                  available_functions=available_functions,
+                                  from_task=from_task, from_agent=from_agent)
+        finally:
+            with self._limit_lock:
+                for llm, configured in capped.values():
+                    llm.max_tokens = configured
+
+
+# 用于单独测试的函数
+def test_token_limit_llm():
+    """测试任务token额度（无需API Key）"""
+    from src.llm.fake import FakeLLM
+
+    print("🪙 测试任务token额度...")
+
+    try:
+        messages = [{'role': 'user', 'content': 'Current Task: 介绍人工智能'}]
+        used = {'tokens': 0}
+
+        class CountingLLM(FakeLLM):
+            def call(self, *args, **kwargs):
+                response = super().call(*args, **kwargs)
+                # 按输出上限计算用量
+                used['tokens'] += self.max_tokens
+                return response
+
+        base = CountingLLM(latency=0, max_tokens=2000)
+        limited = TokenLimitLLM(base, token_limit=2500, usage=lambda: used['tokens'])
+
+        limited.call(messages)
+        assert used['tokens'] == 2000 and limited.stats['token_capped'] == 0
+        limited.call(messages)
+        assert 2400 < used['tokens'] < 2500 and limited.stats['token_capped'] == 1
+        assert base.max_tokens == 2000
+        print(f"✅ 剩余额度低于 max_tokens 时降低输出上限: 已用 {used['tokens']} tokens")
+
+        try:
+            limited.call(messages)
+            raise AssertionError("额度用完后应当拒绝调用")
+        except StageTokenBudgetError:
+            pass
+        assert limited.exhausted and limited.stats['token_refused'] == 1
+        print(f"✅ 额度用完后拒绝调用: {limited.stats}")
+
+        print("\n🎉 任务token额度测试通过！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 测试失败: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # 设置日志
+    logging.basicConfig(level=logging.INFO)
+
+    # 运行测试
+    test_token_limit_llm()
@@ -0,0 +1,103 @@
+"""
+LLM包装基类 - 缓存、重试等功能以包装器的形式叠加在 LLM 外层
+"""
+import threading
+from typing import Dict, Any, List, Optional, Type, TypeVar
+
+from crewai import BaseLLM
+
+WrapperT = TypeVar('WrapperT', bound='DelegatingLLM')
+
+
+class DelegatingLLM(BaseLLM):
+    """
+    转发到被包装LLM的基类
+
+    crewai 设置的停止词、流式开关同步到被包装的LLM，其余属性和方法直接转发。
+    子类实现 call，并可在 stats 中记录计数，collect_stats 汇总整条包装链的计数。
+    """
+
+    def __init__(self, llm: BaseLLM):
+        """
+        Args:
+            llm: 被包装的LLM
+        """
+        self._llm = llm
+        stop = llm.stop
+        super().__init__(model=llm.model, temperature=llm.temperature)
+        # BaseLLM 初始化时会清空停止词，这里恢复被包装LLM原有的设置
+        self.stop = stop
+        self.stats: Dict[str, int] = {}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def llm(self) -> BaseLLM:
+        return self._llm
+
+    @property
+    def stop(self) -> Optional[List[str]]:
+        return self._llm.stop
+
+    @stop.setter
+    def stop(self, value: Optional[List[str]]):
+        self._llm.stop = value
+
+    @property
+    def stream(self) -> bool:
+        return getattr(self._llm, 'stream', False)
+
+    @stream.setter
+    def stream(self, value: bool):
+        self._llm.stream = value
+
+    def __getattr__(self, name: str) -> Any:
+        # 只在自身找不到属性时调用；_llm 尚未设置时避免递归
+        if name == '_llm':
+            raise AttributeError(name)
+        return getattr(self._llm, name)
+
+    def _count(self, field: str, amount: int = 1):
+        """累加计数（多个线程可能同时调用同一个LLM）"""
+        with self._stats_lock:
+            self.stats[field] = self.stats.get(field, 0) + amount
+
+    def wrapped_llms(self) -> List[BaseLLM]:
+        """直接包装的LLM，路由等包装多个LLM的子类返回全部候选"""
+        return [self._llm]
+
+    def collect_stats(self) -> Dict[str, int]:
+        """汇总包装链上所有包装器的计数"""
+        stats: Dict[str, int] = {}
+        for llm in self.wrapped_llms():
+            if isinstance(llm, DelegatingLLM):
+                for field, value in llm.collect_stats().items():
+                    stats[field] = stats.get(field, 0) + value
+        for field, value in self.stats.items():
+            stats[field] = stats.get(field, 0) + value
+        return stats
+
+    def supports_function_calling(self) -> bool:
+        return self._llm.supports_function_calling()
+
+    def supports_stop_words(self) -> bool:
+        return self._llm.supports_stop_words()
+
+    def get_context_window_size(self) -> int:
+        return self._llm.get_context_window_size()
+
+
+def caller_role(from_task: Optional[Any] = None, from_agent: Optional[Any] = None) -> Optional[str]:
+    """发起调用的智能体角色（crewai 的执行器只传入 from_task，从任务所属的智能体获取）"""
+    agent = from_agent or getattr(from_task, 'agent', None)
+    return getattr(agent, 'role', None)
+
+
+def find_wrappers(llm: Any, wrapper_type: Type[WrapperT]) -> List[WrapperT]:
+    """沿包装链（包括路由的所有候选）查找指定类型的包装器"""
+    found = []
+    if isinstance(llm, DelegatingLLM):
+        if isinstance(llm, wrapper_type):
+            found.append(llm)
+        for wrapped in llm.wrapped_llms():
+            found.extend(find_wrappers(wrapped, wrapper_type))
+    return found
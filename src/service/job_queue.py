@@ -0,0 +1,337 @@
+"""
+任务队列 - 基于 SQLite 的持久化内容创作任务队列，支持优先级、队列深度限制和取消
+"""
+import json
+import time
+import uuid
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+# 任务状态：queued -> running -> completed/failed；
+# queued 状态取消后直接变为 cancelled，running 状态取消后先变为 cancelling，由服务终止执行后变为 cancelled
+JOB_STATUSES = ('queued', 'running', 'completed', 'failed', 'cancelling', 'cancelled')
+FINISHED_STATUSES = ('completed', 'failed', 'cancelled')
+
+
+class QueueFullError(RuntimeError):
+    """排队中的任务数已达到上限"""
+
+
+class JobQueue:
+    """
+    持久化任务队列
+
+    服务进程和各个工作进程分别创建自己的 JobQueue 实例（各自持有连接），
+    通过 SQLite 的 WAL 模式和 BEGIN IMMEDIATE 事务保证同一任务只被一个工作进程领取。
+    """
+
+    def __init__(self, path: Path, max_depth: Optional[int] = None):
+        """
+        Args:
+            path: SQLite 数据库文件路径
+            max_depth: 最多排队的任务数，超过时 submit 抛出 QueueFullError，None 表示不限制
+        """
+        self.logger = logging.getLogger(__name__)
+        self.path = Path(path)
+        self.max_depth = max_depth
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # 事务由代码显式控制
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30, isolation_level=None)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 0,
+                    parameters TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    worker_id TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_jobs_queue ON jobs (status, priority DESC, created_at)"
+            )
+
+    def submit(self, parameters: Dict[str, Any], priority: int = 0) -> Dict[str, Any]:
+        """
+        提交任务
+
+        Args:
+            parameters: create_content 的参数
+            priority: 优先级，数值越大越先执行，同优先级按提交顺序执行
+
+        Returns:
+            Dict: 任务记录
+
+        Raises:
+            QueueFullError: 排队中的任务数已达到 max_depth
+        """
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if self.max_depth is not None:
+                    depth = self._conn.execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+                    if depth >= self.max_depth:
+                        raise QueueFullError(f"任务队列已满（{depth}/{self.max_depth}）")
+                self._conn.execute(
+                    "INSERT INTO jobs (job_id, status, priority, parameters, created_at) VALUES (?, 'queued', ?, ?, ?)",
+                    (job_id, priority, json.dumps(parameters, ensure_ascii=False), time.time())
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return self.get(job_id)
+
+    def claim(self, worker_id: str) -> Optional[Dict[str, Any]]:
+        """领取优先级最高的排队任务并标记为 running，队列为空时返回 None"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT job_id FROM jobs WHERE status = 'queued' ORDER BY priority DESC, created_at LIMIT 1"
+                ).fetchone()
+                if row is not None:
+                    self._conn.execute(
+                        "UPDATE jobs SET status = 'running', worker_id = ?, attempts = attempts + 1, started_at = ? "
+                        "WHERE job_id = ?",
+                        (worker_id, time.time(), row[0])
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return None if row is None else self.get(row[0])
+
+    def complete(self, job_id: str, result: Dict[str, Any]) -> bool:
+        """保存任务结果，任务已被取消时返回 False"""
+        return self._finish(job_id, 'completed', result=json.dumps(result, ensure_ascii=False, default=str))
+
+    def fail(self, job_id: str, error: str) -> bool:
+        """记录任务失败，任务已被取消时返回 False"""
+        return self._finish(job_id, 'failed', error=error)
+
+    def _finish(self, job_id: str, status: str, result: Optional[str] = None, error: Optional[str] = None) -> bool:
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? "
+                "WHERE job_id = ? AND status = 'running'",
+                (status, result, error, time.time(), job_id)
+            )
+        return cursor.rowcount == 1
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        取消任务
+
+        排队中的任务直接取消；执行中的任务标记为 cancelling，由服务终止对应的工作进程后标记为 cancelled。
+        已结束的任务保持不变。任务不存在时返回 None。
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE job_id = ? AND status = 'queued'",
+                (now, job_id)
+            )
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelling' WHERE job_id = ? AND status = 'running'", (job_id,)
+            )
+        return self.get(job_id)
+
+    def mark_cancelled(self, job_id: str):
+        """工作进程终止后完成取消"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE job_id = ? AND status = 'cancelling'",
+                (time.time(), job_id)
+            )
+
+    def requeue_worker_jobs(self, worker_id: str, max_attempts: int) -> int:
+        """
+        工作进程异常退出后，将其执行中的任务重新排队
+
+        已达到 max_attempts 的任务标记为失败，正在取消的任务标记为 cancelled。
+
+        Returns:
+            int: 重新排队的任务数
+        """
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE worker_id = ? AND status = 'cancelling'",
+                    (now, worker_id)
+                )
+                self._conn.execute(
+                    "UPDATE jobs SET status = 'failed', error = '工作进程异常退出', finished_at = ? "
+                    "WHERE worker_id = ? AND status = 'running' AND attempts >= ?",
+                    (now, worker_id, max_attempts)
+                )
+                requeued = self._conn.execute(
+                    "UPDATE jobs SET status = 'queued', worker_id = NULL, started_at = NULL "
+                    "WHERE worker_id = ? AND status = 'running'",
+                    (worker_id,)
+                ).rowcount
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return requeued
+
+    def requeue_running(self) -> int:
+        """服务重启时，将上次未完成的任务重新排队"""
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE status = 'cancelling'", (time.time(),)
+            )
+            return self._conn.execute(
+                "UPDATE jobs SET status = 'queued', worker_id = NULL, started_at = NULL WHERE status = 'running'"
+            ).rowcount
+
+    def cancelling_jobs(self) -> List[Dict[str, Any]]:
+        """返回等待终止的任务"""
+        with self._lock:
+            job_ids = [row[0] for row in self._conn.execute(
+                "SELECT job_id FROM jobs WHERE status = 'cancelling'"
+            ).fetchall()]
+        return [self.get(job_id) for job_id in job_ids]
+
+    def get(self, job_id: str, include_result: bool = False) -> Optional[Dict[str, Any]]:
+        """返回任务记录，不存在时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, priority, parameters, result, error, worker_id, attempts, "
+                "created_at, started_at, finished_at FROM jobs WHERE job_id = ?",
+                (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+
+        status, priority, parameters, result, error, worker_id, attempts, created_at, started_at, finished_at = row
+        job = {
+            'job_id': job_id,
+            'status': status,
+            'priority': priority,
+            'parameters': json.loads(parameters),
+            'error': error,
+            'worker_id': worker_id,
+            'attempts': attempts,
+            'created_at': created_at,
+            'started_at': started_at,
+            'finished_at': finished_at
+        }
+        if status == 'queued':
+            job['position'] = self._position(priority, created_at)
+        if include_result:
+            job['result'] = json.loads(result) if result is not None else None
+        return job
+
+    def _position(self, priority: int, created_at: float) -> int:
+        """排队任务前面还有多少个任务"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = 'queued' "
+                "AND (priority > ? OR (priority = ? AND created_at < ?))",
+                (priority, priority, created_at)
+            ).fetchone()[0]
+
+    def stats(self) -> Dict[str, int]:
+        """各状态的任务数"""
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {status: 0 for status in JOB_STATUSES}
+        counts.update(dict(rows))
+        return counts
+
+    def purge(self, older_than: float) -> int:
+        """删除结束超过指定时间（秒）的任务"""
+        with self._lock:
+            return self._conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({', '.join('?' * len(FINISHED_STATUSES))}) AND finished_at < ?",
+                (*FINISHED_STATUSES, time.time() - older_than)
+            ).rowcount
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+# 用于单独测试的函数
+def test_job_queue():
+    """测试任务队列（无需API Key）"""
+    import tempfile
+
+    print("📮 测试任务队列...")
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / 'jobs.sqlite3'
+            queue = JobQueue(path, max_depth=3)
+
+            low = queue.submit({'topic': '低优先级'}, priority=0)
+            high = queue.submit({'topic': '高优先级'}, priority=5)
+            queue.submit({'topic': '待取消'}, priority=0)
+            assert queue.get(low['job_id'])['position'] == 1
+
+            try:
+                queue.submit({'topic': '超出队列深度'})
+                raise AssertionError("队列已满时应拒绝提交")
+            except QueueFullError:
+                print("✅ 队列已满时拒绝提交")
+
+            # 另一个连接（模拟工作进程）按优先级领取
+            worker_queue = JobQueue(path)
+            claimed = worker_queue.claim('worker-1')
+            assert claimed['job_id'] == high['job_id'] and claimed['status'] == 'running'
+            assert worker_queue.complete(claimed['job_id'], {'content': '完成'})
+            assert queue.get(high['job_id'], include_result=True)['result'] == {'content': '完成'}
+            print("✅ 高优先级任务先执行")
+
+            claimed = worker_queue.claim('worker-1')
+            assert claimed['job_id'] == low['job_id']
+            assert queue.cancel(low['job_id'])['status'] == 'cancelling'
+            assert not worker_queue.complete(low['job_id'], {'content': '已取消'})
+            queue.mark_cancelled(low['job_id'])
+            assert queue.get(low['job_id'])['status'] == 'cancelled'
+
+            pending = queue.stats()['queued']
+            cancelled = queue.cancel(queue.submit({'topic': '排队中取消'})['job_id'])
+            assert cancelled['status'] == 'cancelled' and queue.stats()['queued'] == pending
+            print("✅ 排队中和执行中的任务均可取消")
+
+            claimed = worker_queue.claim('worker-2')
+            assert worker_queue.requeue_worker_jobs('worker-2', max_attempts=2) == 1
+            assert queue.get(claimed['job_id'])['status'] == 'queued'
+            print("✅ 异常退出的工作进程的任务重新排队")
+
+            worker_queue.close()
+            queue.close()
+
+        print("\n🎉 任务队列测试通过！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 测试失败: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # 设置日志
+    logging.basicConfig(level=logging.INFO)
+
+    # 运行测试
+    test_job_queue()
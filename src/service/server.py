@@ -0,0 +1,465 @@
+"""
+内容创作服务 - 本地HTTP接口，任务写入持久化队列，由多个工作进程执行
+
+接口:
+    POST   /jobs                 提交任务，请求体为 create_content 的参数，可附带 priority
+    GET    /jobs/<job_id>        查询任务状态
+    GET    /jobs/<job_id>/result 获取任务结果（任务未完成时返回 409）
+    POST   /jobs/<job_id>/cancel 取消任务（也可使用 DELETE /jobs/<job_id>）
+    GET    /health               工作进程和队列状态
+
+启动: python -m src.service.server --workers 4 --port 8765
+"""
+import json
+import time
+import uuid
+import argparse
+import threading
+import logging
+import multiprocessing
+from http import HTTPStatus
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple, Callable
+
+from src.config import settings
+from src.crew.ContentCrew import normalize_job_parameters
+from src.service.job_queue import JobQueue, QueueFullError
+from src.service.worker import run_worker
+
+
+class ContentService:
+    """
+    内容创作服务
+
+    服务进程只负责接收请求和管理工作进程，任务在工作进程中执行。
+    监督线程定期检查工作进程：异常退出的进程被重启，其执行中的任务重新排队；
+    执行中的任务被取消时，终止对应的工作进程并重启一个新进程。
+    连续崩溃的工作进程按指数退避延迟重启，连续崩溃达到 SERVICE_MAX_CONSECUTIVE_CRASHES 次时服务报告 unhealthy。
+    """
+
+    # 工作进程入口，参数为 (队列路径, 工作进程ID, 轮询间隔, 停止事件)
+    worker_target: Callable = staticmethod(run_worker)
+
+    def __init__(self,
+                 host: Optional[str] = None,
+                 port: Optional[int] = None,
+                 workers: Optional[int] = None,
+                 queue_path: Optional[Path] = None,
+                 max_depth: Optional[int] = None):
+        """
+        Args:
+            host: 监听地址，默认读取 SERVICE_HOST
+            port: 监听端口，默认读取 SERVICE_PORT，0 表示随机端口
+            workers: 工作进程数，默认读取 SERVICE_WORKERS
+            queue_path: 任务队列数据库路径，默认为 SERVICE_DIR/jobs.sqlite3
+            max_depth: 最多排队的任务数，默认读取 SERVICE_MAX_QUEUE_DEPTH
+        """
+        self.logger = logging.getLogger(__name__)
+        self.host = host or settings.SERVICE_HOST
+        self.port = settings.SERVICE_PORT if port is None else port
+        self.workers = settings.SERVICE_WORKERS if workers is None else workers
+        self.queue_path = Path(queue_path or settings.SERVICE_DIR / 'jobs.sqlite3')
+        self.queue = JobQueue(
+            self.queue_path, max_depth=settings.SERVICE_MAX_QUEUE_DEPTH if max_depth is None else max_depth
+        )
+
+        # spawn 方式启动，避免子进程继承服务进程中的线程和数据库连接
+        self._mp_context = multiprocessing.get_context('spawn')
+        self._stop_event = self._mp_context.Event()
+        self._processes: List[Optional[Any]] = [None] * self.workers
+        self._worker_ids: List[Optional[str]] = [None] * self.workers
+        # 每个工作进程位置的启动时间、连续崩溃次数和下次允许重启的时间
+        self._started_at: List[float] = [0.0] * self.workers
+        self._crashes: List[int] = [0] * self.workers
+        self._restart_at: List[Optional[float]] = [None] * self.workers
+        self._processes_lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._httpd: Optional[ThreadingHTTPServer] = None
+        self._threads: List[threading.Thread] = []
+
+    def start(self) -> Tuple[str, int]:
+        """启动工作进程、监督线程和HTTP服务，返回实际监听的地址"""
+        requeued = self.queue.requeue_running()
+        if requeued:
+            print(f"🔁 {requeued} 个未完成的任务已重新排队")
+        self.queue.purge(older_than=settings.SERVICE_JOB_RETENTION)
+
+        for index in range(self.workers):
+            self._start_worker(index)
+
+        handler = type('ContentServiceHandler', (_RequestHandler,), {'service': self})
+        self._httpd = ThreadingHTTPServer((self.host, self.port), handler)
+        self._httpd.daemon_threads = True
+
+        for target, name in ((self._httpd.serve_forever, 'service-http'), (self._supervise, 'service-supervisor')):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+        host, port = self._httpd.server_address[:2]
+        print(f"🌐 内容创作服务已启动: http://{host}:{port}（工作进程 {self.workers} 个）")
+        return host, port
+
+    def serve_forever(self):
+        """启动服务并阻塞，Ctrl+C 时停止"""
+        self.start()
+        try:
+            while not self._stopping.is_set():
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("\n🛑 正在停止服务...")
+        finally:
+            self.stop()
+
+    def stop(self, timeout: float = 30):
+        """停止HTTP服务，等待工作进程完成当前任务后退出，超时则强制终止"""
+        self._stopping.set()
+        self._stop_event.set()
+        if self._httpd is not None:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+        deadline = time.monotonic() + timeout
+        with self._processes_lock:
+            processes = [p for p in self._processes if p is not None]
+        for process in processes:
+            process.join(max(0, deadline - time.monotonic()))
+            if process.is_alive():
+                process.terminate()
+                process.join()
+
+        for thread in self._threads:
+            thread.join(timeout=5)
+        # 被强制终止的任务在下次启动时重新排队
+        self.queue.close()
+
+    def _start_worker(self, index: int):
+        worker_id = f"worker-{index}-{uuid.uuid4().hex[:8]}"
+        process = self._mp_context.Process(
+            target=self.worker_target,
+            args=(str(self.queue_path), worker_id, settings.SERVICE_POLL_INTERVAL, self._stop_event),
+            name=worker_id,
+            daemon=True
+        )
+        process.start()
+        with self._processes_lock:
+            self._processes[index] = process
+            self._worker_ids[index] = worker_id
+            self._started_at[index] = time.monotonic()
+            self._restart_at[index] = None
+
+    def restart_delay(self, crashes: int) -> float:
+        """连续崩溃 crashes 次后重启前的等待时间（第一次崩溃立即重启）"""
+        if crashes <= 1:
+            return 0.0
+        return min(settings.SERVICE_RESTART_BACKOFF_MAX_S, settings.SERVICE_RESTART_BACKOFF_BASE_S * 2 ** (crashes - 2))
+
+    def _supervise(self):
+        """重启异常退出的工作进程（连续崩溃时指数退避），并终止执行已取消任务的工作进程"""
+        while not self._stopping.wait(settings.SERVICE_POLL_INTERVAL):
+            try:
+                cancelling = {job['worker_id'] for job in self.queue.cancelling_jobs()}
+                for index in range(self.workers):
+                    with self._processes_lock:
+                        process, worker_id = self._processes[index], self._worker_ids[index]
+                    if process is None or self._stopping.is_set():
+                        continue
+
+                    if worker_id in cancelling and process.is_alive():
+                        process.terminate()
+                        process.join()
+                        print(f"🛑 已终止执行取消任务的工作进程 {worker_id}")
+                        self.queue.requeue_worker_jobs(worker_id, settings.SERVICE_MAX_ATTEMPTS)
+                    elif process.is_alive():
+                        continue
+                    else:
+                        if self._restart_at[index] is None:
+                            # 任务立即重新排队，由其他工作进程执行，不必等待退避
+                            self._record_crash(index, worker_id, process.exitcode)
+                            self.queue.requeue_worker_jobs(worker_id, settings.SERVICE_MAX_ATTEMPTS)
+                        if time.monotonic() < self._restart_at[index]:
+                            continue
+
+                    self._start_worker(index)
+            except Exception as e:
+                self.logger.error(f"❌ 工作进程监督失败: {str(e)}")
+
+    def _record_crash(self, index: int, worker_id: str, exitcode: Optional[int]):
+        """记录一次异常退出并计算重启时间，运行时间超过退避上限的进程不算连续崩溃"""
+        now = time.monotonic()
+        if now - self._started_at[index] >= settings.SERVICE_RESTART_BACKOFF_MAX_S:
+            self._crashes[index] = 0
+        self._crashes[index] += 1
+        delay = self.restart_delay(self._crashes[index])
+        self._restart_at[index] = now + delay
+        self.logger.warning(f"⚠️  工作进程 {worker_id} 异常退出 (exitcode={exitcode})，"
+                            f"连续第 {self._crashes[index]} 次，{delay:.1f}s 后重启")
+        if self._crashes[index] == settings.SERVICE_MAX_CONSECUTIVE_CRASHES:
+            self.logger.error(f"❌ 工作进程连续崩溃 {self._crashes[index]} 次，服务状态为 unhealthy")
+
+    def health(self) -> Dict[str, Any]:
+        """工作进程和队列状态，工作进程连续崩溃达到上限且尚未恢复时 status 为 unhealthy"""
+        now = time.monotonic()
+        with self._processes_lock:
+            alive = sum(1 for p in self._processes if p is not None and p.is_alive())
+            # 崩溃过的进程重启后稳定运行超过退避上限才算恢复
+            crashing = [
+                index for index in range(self.workers)
+                if self._crashes[index] >= settings.SERVICE_MAX_CONSECUTIVE_CRASHES
+                and now - self._started_at[index] < settings.SERVICE_RESTART_BACKOFF_MAX_S
+            ]
+        return {
+            'status': 'unhealthy' if crashing else 'ok',
+            'workers': {'configured': self.workers, 'alive': alive,
+                        'consecutive_crashes': max(self._crashes, default=0)},
+            'queue': self.queue.stats(),
+            'max_depth': self.queue.max_depth
+        }
+
+
+# 优先级存入 SQLite 的 INTEGER 列，超出64位整数范围无法写入
+_PRIORITY_LIMIT = 2 ** 63
+
+
+def _parse_priority(value: Any) -> int:
+    """校验请求中的 priority，与其他数值参数一样不接受布尔值、字符串和小数，不合法时抛出 ValueError"""
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise ValueError("参数 priority 必须是整数")
+    if not -_PRIORITY_LIMIT <= value < _PRIORITY_LIMIT:
+        raise ValueError("参数 priority 超出范围")
+    return value
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    """HTTP请求处理，service 属性在 ContentService.start 中绑定"""
+
+    service: ContentService = None
+
+    def do_GET(self):
+        parts = self._path_parts()
+        if parts == ['health']:
+            health = self.service.health()
+            status = HTTPStatus.OK if health['status'] == 'ok' else HTTPStatus.SERVICE_UNAVAILABLE
+            return self._send(status, health)
+
+        if len(parts) == 2 and parts[0] == 'jobs':
+            job = self.service.queue.get(parts[1])
+            if job is None:
+                return self._send_error(HTTPStatus.NOT_FOUND, "任务不存在")
+            return self._send(HTTPStatus.OK, job)
+
+        if len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'result':
+            job = self.service.queue.get(parts[1], include_result=True)
+            if job is None:
+                return self._send_error(HTTPStatus.NOT_FOUND, "任务不存在")
+            if job['status'] != 'completed':
+                return self._send(HTTPStatus.CONFLICT, {
+                    'job_id': job['job_id'], 'status': job['status'], 'error': job['error']
+                })
+            return self._send(HTTPStatus.OK, {'job_id': job['job_id'], 'status': job['status'],
+                                              'result': job['result']})
+
+        self._send_error(HTTPStatus.NOT_FOUND, "接口不存在")
+
+    def do_POST(self):
+        parts = self._path_parts()
+        if parts == ['jobs']:
+            return self._submit()
+        if len(parts) == 3 and parts[0] == 'jobs' and parts[2] == 'cancel':
+            return self._cancel(parts[1])
+        self._send_error(HTTPStatus.NOT_FOUND, "接口不存在")
+
+    def do_DELETE(self):
+        parts = self._path_parts()
+        if len(parts) == 2 and parts[0] == 'jobs':
+            return self._cancel(parts[1])
+        self._send_error(HTTPStatus.NOT_FOUND, "接口不存在")
+
+    def _submit(self):
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+            body = json.loads(self.rfile.read(length) or b'{}')
+            if not isinstance(body, dict):
+                raise ValueError("请求体必须是JSON对象")
+            priority = _parse_priority(body.pop('priority', 0))
+            parameters = normalize_job_parameters(body)
+        except (ValueError, TypeError) as e:
+            return self._send_error(HTTPStatus.BAD_REQUEST, str(e))
+
+        try:
+            job = self.service.queue.submit(parameters, priority=priority)
+        except QueueFullError as e:
+            return self._send_error(HTTPStatus.TOO_MANY_REQUESTS, str(e),
+                                    headers={'Retry-After': str(max(1, int(settings.SERVICE_POLL_INTERVAL * 10)))})
+
+        self._send(HTTPStatus.ACCEPTED, job, headers={'Location': f"/jobs/{job['job_id']}"})
+
+    def _cancel(self, job_id: str):
+        job = self.service.queue.cancel(job_id)
+        if job is None:
+            return self._send_error(HTTPStatus.NOT_FOUND, "任务不存在")
+        status = HTTPStatus.CONFLICT if job['status'] in ('completed', 'failed') else HTTPStatus.OK
+        self._send(status, job)
+
+    def _path_parts(self) -> List[str]:
+        return [part for part in self.path.split('?', 1)[0].split('/') if part]
+
+    def _send(self, status: HTTPStatus, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload, ensure_ascii=False, default=str).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_error(self, status: HTTPStatus, message: str, headers: Optional[Dict[str, str]] = None):
+        self._send(status, {'error': message}, headers=headers)
+
+    def log_message(self, format, *args):
+        logging.getLogger(__name__).info("%s - %s", self.address_string(), format % args)
+
+
+def main():
+    """命令行入口"""
+    parser = argparse.ArgumentParser(description='CrewAI-ContentStudio 内容创作服务')
+    parser.add_argument('--host', default=None, help='监听地址（默认 SERVICE_HOST）')
+    parser.add_argument('--port', type=int, default=None, help='监听端口（默认 SERVICE_PORT）')
+    parser.add_argument('--workers', type=int, default=None, help='工作进程数（默认 SERVICE_WORKERS）')
+    parser.add_argument('--max-depth', type=int, default=None, help='最大排队任务数（默认 SERVICE_MAX_QUEUE_DEPTH）')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    ContentService(host=args.host, port=args.port, workers=args.workers, max_depth=args.max_depth).serve_forever()
+
+
+def _exit_with_error(*args):
+    """测试用的工作进程入口：启动后立即异常退出"""
+    raise SystemExit(3)
+
+
+# 用于单独测试的函数
+def test_content_service():
+    """测试服务接口（工作进程使用离线模拟LLM，无需API Key）"""
+    import os
+    import tempfile
+    import urllib.request
+    import urllib.error
+
+    print("🌐 测试内容创作服务...")
+
+    def request(method, url, payload=None):
+        data = json.dumps(payload).encode('utf-8') if payload is not None else None
+        req = urllib.request.Request(url, data=data, method=method, headers={'Content-Type': 'application/json'})
+        try:
+            with urllib.request.urlopen(req, timeout=10) as response:
+                return response.status, json.loads(response.read())
+        except urllib.error.HTTPError as e:
+            return e.code, json.loads(e.read())
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            service = ContentService(host='127.0.0.1', port=0, workers=0,
+                                     queue_path=Path(tmp_dir) / 'jobs.sqlite3', max_depth=2)
+            host, port = service.start()
+            base = f"http://{host}:{port}"
+
+            try:
+                status, job = request('POST', f"{base}/jobs", {'topic': '人工智能', 'word_count': 800})
+                assert status == 202 and job['status'] == 'queued'
+                status, urgent = request('POST', f"{base}/jobs", {'topic': '突发新闻', 'priority': 10})
+                assert status == 202
+                print(f"✅ 提交任务: {job['job_id']}")
+
+                status, body = request('POST', f"{base}/jobs", {'topic': '超出队列深度'})
+                assert status == 429, status
+                print(f"✅ 队列已满时返回 429: {body['error']}")
+
+                status, body = request('POST', f"{base}/jobs", {'topic': 'AI', 'unknown': 1})
+                assert status == 400
+                for invalid in ({'topic': 'AI', 'word_count': '800'}, {'topic': 'AI', 'word_count': 0},
+                                {'topic': 'AI', 'deadline_s': -1}, {'topic': 'AI', 'use_cache': 'yes'},
+                                {'topic': 123}, {'topic': 'AI', 'max_tokens': 1.5},
+                                {'topic': 'AI', 'priority': True}, {'topic': 'AI', 'priority': '10'},
+                                {'topic': 'AI', 'priority': 1.5}, {'topic': 'AI', 'priority': 2 ** 70}):
+                    status, body = request('POST', f"{base}/jobs", invalid)
+                    assert status == 400, invalid
+                print(f"✅ 参数类型和范围不合法时返回 400: {body['error']}")
+
+                status, body = request('GET', f"{base}/jobs/{job['job_id']}")
+                assert status == 200 and body['position'] == 1
+                status, body = request('GET', f"{base}/jobs/{job['job_id']}/result")
+                assert status == 409 and body['status'] == 'queued'
+
+                status, body = request('DELETE', f"{base}/jobs/{job['job_id']}")
+                assert status == 200 and body['status'] == 'cancelled'
+                print("✅ 查询、取消接口正常")
+
+                status, body = request('GET', f"{base}/health")
+                assert status == 200 and body['queue']['queued'] == 1
+                assert request('GET', f"{base}/jobs/missing")[0] == 404
+            finally:
+                service.stop()
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # 端到端：工作进程（spawn 启动，从环境变量读取配置）使用模拟LLM执行任务直到完成
+            overrides = {'LLM_BACKEND': 'fake', 'FAKE_LLM_LATENCY_S': '0', 'FAKE_TOOL_LATENCY_S': '0',
+                         'CACHE_DIR': f"{tmp_dir}/cache", 'RAG_STORE_DIR': f"{tmp_dir}/rag_store",
+                         'HISTORY_DIR': f"{tmp_dir}/history", 'CHECKPOINT_DIR': f"{tmp_dir}/checkpoints"}
+            saved_env = {name: os.environ.get(name) for name in overrides}
+            os.environ.update(overrides)
+            service = ContentService(host='127.0.0.1', port=0, workers=1, queue_path=Path(tmp_dir) / 'jobs.sqlite3')
+            host, port = service.start()
+            base = f"http://{host}:{port}"
+            try:
+                status, job = request('POST', f"{base}/jobs", {'topic': '人工智能', 'word_count': 600})
+                assert status == 202
+                deadline = time.monotonic() + 180
+                while job['status'] in ('queued', 'running') and time.monotonic() < deadline:
+                    time.sleep(0.5)
+                    job = request('GET', f"{base}/jobs/{job['job_id']}")[1]
+                assert job['status'] == 'completed', job
+                status, body = request('GET', f"{base}/jobs/{job['job_id']}/result")
+                assert status == 200 and body['result']['content'], body
+                print(f"✅ 工作进程完成任务，结果 {len(body['result']['content'])} 字符")
+            finally:
+                service.stop()
+                for name, value in saved_env.items():
+                    if value is None:
+                        os.environ.pop(name, None)
+                    else:
+                        os.environ[name] = value
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # 启动即退出的工作进程：重启间隔按指数增长，连续崩溃达到上限后报告 unhealthy
+            class CrashingService(ContentService):
+                worker_target = staticmethod(_exit_with_error)
+
+            limits = (settings.SERVICE_RESTART_BACKOFF_BASE_S, settings.SERVICE_MAX_CONSECUTIVE_CRASHES)
+            settings.SERVICE_RESTART_BACKOFF_BASE_S, settings.SERVICE_MAX_CONSECUTIVE_CRASHES = 0.2, 3
+            service = CrashingService(host='127.0.0.1', port=0, workers=1, queue_path=Path(tmp_dir) / 'jobs.sqlite3')
+            host, port = service.start()
+            try:
+                assert [service.restart_delay(n) for n in (1, 2, 3)] == [0.0, 0.2, 0.4]
+                deadline = time.monotonic() + 20
+                while service.health()['status'] == 'ok' and time.monotonic() < deadline:
+                    time.sleep(0.1)
+                status, body = request('GET', f"http://{host}:{port}/health")
+                assert status == 503 and body['status'] == 'unhealthy', body
+                print(f"✅ 工作进程连续崩溃 {body['workers']['consecutive_crashes']} 次后退避重启并返回 503")
+            finally:
+                service.stop()
+                settings.SERVICE_RESTART_BACKOFF_BASE_S, settings.SERVICE_MAX_CONSECUTIVE_CRASHES = limits
+
+        print("\n🎉 内容创作服务测试通过！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 测试失败: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""
+任务工作进程 - 持有常驻的 ContentCrew，循环领取并执行任务队列中的任务
+"""
+import time
+import logging
+from pathlib import Path
+
+from src.crew.ContentCrew import ContentCrew
+from src.service.job_queue import JobQueue
+
+
+def run_worker(queue_path: str, worker_id: str, poll_interval: float = 0.5, stop_event=None):
+    """
+    工作进程入口
+
+    ContentCrew 只在进程启动时初始化一次，智能体池、缓存等在任务之间复用。
+    stop_event 被设置后，执行完当前任务再退出。
+
+    Args:
+        queue_path: 任务队列数据库路径
+        worker_id: 工作进程标识，记录在领取的任务上
+        poll_interval: 队列为空时的轮询间隔（秒）
+        stop_event: multiprocessing.Event，用于通知进程退出
+    """
+    logger = logging.getLogger(__name__)
+    crew = ContentCrew()
+    queue = JobQueue(Path(queue_path))
+    print(f"👷 工作进程 {worker_id} 已就绪")
+
+    try:
+        while stop_event is None or not stop_event.is_set():
+            job = queue.claim(worker_id)
+            if job is None:
+                time.sleep(poll_interval)
+                continue
+
+            job_id = job['job_id']
+            print(f"👷 {worker_id} 开始执行任务 {job_id}: {job['parameters'].get('topic')}")
+            try:
+                result = crew.create_content(**job['parameters'])
+            except Exception as e:
+                logger.error(f"❌ 任务执行失败: {job_id}, 错误: {str(e)}")
+                queue.fail(job_id, str(e))
+                continue
+
+            if not queue.complete(job_id, result):
+                print(f"⚠️  任务 {job_id} 已被取消，丢弃结果")
+    finally:
+        queue.close()
@@ -0,0 +1,432 @@
+"""
+网页预取 - 并发抓取搜索结果中的网页，在研究员读取之前收录到网页内容向量库
+
+研究员通过工具逐个读取网页，每次都要等待抓取完成。搜索返回结果后，预取阶段用共享连接池
+（keep-alive）并发抓取候选网址，每个域名限制并发数，单页限制大小和耗时；抓取到的内容
+直接收录到向量库，研究员随后读取这些网址时不再抓取。
+"""
+import json
+import time
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Iterable
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from src.config import settings
+from src.tools.rag_store import RagStore, get_rag_store, normalize_url
+
+logger = logging.getLogger(__name__)
+
+# 可以提取文本的内容类型
+TEXT_CONTENT_TYPES = ('text/html', 'text/plain', 'application/xhtml+xml')
+
+USER_AGENT = "Mozilla/5.0 (compatible; ContentCrew/1.0; research prefetch)"
+
+
+class PageTooLargeError(ValueError):
+    """网页超过大小限制"""
+
+
+def extract_result_urls(result: Any, limit: Optional[int] = None) -> List[str]:
+    """
+    从搜索结果中提取候选网址（按结果顺序去重）
+
+    Args:
+        result: SerperDevTool 返回的字典或其 JSON 字符串，包含 organic、news 等结果列表
+        limit: 最多返回的网址数量
+
+    Returns:
+        List[str]: http(s) 网址
+    """
+    if isinstance(result, str):
+        try:
+            result = json.loads(result)
+        except ValueError:
+            return []
+    if not isinstance(result, dict):
+        return []
+
+    urls: List[str] = []
+    seen = set()
+    for section in ('organic', 'news', 'peopleAlsoAsk'):
+        for item in result.get(section) or []:
+            link = item.get('link') if isinstance(item, dict) else None
+            if not link or not link.startswith(('http://', 'https://')):
+                continue
+            key = normalize_url(link)
+            if key not in seen:
+                seen.add(key)
+                urls.append(link)
+    return urls[:limit] if limit else urls
+
+
+class PageFetcher:
+    """
+    并发网页抓取
+
+    所有请求共用一个 requests.Session（连接池按域名保持 keep-alive 连接）；
+    同一域名同时最多 per_host 个请求，单页超过 max_bytes 或 timeout 秒即放弃。
+    计数记录在 stats 中：fetched、failed、too_large、skipped（非文本内容）、bytes。
+    """
+
+    def __init__(self,
+                 max_workers: Optional[int] = None,
+                 per_host: Optional[int] = None,
+                 timeout: Optional[float] = None,
+                 max_bytes: Optional[int] = None):
+        """
+        Args:
+            max_workers: 最大并发数，默认读取 PREFETCH_MAX_WORKERS
+            per_host: 单个域名的最大并发数，默认读取 PREFETCH_PER_HOST
+            timeout: 单页的总耗时上限（秒），默认读取 PREFETCH_TIMEOUT_S
+            max_bytes: 单页的大小上限（字节），默认读取 PREFETCH_MAX_BYTES
+        """
+        self.max_workers = max_workers or settings.PREFETCH_MAX_WORKERS
+        self.per_host = per_host or settings.PREFETCH_PER_HOST
+        self.timeout = timeout or settings.PREFETCH_TIMEOUT_S
+        self.max_bytes = max_bytes or settings.PREFETCH_MAX_BYTES
+
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=self.max_workers, pool_maxsize=self.per_host)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="page-fetch")
+
+        self._host_limits: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+        self.stats = {'fetched': 0, 'failed': 0, 'too_large': 0, 'skipped': 0, 'bytes': 0}
+
+    def _count(self, field: str, amount: int = 1):
+        with self._lock:
+            self.stats[field] += amount
+
+    def _host_limit(self, url: str) -> threading.BoundedSemaphore:
+        host = urlsplit(url).netloc.lower()
+        with self._lock:
+            if host not in self._host_limits:
+                self._host_limits[host] = threading.BoundedSemaphore(self.per_host)
+            return self._host_limits[host]
+
+    def fetch(self, url: str) -> Dict[str, Any]:
+        """
+        抓取单个网页
+
+        Returns:
+            Dict: url、status、content_type、content（bytes，失败时为 None）、elapsed、error
+        """
+        started = time.perf_counter()
+        page = {'url': url, 'status': None, 'content_type': None, 'content': None, 'elapsed': 0.0, 'error': None}
+        try:
+            with self._host_limit(url):
+                deadline = time.perf_counter() + self.timeout
+                with self.session.get(url, stream=True, timeout=self.timeout) as response:
+                    page['status'] = response.status_code
+                    response.raise_for_status()
+                    content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+                    page['content_type'] = content_type
+                    if content_type and content_type not in TEXT_CONTENT_TYPES:
+                        self._count('skipped')
+                        page['error'] = f"不支持的内容类型: {content_type}"
+                        return page
+
+                    declared = int(response.headers.get('Content-Length') or 0)
+                    if declared > self.max_bytes:
+                        raise PageTooLargeError(f"网页大小 {declared} 超过上限 {self.max_bytes}")
+
+                    chunks, size = [], 0
+                    for chunk in response.iter_content(chunk_size=64 * 1024):
+                        size += len(chunk)
+                        if size > self.max_bytes:
+                            raise PageTooLargeError(f"网页大小超过上限 {self.max_bytes}")
+                        if time.perf_counter() > deadline:
+                            raise TimeoutError(f"抓取超时 ({self.timeout:.0f}s)")
+                        chunks.append(chunk)
+                    page['content'] = b''.join(chunks)
+
+            self._count('fetched')
+            self._count('bytes', len(page['content']))
+        except PageTooLargeError as e:
+            self._count('too_large')
+            page['error'] = str(e)
+        except Exception as e:
+            self._count('failed')
+            page['error'] = str(e)
+        finally:
+            page['elapsed'] = round(time.perf_counter() - started, 3)
+        return page
+
+    def fetch_all(self, urls: Iterable[str]) -> List[Dict[str, Any]]:
+        """并发抓取多个网页（规范化后相同的网址只抓取一次），按输入顺序返回"""
+        unique: Dict[str, str] = {}
+        for url in urls:
+            unique.setdefault(normalize_url(url), url)
+        return list(self._executor.map(self.fetch, unique.values()))
+
+    def close(self):
+        """关闭线程池和连接池"""
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+
+class ResearchPrefetcher:
+    """
+    研究预取：搜索结果返回后在后台抓取候选网页并收录到向量库
+
+    已收录的网址直接跳过。计数记录在 stats 中：rounds（预取轮数）、pages（收录的网页数）、errors。
+    """
+
+    def __init__(self, store: RagStore, fetcher: Optional[PageFetcher] = None, max_urls: Optional[int] = None):
+        """
+        Args:
+            store: 网页内容向量库
+            fetcher: 网页抓取器，默认按 PREFETCH_* 设置创建
+            max_urls: 每轮最多预取的网址数量，默认读取 PREFETCH_MAX_URLS
+        """
+        self.store = store
+        self.fetcher = fetcher or PageFetcher()
+        self.max_urls = max_urls or settings.PREFETCH_MAX_URLS
+        self._lock = threading.Lock()
+        self.stats = {'rounds': 0, 'pages': 0, 'errors': 0}
+
+    def _count(self, field: str, amount: int = 1):
+        with self._lock:
+            self.stats[field] += amount
+
+    def prefetch(self, urls: Iterable[str]) -> List[Dict[str, Any]]:
+        """
+        抓取并收录尚未收录的网址，返回每个网址的抓取结果（不含网页内容）
+
+        下载前先在向量库中登记，下载期间研究员读取同一网址时等待这次收录，不会再抓取一次；
+        已收录或正在收录的网址跳过。
+        """
+        claims: Dict[str, Any] = {}
+        for url in urls:
+            if len(claims) >= self.max_urls:
+                break
+            key = normalize_url(url)
+            if key in claims:
+                continue
+            flight = self.store.claim_url(url)
+            if flight is not None:
+                claims[key] = (url, flight)
+        if not claims:
+            return []
+        self._count('rounds')
+
+        pages = []
+        try:
+            pages = self.fetcher.fetch_all([url for url, _ in claims.values()])
+            for page in pages:
+                _, flight = claims.pop(normalize_url(page['url']))
+                if page['content'] is None:
+                    self.store.release_claim(flight)
+                    continue
+                try:
+                    self.store.add_claimed(flight, page['url'], page['content'])
+                    self._count('pages')
+                except Exception as e:
+                    self._count('errors')
+                    logger.warning(f"⚠️  预取的网页收录失败: {page['url']}, 错误: {str(e)}")
+        finally:
+            # 出错时未处理的登记必须释放，否则等待的研究员会一直阻塞
+            for _, flight in claims.values():
+                self.store.release_claim(flight)
+
+        fetched = sum(1 for page in pages if page['content'] is not None)
+        slowest = max(page['elapsed'] for page in pages)
+        logger.info(f"📥 预取 {fetched}/{len(pages)} 个网页，最慢 {slowest:.2f}s")
+        return [{key: value for key, value in page.items() if key != 'content'} for page in pages]
+
+    def on_search_results(self, result: Any):
+        """搜索结果回调：在后台线程中预取结果中的网址，不阻塞研究员"""
+        urls = extract_result_urls(result, self.max_urls)
+        if urls:
+            threading.Thread(target=self._prefetch_quietly, args=(urls,), name="research-prefetch", daemon=True).start()
+
+    def _prefetch_quietly(self, urls: List[str]):
+        try:
+            self.prefetch(urls)
+        except Exception as e:
+            self._count('errors')
+            logger.warning(f"⚠️  研究预取失败: {str(e)}")
+
+
+_shared_prefetcher: Optional[ResearchPrefetcher] = None
+_shared_prefetcher_lock = threading.Lock()
+
+
+def get_research_prefetcher() -> ResearchPrefetcher:
+    """进程内共享的研究预取器（使用共享的网页内容向量库和连接池），首次使用时创建"""
+    global _shared_prefetcher
+    with _shared_prefetcher_lock:
+        if _shared_prefetcher is None:
+            _shared_prefetcher = ResearchPrefetcher(get_rag_store())
+        return _shared_prefetcher
+
+
+def research_prefetch_stats() -> Optional[Dict[str, Any]]:
+    """进程内共享预取器的计数，尚未使用时返回 None"""
+    if _shared_prefetcher is None:
+        return None
+    return {**_shared_prefetcher.stats, **{f'fetch_{k}': v for k, v in _shared_prefetcher.fetcher.stats.items()}}
+
+
+# 用于单独测试的函数
+def test_page_fetcher():
+    """测试网页预取（无需API Key，使用本地HTTP服务）"""
+    import tempfile
+    from pathlib import Path
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    print("📥 测试网页预取...")
+
+    try:
+        active = {'now': 0, 'max': 0, 'connections': set(), 'paths': []}
+        active_lock = threading.Lock()
+
+        class StandInHandler(BaseHTTPRequestHandler):
+            """/page/<毫秒> 延迟后返回网页，/big 返回超大网页，/image 返回图片"""
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                with active_lock:
+                    active['now'] += 1
+                    active['max'] = max(active['max'], active['now'])
+                    active['connections'].add(self.client_address)
+                path = urlsplit(self.path).path
+                with active_lock:
+                    active['paths'].append(self.path)
+                try:
+                    if path.startswith('/page/'):
+                        delay_ms = int(path.split('/')[2])
+                        time.sleep(delay_ms / 1000)
+                        body = f"<html><body><p>{'预取的网页内容。' * 20}{delay_ms}</p></body></html>".encode('utf-8')
+                        self._reply(body, 'text/html; charset=utf-8')
+                    elif path == '/big':
+                        self._reply(b'x' * 300_000, 'text/html')
+                    else:
+                        self._reply(b'\x89PNG', 'image/png')
+                finally:
+                    with active_lock:
+                        active['now'] -= 1
+
+            def _reply(self, body: bytes, content_type: str):
+                self.send_response(200)
+                self.send_header('Content-Type', content_type)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        class StandInServer(ThreadingHTTPServer):
+            # 默认的监听队列只有 5，20 个并发连接会有一部分等待重传
+            request_queue_size = 64
+
+        server = StandInServer(('127.0.0.1', 0), StandInHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_port}"
+
+        # 20 个来源，耗时 50-300ms：总耗时接近最慢的一个，而不是全部之和
+        delays = [50 + (i * 37) % 250 for i in range(19)] + [300]
+        urls = [f"{base}/page/{delay}" for delay in delays]
+        fetcher = PageFetcher(max_workers=20, per_host=20, timeout=5, max_bytes=100_000)
+        started = time.perf_counter()
+        pages = fetcher.fetch_all(urls)
+        elapsed = time.perf_counter() - started
+        assert all(page['content'] for page in pages) and [page['url'] for page in pages] == urls
+        assert elapsed < 0.3 + 0.25, elapsed
+        print(f"✅ 20 个来源并发抓取: {elapsed:.2f}s（最慢 0.30s，串行约 {sum(delays) / 1000:.1f}s）")
+
+        # 连接复用：第二轮请求不再新建全部连接
+        connections = len(active['connections'])
+        second = fetcher.fetch_all([f"{base}/page/1?round=2&i={i}" for i in range(10)])
+        assert all(page['content'] for page in second)
+        assert len(active['connections']) < connections + 10
+        print(f"✅ 连接池复用连接: 两轮 30 个请求共 {len(active['connections'])} 个连接")
+
+        # 单个域名的并发上限
+        limited = PageFetcher(max_workers=10, per_host=2, timeout=5)
+        active['max'] = 0
+        limited.fetch_all([f"{base}/page/100?i={i}" for i in range(6)])
+        assert active['max'] <= 2
+        print(f"✅ 单个域名并发不超过 {limited.per_host}")
+
+        big, image, missing = fetcher.fetch_all([f"{base}/big", f"{base}/image", "http://127.0.0.1:9/none"])
+        assert big['content'] is None and '上限' in big['error']
+        assert image['content'] is None and image['content_type'] == 'image/png'
+        assert missing['error']
+        print(f"✅ 超大网页、非文本内容和连接失败被跳过: {fetcher.stats}")
+
+        timeout_fetcher = PageFetcher(max_workers=2, per_host=2, timeout=0.2)
+        slow = timeout_fetcher.fetch(f"{base}/page/1000")
+        assert slow['content'] is None and slow['elapsed'] < 0.9
+        print("✅ 超时的网页被放弃")
+
+        # 预取搜索结果中的网址并收录到向量库
+        from src.tools.rag_store import RagStore
+        from embedchain.embedder.base import BaseEmbedder, EmbeddingFunc
+
+        class ConstantEmbedder(BaseEmbedder):
+            def __init__(self):
+                super().__init__()
+                self.set_embedding_fn(EmbeddingFunc(lambda texts: [[1.0] * 8 for _ in texts]))
+                self.set_vector_dimension(8)
+
+        search_result = {'organic': [{'title': f'结果{i}', 'link': url} for i, url in enumerate(urls[:5])]}
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            store = RagStore(root=Path(tmp_dir), embedding_model=ConstantEmbedder())
+            prefetcher = ResearchPrefetcher(store, fetcher)
+            assert extract_result_urls(json.dumps(search_result)) == urls[:5]
+            prefetcher.prefetch(extract_result_urls(search_result))
+            assert all(store.has_url(url) for url in urls[:5]) and prefetcher.stats['pages'] == 5
+            assert prefetcher.prefetch(urls[:5]) == []
+            print(f"✅ 预取的网页收录到向量库，再次预取时跳过: {prefetcher.stats}")
+
+            # 预取下载期间研究员读取同一网址：等待预取的收录，不再抓取
+            slow_url = f"{base}/page/300?claimed=1"
+            background = threading.Thread(target=prefetcher.prefetch, args=([slow_url],))
+            background.start()
+            time.sleep(0.1)
+            skipped = store.stats['sources_skipped']
+            store.add_url(slow_url)
+            background.join()
+            assert store.stats['sources_skipped'] == skipped + 1 and store.has_url(slow_url)
+            assert active['paths'].count('/page/300?claimed=1') == 1
+            print("✅ 研究员读取正在预取的网址时等待预取结果，只抓取一次")
+
+            # 预取下载失败时，等待的研究员自行抓取
+            failing = ResearchPrefetcher(store, timeout_fetcher)
+            failed_url = f"{base}/page/400?claimed=2"
+            background = threading.Thread(target=failing.prefetch, args=([failed_url],))
+            background.start()
+            time.sleep(0.05)
+            assert store.add_url(failed_url) > 0
+            background.join()
+            assert active['paths'].count('/page/400?claimed=2') == 2
+            print("✅ 预取失败时研究员自行抓取")
+
+        for item in (fetcher, limited, timeout_fetcher):
+            item.close()
+        server.shutdown()
+
+        print("\n🎉 网页预取测试通过！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 测试失败: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # 设置日志
+    logging.basicConfig(level=logging.INFO)
+
+    # 运行测试
+    test_page_fetcher()
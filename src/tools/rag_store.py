@@ -0,0 +1,498 @@
+"""
+网页内容向量库 - 所有研究员共用一个按内容寻址的 Chroma 存储
+
+WebsiteSearchTool 默认在当前工作目录下创建向量库，每个研究员实例各自重新抓取和向量化相同的网页，
+不同目录下启动的进程还会各自留下一份数据库。这里把向量库固定在 RAG_STORE_DIR，
+网页切块后以内容的哈希作为ID，已经向量化过的内容不会再次向量化；
+已收录的网址记录在来源索引中，过期前再次遇到时直接跳过，不抓取也不切块。
+相同内容的块只存一份，块出现在哪些网址上另外记录在块来源表中，检索结果按该表列出全部来源网址。
+多个研究员（包括其他进程中的）可以同时检索，写入由读写锁保证独占。
+"""
+import hashlib
+import sqlite3
+import threading
+import logging
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+from crewai_tools import WebsiteSearchTool
+from crewai_tools.adapters.embedchain_adapter import EmbedchainAdapter
+from crewai_tools.tools.website_search.website_search_tool import FixedWebsiteSearchToolSchema
+from embedchain import App
+from embedchain.chunkers.web_page import WebPageChunker
+from embedchain.config import AppConfig, ChromaDbConfig
+from embedchain.loaders.web_page import WebPageLoader
+from embedchain.models.data_type import DataType
+from embedchain.vectordb.chroma import ChromaDB
+from pydantic import PrivateAttr
+
+from src.config import settings
+from src.crew.singleflight import SingleFlight, Flight
+from src.utils.cache_store import SQLiteCache
+from src.utils.locks import ReadWriteLock
+
+logger = logging.getLogger(__name__)
+
+# 固定的应用ID：块ID带有该前缀，不同进程之间保持一致
+RAG_APP_ID = 'content-crew'
+
+
+def normalize_url(url: str) -> str:
+    """规范化网址：协议和域名小写，去掉片段（#...），去掉路径末尾的斜杠"""
+    parts = urlsplit(url.strip())
+    path = parts.path.rstrip('/') or '/'
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ''))
+
+
+def content_chunk_id(chunk: str, app_id: Optional[str] = RAG_APP_ID) -> str:
+    """块ID：只由块内容计算，带 app_id 前缀"""
+    chunk_id = hashlib.sha256(chunk.encode('utf-8')).hexdigest()
+    return f"{app_id}--{chunk_id}" if app_id else chunk_id
+
+
+class PrefetchedPageLoader(WebPageLoader):
+    """使用已下载的网页内容，不再发起请求；文本提取与 embedchain 的网页加载器相同"""
+
+    def __init__(self, content: bytes):
+        super().__init__()
+        self.content = content
+
+    def load_data(self, url, **kwargs) -> Dict[str, Any]:
+        content = self._get_clean_content(self.content, url)
+        return {
+            'doc_id': hashlib.sha256((content + url).encode()).hexdigest(),
+            'data': [{'content': content, 'meta_data': {'url': url}}],
+        }
+
+
+class ContentAddressedChunker(WebPageChunker):
+    """
+    按内容寻址的网页切块器
+
+    块ID只由块内容计算（embedchain 默认使用内容加网址），不同网址上的相同内容共用一个块；
+    块元数据中的 url 只是第一次收录时的网址，全部来源见 ChunkSourceIndex。
+    """
+
+    def __init__(self, app_id: Optional[str] = RAG_APP_ID):
+        """
+        Args:
+            app_id: 块ID的前缀，同时写入块的元数据供检索时过滤
+        """
+        super().__init__()
+        self.set_data_type(DataType.WEB_PAGE)
+        self.app_id = app_id
+
+    def create_chunks(self, loader, src, app_id=None, config=None, **kwargs) -> Dict[str, Any]:
+        min_chunk_size = config.min_chunk_size if config is not None else 1
+        data_result = loader.load_data(src, **kwargs)
+        doc_id = f"{self.app_id}--{data_result['doc_id']}" if self.app_id else data_result['doc_id']
+        source_hash = hashlib.md5(str(src).encode('utf-8')).hexdigest()
+
+        chunks: Dict[str, Any] = {}
+        for data in data_result['data']:
+            metadata = {**data['meta_data'], 'data_type': self.data_type.value, 'doc_id': doc_id, 'hash': source_hash}
+            if self.app_id:
+                metadata['app_id'] = self.app_id
+            for chunk in self.get_chunks(data['content']):
+                if len(chunk) < min_chunk_size:
+                    continue
+                chunks.setdefault(content_chunk_id(chunk, self.app_id), (chunk, metadata))
+        return {
+            'documents': [chunk for chunk, _ in chunks.values()],
+            'ids': list(chunks),
+            'metadatas': [metadata for _, metadata in chunks.values()],
+            'doc_id': doc_id,
+        }
+
+
+class ChunkSourceIndex:
+    """
+    块来源表 - 记录每个网址当前包含的块ID
+
+    去重后的块在向量库中只有一份，检索时通过块ID查出包含该内容的所有网址，引用不会只指向第一个网址。
+    同一进程内多线程共享一个连接（加锁），多进程之间依赖 SQLite 的 WAL 模式。
+    """
+
+    def __init__(self, path: Path):
+        """
+        Args:
+            path: SQLite 数据库文件路径
+        """
+        self.path = Path(path)
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS chunk_sources (
+                    source TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    chunk_id TEXT NOT NULL,
+                    PRIMARY KEY (source, chunk_id)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_chunk_sources_chunk ON chunk_sources (chunk_id)")
+            self._conn.commit()
+
+    def set_chunks(self, source: str, url: str, chunk_ids: List[str]):
+        """
+        替换网址包含的块（重新收录时网页内容可能已变化）
+
+        Args:
+            source: 规范化后的网址
+            url: 引用时显示的网址
+            chunk_ids: 网页的全部块ID
+        """
+        with self._lock:
+            self._conn.execute("DELETE FROM chunk_sources WHERE source = ?", (source,))
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO chunk_sources (source, url, chunk_id) VALUES (?, ?, ?)",
+                [(source, url, chunk_id) for chunk_id in chunk_ids]
+            )
+            self._conn.commit()
+
+    def urls(self, chunk_ids: List[str]) -> Dict[str, List[str]]:
+        """返回每个块ID对应的网址（按收录顺序），没有记录的块不在结果中"""
+        if not chunk_ids:
+            return {}
+        placeholders = ', '.join('?' * len(chunk_ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT chunk_id, url FROM chunk_sources WHERE chunk_id IN ({placeholders}) ORDER BY rowid",
+                list(chunk_ids)
+            ).fetchall()
+        result: Dict[str, List[str]] = {}
+        for chunk_id, url in rows:
+            result.setdefault(chunk_id, []).append(url)
+        return result
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+class RagStore:
+    """
+    共享的网页内容向量库
+
+    检索持有读锁，可以并发执行；写入持有写锁。收录网页时抓取、切块和计算向量都在锁外完成，
+    写锁只覆盖最后的写入，检索不会因为其他研究员收录网页而长时间等待。
+    锁文件 RAG_STORE_DIR/store.lock 让多个进程（如服务的工作进程）遵守同样的多读单写规则。
+
+    计数记录在 stats 中：sources_added（新收录的网址）、sources_skipped（已收录而跳过的网址）、
+    chunks_embedded（新向量化的块）、chunks_reused（内容已存在而复用的块）、queries（检索次数）；
+    锁的等待情况见 snapshot()['lock']。
+    """
+
+    def __init__(self,
+                 root: Optional[Path] = None,
+                 source_ttl: Optional[float] = None,
+                 embedding_model: Optional[Any] = None):
+        """
+        Args:
+            root: 存储目录，默认读取 RAG_STORE_DIR
+            source_ttl: 已收录网址的有效期（秒），过期后重新抓取（未变化的内容仍然复用），默认读取 RAG_SOURCE_TTL
+            embedding_model: embedchain 向量模型，默认使用 OpenAI embedding
+        """
+        self.root = Path(root or settings.RAG_STORE_DIR)
+        self.root.mkdir(parents=True, exist_ok=True)
+        ttl = settings.RAG_SOURCE_TTL if source_ttl is None else source_ttl
+        self.sources = SQLiteCache(self.root / 'sources.sqlite3', namespace='rag_sources', default_ttl=ttl or None)
+        self.chunk_sources = ChunkSourceIndex(self.root / 'chunk_sources.sqlite3')
+        self.lock = ReadWriteLock(self.root / 'store.lock')
+        # 打开时可能创建集合，同样需要独占
+        with self.lock.write():
+            self.app = App(
+                config=AppConfig(id=RAG_APP_ID, collect_metrics=False),
+                db=ChromaDB(config=ChromaDbConfig(collection_name='website_content', dir=str(self.root / 'chroma'))),
+                embedding_model=embedding_model
+            )
+        self._flights = SingleFlight()
+        self._stats_lock = threading.Lock()
+        self.stats = {'sources_added': 0, 'sources_skipped': 0, 'chunks_embedded': 0, 'chunks_reused': 0,
+                      'queries': 0}
+
+    def _count(self, field: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[field] += amount
+
+    def has_url(self, url: str) -> bool:
+        """网址是否已收录且未过期"""
+        return self.sources.get(normalize_url(url)) is not None
+
+    def add_url(self, url: str, content: Optional[bytes] = None) -> int:
+        """
+        收录网页，已收录且未过期的网址直接跳过；并发收录同一网址时只处理一次
+
+        Args:
+            url: 网址
+            content: 已下载的网页内容（如预取阶段抓取的），None 时由 embedchain 的网页加载器抓取
+
+        Returns:
+            int: 新向量化的块数量
+        """
+        key = normalize_url(url)
+        while True:
+            if self.sources.get(key) is not None:
+                self._count('sources_skipped')
+                return 0
+            added, _, role = self._flights.do(key, lambda: self._embed(url, key, content))
+            # 等待的是预取阶段登记的下载，下载失败时由本调用方自行抓取
+            if added is not None:
+                break
+        if role != 'leader':
+            self._count('sources_skipped')
+        return added
+
+    def claim_url(self, url: str) -> Optional[Flight]:
+        """
+        在下载网页之前登记收录（如预取阶段），登记期间其他调用方的 add_url 等待这次收录，不重复抓取
+
+        Returns:
+            Optional[Flight]: 登记成功时返回，之后必须调用 add_claimed 或 release_claim；
+                网址已收录或正在收录时返回 None
+        """
+        key = normalize_url(url)
+        if self.sources.get(key) is not None:
+            return None
+        flight, role = self._flights.acquire(key)
+        return flight if role == 'leader' else None
+
+    def add_claimed(self, flight: Flight, url: str, content: bytes) -> int:
+        """用下载好的内容完成登记的收录，返回新向量化的块数量"""
+        try:
+            added = self._embed(url, flight.key, content)
+        except BaseException as e:
+            self._flights.fail(flight, e)
+            raise
+        self._flights.complete(flight, added)
+        return added
+
+    def release_claim(self, flight: Flight):
+        """放弃登记的收录（下载失败），等待的调用方改为自行抓取"""
+        self._flights.complete(flight, None)
+
+    def _embed(self, url: str, key: str, content: Optional[bytes] = None) -> int:
+        loader = WebPageLoader() if content is None else PrefetchedPageLoader(content)
+        chunks = ContentAddressedChunker().create_chunks(loader, url)
+        ids = chunks['ids']
+
+        with self.lock.read():
+            existing = set(self.app.db.get(ids=ids)['ids']) if ids else set()
+        fresh = [index for index, chunk_id in enumerate(ids) if chunk_id not in existing]
+
+        if fresh:
+            documents = [chunks['documents'][index] for index in fresh]
+            embeddings = self.app.embedding_model.embedding_fn(documents)
+            with self.lock.write():
+                # upsert：其他进程同时写入了相同内容时不会重复
+                self.app.db.collection.upsert(
+                    ids=[ids[index] for index in fresh],
+                    documents=documents,
+                    metadatas=[chunks['metadatas'][index] for index in fresh],
+                    embeddings=embeddings
+                )
+
+        self.chunk_sources.set_chunks(key, url, ids)
+        self.sources.set(key, {'url': url, 'chunks': len(fresh), 'reused': len(existing)})
+        self._count('sources_added')
+        self._count('chunks_embedded', len(fresh))
+        self._count('chunks_reused', len(existing))
+        logger.info(f"📚 收录网页 {url}: 新增 {len(fresh)} 块，复用 {len(existing)} 块")
+        return len(fresh)
+
+    def query(self, question: str) -> str:
+        """在已收录的全部内容中检索与问题相关的片段，每个片段后列出包含该内容的全部网址"""
+        self._count('queries')
+        with self.lock.read():
+            results = self.app.search(question, num_documents=self.app.llm.config.number_documents,
+                                      where={'app_id': RAG_APP_ID})
+
+        sources = self.chunk_sources.urls([content_chunk_id(result['context']) for result in results])
+        passages = []
+        for result in results:
+            # 块来源表之前收录的块只有元数据中的网址
+            urls = sources.get(content_chunk_id(result['context'])) or [result['metadata'].get('url')]
+            passages.append(f"{result['context']}\nSources: {', '.join(url for url in urls if url)}")
+        return "\n\n".join(passages)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """计数和锁的等待情况"""
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {**stats, 'lock': self.lock.snapshot()}
+
+
+_shared_store: Optional[RagStore] = None
+_shared_store_lock = threading.Lock()
+
+
+def get_rag_store() -> RagStore:
+    """进程内共享的网页内容向量库，首次使用时创建"""
+    global _shared_store
+    with _shared_store_lock:
+        if _shared_store is None:
+            _shared_store = RagStore()
+        return _shared_store
+
+
+def rag_store_stats() -> Optional[Dict[str, Any]]:
+    """进程内共享向量库的计数和锁等待情况，尚未使用时返回 None"""
+    return _shared_store.snapshot() if _shared_store is not None else None
+
+
+class SharedWebsiteSearchTool(WebsiteSearchTool):
+    """使用共享向量库的 WebsiteSearchTool，名称、描述和参数不变"""
+
+    _store: RagStore = PrivateAttr()
+
+    def __init__(self, store: Optional[RagStore] = None, website: Optional[str] = None, **kwargs: Any):
+        """
+        Args:
+            store: 向量库，默认使用进程内共享的向量库
+            website: 固定检索的网站，与 WebsiteSearchTool 相同；
+                父类在初始化时就会收录网站，此时 _store 还未设置，因此在设置之后再收录
+        """
+        store = store or get_rag_store()
+        super().__init__(adapter=EmbedchainAdapter(embedchain_app=store.app), **kwargs)
+        self._store = store
+        if website is not None:
+            self.add(website)
+            self.description = f"A tool that can be used to semantic search a query from {website} website content."
+            self.args_schema = FixedWebsiteSearchToolSchema
+            self._generate_description()
+
+    @property
+    def store(self) -> RagStore:
+        return self._store
+
+    def add(self, website: str) -> None:
+        self._store.add_url(website)
+
+    def _run(self, search_query: str, website: Optional[str] = None) -> str:
+        if website is not None:
+            self.add(website)
+        return f"Relevant Content:\n{self._store.query(search_query)}"
+
+
+# 用于单独测试的函数
+def test_rag_store():
+    """测试共享向量库（无需API Key，使用本地网页和哈希向量）"""
+    import tempfile
+    from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+    from functools import partial
+    from embedchain.embedder.base import BaseEmbedder, EmbeddingFunc
+
+    print("📚 测试共享向量库...")
+
+    try:
+        class HashEmbedder(BaseEmbedder):
+            """按词哈希计算的确定性向量，记录计算过向量的文本数量"""
+            embedded = 0
+
+            def __init__(self):
+                super().__init__()
+                self.set_embedding_fn(EmbeddingFunc(self.embed))
+                self.set_vector_dimension(64)
+
+            def embed(self, texts):
+                HashEmbedder.embedded += len(texts)
+                vectors = []
+                for text in texts:
+                    vector = [0.0] * 64
+                    for word in text.split():
+                        vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % 64] += 1.0
+                    vectors.append(vector)
+                return vectors
+
+        # 共同内容恰好是一个块的长度（2000字），两个页面的第一个块相同
+        shared = "<p>" + "人工智能在医疗影像中的应用正越来越广泛。" * 100 + "</p>"
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            site = Path(tmp_dir) / 'site'
+            site.mkdir()
+            (site / 'a.html').write_text(f"<html><body>{shared}<p>{'页面A独有的内容。' * 60}</p></body></html>", encoding='utf-8')
+            (site / 'b.html').write_text(f"<html><body>{shared}<p>{'页面B独有的内容。' * 60}</p></body></html>", encoding='utf-8')
+
+            handler = partial(SimpleHTTPRequestHandler, directory=str(site))
+            handler.log_message = lambda *args: None
+            server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            base = f"http://127.0.0.1:{server.server_port}"
+
+            store = RagStore(root=Path(tmp_dir) / 'rag', embedding_model=HashEmbedder())
+            first = store.add_url(f"{base}/a.html")
+            embedded = HashEmbedder.embedded
+            assert first > 0
+            print(f"✅ 收录网页A: {first} 块")
+
+            assert store.add_url(f"{base}/a.html#intro") == 0
+            assert HashEmbedder.embedded == embedded and store.stats['sources_skipped'] == 1
+            print("✅ 重复网址直接跳过，不重新向量化")
+
+            store.add_url(f"{base}/b.html")
+            assert store.stats['chunks_reused'] > 0
+            print(f"✅ 相同内容跨网址复用: {store.stats}")
+
+            # 共用的块引用两个网址，各自独有的块只引用自己的网址
+            passages = store.query('医疗影像').split("\n\n")
+            shared_passage = next(p for p in passages if '医疗影像' in p)
+            assert f"{base}/a.html" in shared_passage and f"{base}/b.html" in shared_passage
+            only_b = next(p for p in passages if '页面B独有' in p)
+            assert f"{base}/b.html" in only_b and f"{base}/a.html" not in only_b
+            print("✅ 去重后的块列出全部来源网址")
+
+            # 新的实例（相当于新进程）读取同一存储目录
+            reopened = RagStore(root=Path(tmp_dir) / 'rag', embedding_model=HashEmbedder())
+            embedded = HashEmbedder.embedded
+            assert reopened.add_url(f"{base}/b.html") == 0 and HashEmbedder.embedded == embedded
+            tool = SharedWebsiteSearchTool(store=reopened)
+            assert tool.name == 'Search in a specific website' and tool.store is reopened
+            assert '医疗影像' in tool.run(search_query='医疗影像', website=f"{base}/a.html")
+            print("✅ 存储目录跨实例共享，检索正常")
+
+            fixed = SharedWebsiteSearchTool(store=reopened, website=f"{base}/a.html")
+            assert fixed.args_schema is FixedWebsiteSearchToolSchema and f"{base}/a.html" in fixed.description
+            assert '医疗影像' in fixed.run(search_query='医疗影像')
+            print("✅ 指定固定网站创建工具")
+
+            # 多个研究员同时检索，另一个同时收录新网页
+            (site / 'c.html').write_text(f"<html><body><p>{'页面C的内容。' * 400}</p></body></html>", encoding='utf-8')
+            errors = []
+
+            def search():
+                try:
+                    for _ in range(5):
+                        tool.run(search_query='医疗影像')
+                except Exception as e:
+                    errors.append(e)
+
+            threads = [threading.Thread(target=search) for _ in range(4)]
+            threads.append(threading.Thread(target=reopened.add_url, args=(f"{base}/c.html",)))
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            snapshot = reopened.snapshot()
+            assert not errors and snapshot['queries'] >= 21 and snapshot['lock']['writes'] >= 1
+            print(f"✅ 并发检索和收录: {snapshot['lock']}")
+
+            server.shutdown()
+
+        print("\n🎉 共享向量库测试通过！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 测试失败: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # 设置日志
+    logging.basicConfig(level=logging.INFO)
+
+    # 运行测试
+    test_rag_store()
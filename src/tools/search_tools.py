@@ -0,0 +1,338 @@
+"""
+搜索结果缓存 - 包装 SerperDevTool 等搜索工具，相同或相近的查询复用本地保存的结果
+
+同一主题的工作流反复发出相同的搜索，每次都要付出网络延迟和 API 配额。
+查询先做规范化（大小写、全角半角、空白和句末标点），结果保存在本地 SQLite 中并设置过期时间；
+开启过期后继续使用（stale-while-revalidate）时，过期不久的结果立即返回，同时在后台刷新。
+"""
+import re
+import threading
+import time
+import logging
+import unicodedata
+from typing import Dict, Any, Optional, Callable
+
+from crewai.tools import BaseTool
+from pydantic import PrivateAttr
+
+from src.config import settings
+from src.crew.singleflight import SingleFlight
+from src.utils.cache_store import SQLiteCache, make_cache_key
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"\s+")
+# 句末的问号、句号和感叹号（NFKC 之后全角问号和感叹号已转为半角）
+_TRAILING_PUNCTUATION = re.compile(r"[?？。.!！]+$")
+
+# 查询规范化规则的版本，规则变化后旧的缓存键不再命中
+NORMALIZATION_VERSION = 2
+
+_shared_cache: Optional[SQLiteCache] = None
+_shared_cache_lock = threading.Lock()
+
+
+def get_search_cache() -> SQLiteCache:
+    """进程内共享的搜索结果缓存，首次使用时创建"""
+    global _shared_cache
+    with _shared_cache_lock:
+        if _shared_cache is None:
+            _shared_cache = SQLiteCache(
+                settings.CACHE_DIR / 'search_cache.sqlite3',
+                namespace='search_results',
+                max_entries=settings.SEARCH_CACHE_MAX_ENTRIES or None,
+                max_bytes=settings.SEARCH_CACHE_MAX_BYTES or None
+            )
+        return _shared_cache
+
+
+def normalize_query(query: str) -> str:
+    """
+    规范化搜索查询：统一全角半角、忽略大小写，合并连续空白，去掉句末的问号、句号和感叹号
+
+    例如 "AI 发展趋势？" 和 "ai  发展趋势" 规范化后相同；词中的标点保留，
+    "C# tutorial" 和 "C tutorial"、".NET 8" 和 "NET 8" 是不同的查询
+    """
+    text = unicodedata.normalize('NFKC', query or '').casefold()
+    text = _WHITESPACE.sub(' ', text).strip()
+    return _TRAILING_PUNCTUATION.sub('', text).rstrip()
+
+
+class ObservedSearchTool(BaseTool):
+    """
+    转发到被包装的搜索工具，每次返回结果后调用 on_results（用于研究预取等后续处理）
+
+    名称、描述和参数与被包装的工具相同，智能体无需感知包装。
+    """
+
+    tool: BaseTool
+    on_results: Optional[Callable[[Any], None]] = None
+
+    def __init__(self, tool: BaseTool, **kwargs: Any):
+        """
+        Args:
+            tool: 被包装的搜索工具
+        """
+        kwargs.setdefault('name', tool.name)
+        kwargs.setdefault('description', tool.description)
+        kwargs.setdefault('args_schema', tool.args_schema)
+        super().__init__(tool=tool, **kwargs)
+
+    def _run(self, **kwargs: Any) -> Any:
+        result = self._search(**kwargs)
+        if self.on_results is not None:
+            try:
+                self.on_results(result)
+            except Exception as e:
+                logger.warning(f"⚠️  搜索结果回调失败: {str(e)}")
+        return result
+
+    def _search(self, **kwargs: Any) -> Any:
+        return self.tool._run(**kwargs)
+
+
+class CachedSearchTool(ObservedSearchTool):
+    """
+    带结果缓存的搜索工具
+
+    缓存键由工具类型、搜索类型和规范化后的查询计算；相同查询的并发未命中只调用一次搜索。
+    计数记录在 stats 中：hits、stale_hits（返回过期结果）、misses、refreshes（后台刷新）、errors。
+    on_results 在每次返回结果（包括命中缓存）时调用。
+    """
+
+    ttl: float = 24 * 3600
+    stale_s: float = 0
+
+    _cache: Optional[SQLiteCache] = PrivateAttr(default=None)
+    _flights: SingleFlight = PrivateAttr(default_factory=SingleFlight)
+    _stats: Dict[str, int] = PrivateAttr(default_factory=dict)
+    _stats_lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self,
+                 tool: BaseTool,
+                 ttl: Optional[float] = None,
+                 stale_s: Optional[float] = None,
+                 cache: Optional[SQLiteCache] = None,
+                 **kwargs: Any):
+        """
+        Args:
+            tool: 被包装的搜索工具
+            ttl: 结果保持新鲜的时间（秒），默认读取 SEARCH_CACHE_TTL
+            stale_s: 过期后仍可返回（并在后台刷新）的时间（秒），0 表示不使用过期结果，默认读取 SEARCH_CACHE_STALE_S
+            cache: 缓存存储，默认使用进程内共享的搜索结果缓存
+        """
+        super().__init__(
+            tool,
+            ttl=settings.SEARCH_CACHE_TTL if ttl is None else ttl,
+            stale_s=settings.SEARCH_CACHE_STALE_S if stale_s is None else stale_s,
+            **kwargs
+        )
+        self._cache = cache
+        self._stats = {'hits': 0, 'stale_hits': 0, 'misses': 0, 'refreshes': 0, 'errors': 0}
+
+    @property
+    def cache(self) -> SQLiteCache:
+        if self._cache is None:
+            self._cache = get_search_cache()
+        return self._cache
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _count(self, field: str):
+        with self._stats_lock:
+            self._stats[field] += 1
+
+    def cache_key(self, search_query: str, search_type: Optional[str] = None) -> str:
+        """计算查询的缓存键"""
+        return make_cache_key('search', NORMALIZATION_VERSION, type(self.tool).__name__, search_type or '', normalize_query(search_query))
+
+    def _search(self, **kwargs: Any) -> Any:
+        search_query = kwargs.get('search_query') or kwargs.get('query') or ''
+        key = self.cache_key(search_query, kwargs.get('search_type'))
+
+        try:
+            entry = self.cache.get_entry(key, allow_expired=True)
+        except Exception as e:
+            logger.warning(f"⚠️  搜索缓存读取失败: {str(e)}")
+            entry = None
+
+        if entry is not None:
+            age = time.time() - entry['created_at']
+            if age < self.ttl:
+                self._count('hits')
+                return entry['value']
+            if age < self.ttl + self.stale_s:
+                self._count('stale_hits')
+                self._refresh_in_background(key, kwargs)
+                return entry['value']
+
+        self._count('misses')
+        try:
+            result, _, _ = self._flights.do(key, lambda: self._search_and_store(key, kwargs))
+        except Exception as e:
+            self._count('errors')
+            if entry is None:
+                raise
+            # 搜索失败时宁可返回过期的结果
+            logger.warning(f"⚠️  搜索失败，返回过期的缓存结果: {str(e)}")
+            return entry['value']
+        return result
+
+    def _search_and_store(self, key: str, kwargs: Dict[str, Any]) -> Any:
+        """调用被包装的工具并写入缓存，过期后继续保留 stale_s 秒供过期读取"""
+        result = self.tool._run(**kwargs)
+        if result:
+            try:
+                self.cache.set(key, result, ttl=self.ttl + self.stale_s)
+            except Exception as e:
+                logger.warning(f"⚠️  搜索缓存写入失败: {str(e)}")
+        return result
+
+    def _refresh_in_background(self, key: str, kwargs: Dict[str, Any]):
+        """后台刷新过期结果，同一查询同时只刷新一次"""
+        flight, role = self._flights.acquire(key)
+        if role != 'leader':
+            return
+        self._count('refreshes')
+
+        def refresh():
+            try:
+                result = self._search_and_store(key, kwargs)
+            except Exception as e:
+                self._flights.fail(flight, e)
+                self._count('errors')
+                logger.warning(f"⚠️  搜索结果后台刷新失败: {str(e)}")
+                return
+            self._flights.complete(flight, result)
+
+        threading.Thread(target=refresh, name="search-refresh", daemon=True).start()
+
+
+def cached_search_tool(tool: BaseTool, on_results: Optional[Callable[[Any], None]] = None) -> BaseTool:
+    """
+    按 SEARCH_CACHE_ENABLED 为搜索工具加上结果缓存，on_results 见 ObservedSearchTool
+
+    未启用缓存时只在需要 on_results 时包装，回调照常生效
+    """
+    if settings.SEARCH_CACHE_ENABLED:
+        return CachedSearchTool(tool, on_results=on_results)
+    if on_results is not None:
+        return ObservedSearchTool(tool, on_results=on_results)
+    return tool
+
+
+# 用于单独测试的函数
+def test_cached_search_tool():
+    """测试搜索结果缓存（无需API Key）"""
+    import tempfile
+    from pathlib import Path
+    from src.llm.fake import FakeSearchTool
+
+    print("🔎 测试搜索结果缓存...")
+
+    try:
+        class CountingSearchTool(FakeSearchTool):
+            calls: int = 0
+            fail: bool = False
+
+            def _run(self, search_query: str) -> str:
+                self.calls += 1
+                if self.fail:
+                    raise ConnectionError("搜索服务不可用")
+                time.sleep(0.05)
+                return super()._run(search_query)
+
+        assert normalize_query("  AI 发展趋势？") == normalize_query("ai  发展趋势")
+        assert normalize_query("ＧＰＴ-4 应用。") == "gpt-4 应用"
+        assert normalize_query("C# tutorial") != normalize_query("C tutorial")
+        assert normalize_query(".NET 8") != normalize_query("NET 8")
+        assert normalize_query("C++ 入门!") == "c++ 入门"
+        print("✅ 查询规范化")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = SQLiteCache(Path(tmp_dir) / 'search.sqlite3', namespace='test')
+            inner = CountingSearchTool()
+            tool = CachedSearchTool(inner, ttl=0.3, stale_s=0, cache=cache)
+            assert tool.name == inner.name
+
+            first = tool.run(search_query="AI 发展趋势？")
+            started = time.perf_counter()
+            second = tool.run(search_query="ai  发展趋势")
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            assert first == second and inner.calls == 1
+            print(f"✅ 相近查询命中缓存: {elapsed_ms:.1f}ms, {tool.stats}")
+
+            # 词中的标点不同的查询分别搜索
+            tool.run(search_query="C# tutorial")
+            tool.run(search_query="C tutorial")
+            assert inner.calls == 3
+            print("✅ C# 和 C 的查询不共用缓存")
+
+            # 并发的相同查询只搜索一次
+            threads = [threading.Thread(target=tool.run, kwargs={'search_query': '量子计算'}) for _ in range(5)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            assert inner.calls == 4
+            print("✅ 并发未命中合并为一次搜索")
+
+            # 过期后不使用过期结果：重新搜索
+            time.sleep(0.35)
+            tool.run(search_query="AI 发展趋势")
+            assert inner.calls == 5
+            print("✅ 过期后重新搜索")
+
+            # 过期后继续使用：立即返回旧结果，后台刷新
+            swr = CachedSearchTool(inner, ttl=0.1, stale_s=60, cache=cache)
+            swr.run(search_query="区块链")
+            time.sleep(0.15)
+            calls = inner.calls
+            started = time.perf_counter()
+            swr.run(search_query="区块链")
+            assert time.perf_counter() - started < 0.04
+            time.sleep(0.15)
+            assert inner.calls == calls + 1 and swr.stats['stale_hits'] == 1
+            print(f"✅ 过期结果立即返回并在后台刷新: {swr.stats}")
+
+            # 搜索失败时返回过期的结果
+            time.sleep(0.15)
+            inner.fail = True
+            assert swr.run(search_query="区块链")
+            time.sleep(0.05)
+            assert swr.stats['errors'] >= 1
+            print("✅ 刷新失败时保留旧结果")
+
+            cache.close()
+
+        # 未启用缓存时 on_results 仍然生效
+        seen = []
+        enabled = settings.SEARCH_CACHE_ENABLED
+        settings.SEARCH_CACHE_ENABLED = False
+        try:
+            observed = cached_search_tool(inner, on_results=seen.append)
+        finally:
+            settings.SEARCH_CACHE_ENABLED = enabled
+        inner.fail = False
+        assert isinstance(observed, ObservedSearchTool) and not isinstance(observed, CachedSearchTool)
+        observed.run(search_query="区块链")
+        assert len(seen) == 1
+        print("✅ 未启用缓存时搜索结果回调照常调用")
+
+        print("\n🎉 搜索结果缓存测试通过！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 测试失败: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # 设置日志
+    logging.basicConfig(level=logging.INFO)
+
+    # 运行测试
+    test_cached_search_tool()
@@ -712,14 +712,33 @@ def start_content_creation(topic, content_type, target_audience, word_count, add
         with progress_placeholder.container():
             st.info("🔍 研究员智能体：正在收集信息...")
 
-        # 执行内容创作
-        result = st.session_state.content_crew.create_content(
+        # 流式执行内容创作，写作和编辑阶段边生成边展示
+        stage_labels = {
+            'research_task': "🔍 研究员智能体：正在收集信息...",
+            'analysis_task': "📊 分析师智能体：正在分析研究结果...",
+            'writing_task': "✍️ 写作智能体：正在撰写内容...",
+            'editing_task': "📝 编辑智能体：正在润色内容..."
+        }
+        result = None
+        streamed_text = ""
+        for event in st.session_state.content_crew.create_content_stream(
             topic=topic,
             content_type=content_type,
             target_audience=target_audience,
             word_count=word_count,
             additional_requirements=additional_requirements
-        )
+        ):
+            if event['type'] == 'stage_started':
+                streamed_text = ""
+                with progress_placeholder.container():
+                    st.info(stage_labels.get(event['stage'], f"⚙️ 正在执行 {event['stage']}..."))
+            elif event['type'] == 'token' and event['stage'] in ('writing_task', 'editing_task'):
+                streamed_text += event['chunk']
+                status_placeholder.markdown(streamed_text)
+            elif event['type'] == 'result':
+                result = event['result']
+
+        status_placeholder.empty()
 
         # 更新进度
         with progress_placeholder.container():
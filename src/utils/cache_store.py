@@ -0,0 +1,258 @@
+"""
+本地缓存存储 - 基于 SQLite 的键值缓存，支持 TTL 过期和 LRU 淘汰
+"""
+import json
+import sqlite3
+import threading
+import time
+import hashlib
+import logging
+from pathlib import Path
+from typing import Dict, Any, Optional
+
+
+def make_cache_key(*parts: Any) -> str:
+    """将任意可 JSON 序列化的内容计算为稳定的缓存键"""
+    payload = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class SQLiteCache:
+    """
+    SQLite 键值缓存
+
+    值以 JSON 形式存储并记录其字节数；读取时刷新访问时间，
+    条目数超过 max_entries 或值的总字节数超过 max_bytes 时按最近最少使用淘汰。
+    同一进程内多线程共享一个连接（加锁），多进程之间依赖 SQLite 的 WAL 模式。
+    """
+
+    def __init__(self,
+                 path: Path,
+                 namespace: str = "default",
+                 default_ttl: Optional[float] = None,
+                 max_entries: Optional[int] = None,
+                 max_bytes: Optional[int] = None):
+        """
+        Args:
+            path: SQLite 数据库文件路径
+            namespace: 缓存命名空间，不同用途的缓存可共用一个数据库文件
+            default_ttl: 默认过期时间（秒），None 表示永不过期
+            max_entries: 命名空间内的最大条目数，None 表示不限制
+            max_bytes: 命名空间内所有值的最大总字节数（UTF-8 编码的 JSON），None 表示不限制
+        """
+        self.logger = logging.getLogger(__name__)
+        self.path = Path(path)
+        self.namespace = namespace
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, timeout=30)
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS cache_entries (
+                    namespace TEXT NOT NULL,
+                    key TEXT NOT NULL,
+                    value TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL,
+                    expires_at REAL,
+                    size INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (namespace, key)
+                )
+            """)
+            # 旧版本创建的数据库没有 size 列，补上并按现有值计算
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(cache_entries)")]
+            if 'size' not in columns:
+                self._conn.execute("ALTER TABLE cache_entries ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+                self._conn.execute("UPDATE cache_entries SET size = length(CAST(value AS BLOB))")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS idx_cache_accessed ON cache_entries (namespace, accessed_at)"
+            )
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存值，不存在或已过期时返回 None"""
+        entry = self.get_entry(key)
+        return entry['value'] if entry else None
+
+    def get_entry(self, key: str, allow_expired: bool = False) -> Optional[Dict[str, Any]]:
+        """
+        读取缓存条目
+
+        Args:
+            key: 缓存键
+            allow_expired: 是否返回已过期但尚未清理的条目
+
+        Returns:
+            Dict: 包含 value、created_at、expires_at、expired 的条目，不存在时返回 None
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at, expires_at FROM cache_entries WHERE namespace = ? AND key = ?",
+                (self.namespace, key)
+            ).fetchone()
+            if row is None:
+                return None
+
+            value, created_at, expires_at = row
+            expired = expires_at is not None and expires_at <= now
+            if expired and not allow_expired:
+                self._conn.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+                )
+                self._conn.commit()
+                return None
+
+            self._conn.execute(
+                "UPDATE cache_entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                (now, self.namespace, key)
+            )
+            self._conn.commit()
+
+        return {
+            'value': json.loads(value),
+            'created_at': created_at,
+            'expires_at': expires_at,
+            'expired': expired
+        }
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """写入缓存值，ttl 为 None 时使用默认过期时间"""
+        now = time.time()
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = now + ttl if ttl else None
+        payload = json.dumps(value, ensure_ascii=False)
+
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache_entries "
+                "(namespace, key, value, created_at, accessed_at, expires_at, size) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (self.namespace, key, payload, now, now, expires_at, len(payload.encode('utf-8')))
+            )
+            self._evict(now)
+            self._conn.commit()
+
+    def delete(self, key: str):
+        """删除缓存条目"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key = ?", (self.namespace, key)
+            )
+            self._conn.commit()
+
+    def clear(self):
+        """清空当前命名空间"""
+        with self._lock:
+            self._conn.execute("DELETE FROM cache_entries WHERE namespace = ?", (self.namespace,))
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """清理过期条目，并按访问时间淘汰超出条目数或字节数上限的条目（调用方持有锁）"""
+        self._conn.execute(
+            "DELETE FROM cache_entries WHERE namespace = ? AND expires_at IS NOT NULL AND expires_at <= ?",
+            (self.namespace, now)
+        )
+
+        if self.max_entries:
+            count = self._conn.execute(
+                "SELECT COUNT(*) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+            ).fetchone()[0]
+            overflow = count - self.max_entries
+            if overflow > 0:
+                self._conn.execute(
+                    "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+                    "SELECT key FROM cache_entries WHERE namespace = ? ORDER BY accessed_at ASC LIMIT ?)",
+                    (self.namespace, self.namespace, overflow)
+                )
+
+        if self.max_bytes:
+            # 从最近访问的条目开始累计大小，累计超出上限的较旧条目全部淘汰
+            self._conn.execute(
+                "DELETE FROM cache_entries WHERE namespace = ? AND key IN ("
+                "SELECT key FROM (SELECT key, SUM(size) OVER (ORDER BY accessed_at DESC, key) AS kept "
+                "FROM cache_entries WHERE namespace = ?) WHERE kept > ?)",
+                (self.namespace, self.namespace, self.max_bytes)
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """返回缓存条目数量、总字节数等统计信息"""
+        with self._lock:
+            count, size = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM cache_entries WHERE namespace = ?", (self.namespace,)
+            ).fetchone()
+        return {
+            'namespace': self.namespace,
+            'entries': count,
+            'bytes': size,
+            'max_entries': self.max_entries,
+            'max_bytes': self.max_bytes,
+            'path': str(self.path)
+        }
+
+    def close(self):
+        """关闭数据库连接"""
+        with self._lock:
+            self._conn.close()
+
+
+# 用于单独测试的函数
+def test_sqlite_cache():
+    """测试SQLite缓存（无需API Key）"""
+    import tempfile
+
+    print("💾 测试SQLite缓存...")
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            cache = SQLiteCache(Path(tmp_dir) / 'cache.sqlite3', namespace='test', max_entries=2)
+
+            cache.set('a', {'raw': '内容A'})
+            cache.set('b', {'raw': '内容B'})
+            assert cache.get('a') == {'raw': '内容A'}
+
+            # b 最久未被访问，写入 c 后被淘汰
+            time.sleep(0.01)
+            cache.set('c', {'raw': '内容C'})
+            assert cache.get('b') is None
+            assert cache.get('a') is not None
+            print(f"✅ LRU淘汰正常: {cache.stats()['entries']} 个条目")
+
+            # 按字节数淘汰：总大小超出上限时淘汰最久未访问的条目
+            sized = SQLiteCache(Path(tmp_dir) / 'cache.sqlite3', namespace='sized', max_bytes=2500)
+            for key in ('x', 'y', 'z'):
+                sized.set(key, '内' * 300)
+                time.sleep(0.01)
+            assert sized.get('x') is None and sized.get('z') is not None
+            assert sized.stats()['bytes'] <= 2500
+            print(f"✅ 按字节数淘汰正常: {sized.stats()['bytes']} 字节")
+            sized.close()
+
+            cache.set('short', 'x', ttl=0.01)
+            time.sleep(0.02)
+            assert cache.get('short') is None
+            print("✅ TTL过期正常")
+
+            assert make_cache_key('x', {'b': 1, 'a': 2}) == make_cache_key('x', {'a': 2, 'b': 1})
+            print("✅ 缓存键稳定")
+
+            cache.close()
+
+        print("\n🎉 SQLite缓存测试通过！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 测试失败: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # 设置日志
+    logging.basicConfig(level=logging.INFO)
+
+    # 运行测试
+    test_sqlite_cache()
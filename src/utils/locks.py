@@ -0,0 +1,214 @@
+"""
+读写锁 - 进程内多读单写，可选的文件锁把同样的规则扩展到多个进程
+
+共享存储（如网页内容向量库）的检索可以并发执行，写入需要独占。等待时间计入 stats，
+用于判断锁是否成为并发瓶颈。
+"""
+import os
+import time
+import threading
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, Iterator, Optional
+
+try:
+    import fcntl
+except ImportError:  # Windows 没有 fcntl，只保留进程内的读写锁
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+class ReadWriteLock:
+    """
+    写优先的读写锁
+
+    任意数量的读者可以同时持有锁，写者独占；有写者等待时新的读者排队，避免写者饿死。
+    指定 path 时同时对该文件加 flock（读者共享锁、写者排他锁），多个进程之间同样多读单写。
+    每次加锁都单独打开锁文件，同一进程内的多个读者互不影响。
+
+    计数记录在 stats 中：reads、writes（加锁次数），read_waits、write_waits（需要等待的次数），
+    read_wait_s、write_wait_s（累计等待秒数）和 max_wait_s。
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        """
+        Args:
+            path: 跨进程锁文件路径，None 表示只在进程内加锁
+        """
+        self.path = Path(path) if path else None
+        if self.path is not None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            if fcntl is None:
+                logger.warning("⚠️  当前平台不支持 fcntl，读写锁只在进程内生效")
+        self._cond = threading.Condition()
+        self._readers = 0
+        self._writer = False
+        self._writers_waiting = 0
+        self.stats: Dict[str, float] = {
+            'reads': 0, 'writes': 0, 'read_waits': 0, 'write_waits': 0,
+            'read_wait_s': 0.0, 'write_wait_s': 0.0, 'max_wait_s': 0.0
+        }
+
+    @contextmanager
+    def read(self) -> Iterator[None]:
+        """以读者身份持有锁"""
+        started = time.perf_counter()
+        with self._cond:
+            waited = self._writer or self._writers_waiting > 0
+            while self._writer or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            with self._file_lock(shared=True) as file_waited:
+                self._record('read', started, waited or file_waited)
+                yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self) -> Iterator[None]:
+        """以写者身份独占锁"""
+        started = time.perf_counter()
+        with self._cond:
+            waited = self._writer or self._readers > 0
+            self._writers_waiting += 1
+            try:
+                while self._writer or self._readers:
+                    self._cond.wait()
+            finally:
+                self._writers_waiting -= 1
+            self._writer = True
+        try:
+            with self._file_lock(shared=False) as file_waited:
+                self._record('write', started, waited or file_waited)
+                yield
+        finally:
+            with self._cond:
+                self._writer = False
+                self._cond.notify_all()
+
+    @contextmanager
+    def _file_lock(self, shared: bool) -> Iterator[bool]:
+        """对锁文件加 flock，返回是否因其他进程持有锁而等待"""
+        if self.path is None or fcntl is None:
+            yield False
+            return
+
+        mode = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+        fd = os.open(str(self.path), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            waited = False
+            try:
+                fcntl.flock(fd, mode | fcntl.LOCK_NB)
+            except BlockingIOError:
+                waited = True
+                fcntl.flock(fd, mode)
+            try:
+                yield waited
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+    def _record(self, kind: str, started: float, waited: bool):
+        wait = time.perf_counter() - started
+        with self._cond:
+            self.stats[f'{kind}s'] += 1
+            if waited:
+                self.stats[f'{kind}_waits'] += 1
+                self.stats[f'{kind}_wait_s'] += wait
+                self.stats['max_wait_s'] = max(self.stats['max_wait_s'], wait)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """当前的计数和持有状态"""
+        with self._cond:
+            stats = dict(self.stats)
+            stats.update(readers=self._readers, writer=self._writer, writers_waiting=self._writers_waiting)
+        for field in ('read_wait_s', 'write_wait_s', 'max_wait_s'):
+            stats[field] = round(stats[field], 4)
+        return stats
+
+
+# 用于单独测试的函数
+def test_read_write_lock():
+    """测试读写锁（无需API Key）"""
+    import tempfile
+    import subprocess
+    import sys
+
+    print("🔒 测试读写锁...")
+
+    try:
+        lock = ReadWriteLock()
+        active = {'readers': 0, 'max_readers': 0, 'writers': 0}
+        guard = threading.Lock()
+
+        def reader():
+            with lock.read():
+                with guard:
+                    active['readers'] += 1
+                    active['max_readers'] = max(active['max_readers'], active['readers'])
+                    assert active['writers'] == 0
+                time.sleep(0.05)
+                with guard:
+                    active['readers'] -= 1
+
+        def writer():
+            with lock.write():
+                with guard:
+                    active['writers'] += 1
+                    assert active['writers'] == 1 and active['readers'] == 0
+                time.sleep(0.02)
+                with guard:
+                    active['writers'] -= 1
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=reader) for _ in range(8)]
+        threads += [threading.Thread(target=writer) for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        assert active['max_readers'] > 1 and elapsed < 0.4
+        print(f"✅ 多个读者并发、写者独占: {elapsed:.2f}s, {lock.snapshot()}")
+
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = Path(tmp_dir) / 'store.lock'
+            shared = ReadWriteLock(path)
+            # 另一个进程持有排他锁 0.3 秒，本进程的读者需要等待
+            holder = subprocess.Popen([sys.executable, '-c', (
+                "import fcntl, os, time, sys\n"
+                f"fd = os.open({str(path)!r}, os.O_RDWR | os.O_CREAT)\n"
+                "fcntl.flock(fd, fcntl.LOCK_EX)\n"
+                "print('locked', flush=True)\n"
+                "time.sleep(0.3)\n"
+            )], stdout=subprocess.PIPE, text=True)
+            assert holder.stdout.readline().strip() == 'locked'
+            with shared.read():
+                pass
+            holder.wait()
+            stats = shared.snapshot()
+            if fcntl is not None:
+                assert stats['read_waits'] == 1 and stats['read_wait_s'] > 0.1
+            print(f"✅ 跨进程排他锁: 读者等待 {stats['read_wait_s']:.2f}s")
+
+        print("\n🎉 读写锁测试通过！")
+        return True
+
+    except Exception as e:
+        print(f"❌ 测试失败: {str(e)}")
+        return False
+
+
+if __name__ == "__main__":
+    # 设置日志
+    logging.basicConfig(level=logging.INFO)
+
+    # 运行测试
+    test_read_write_lock()
@@ -5,6 +5,8 @@ import os
 from dotenv import load_dotenv
 from crewai import Agent, Task, Crew
 from crewai_tools import SerperDevTool
+from src.config import settings
+from src.llm.factory import create_llm
 
 # 加载环境变量
 load_dotenv()
@@ -14,6 +16,10 @@ def test_environment():
     """测试基础环境配置"""
     print("🔍 检查环境配置...")
 
+    if settings.FAKE_LLM:
+        print("🧪 使用离线模拟LLM（LLM_BACKEND=fake），跳过 API Key 检查")
+        return True
+
     # 检查API key
     api_key = os.getenv("OPENAI_API_KEY")
     if not api_key:
@@ -38,6 +44,7 @@ def test_simple_agent():
             role='测试助手',
             goal='验证系统是否正常工作',
             backstory='你是一个用来测试系统的助手',
+            llm=create_llm(),
             verbose=True,
             allow_delegation=False
         )
@@ -15,18 +15,25 @@ def main():
     current_dir = Path.cwd()
     print(f"📁 当前目录: {current_dir}")
 
+    # 离线模拟LLM不需要 .env 和 API Key
+    offline = os.getenv("LLM_BACKEND", "").strip().lower() == 'fake'
+
     # 检查 .env 文件
     env_file = current_dir / '.env'
     if env_file.exists():
         print(f"✅ 找到 .env 文件: {env_file}")
         load_dotenv(env_file)
+    elif offline:
+        print("🧪 使用离线模拟LLM（LLM_BACKEND=fake）")
     else:
         print(f"❌ 未找到 .env 文件: {env_file}")
         return
 
     # 检查 API Key
     api_key = os.getenv("OPENAI_API_KEY")
-    if api_key:
+    if offline:
+        pass
+    elif api_key:
         print(f"✅ OPENAI_API_KEY: {api_key[:20]}...")
     else:
         print("❌ 未找到 OPENAI_API_KEY")